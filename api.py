@@ -1,9 +1,33 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pyodbc
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from busqueda import BUSQUEDA_LIMIT, CAMPOS as CAMPOS_BUSQUEDA, ProductSearchIndex
+from cache import ResponseCache
+from cola_pedidos import IntakeQueue, PedidoRechazado
+from compresion import COMPRESS_MIN_SIZE, CompressedBodyCache, CompressionMiddleware
+from consultas import QueryLog
+from dashboard import run_batch, run_query
+from db import ConnectionPool, DBExecutor, DBLimiter
+from etag import fetch_etag, matches, not_modified
+from eventos import Broadcaster
+from fotos import FOTO_HASH, FOTOS_MAX_ENTRIES, foto_url, servir_foto, sin_vacia
+from idempotencia import REPLAYED_HEADER, IdempotencyStore
+from metricas import DBMetrics, HTTPMetrics, MetricsMiddleware, Registry
+from migraciones import comprobar as comprobar_schema
+from serializacion import fecha_dia, json_response, map_rows
+from series import MESES, consulta as consulta_serie, mes_anterior, ultimos_meses
+from stock import StockInsuficiente, StockReservations
+from stock_bajo import STOCK_BAJO_LIMIT, STOCK_BAJO_UMBRAL, LowStockIndex
+from recarga import PeriodicReload
+from tiempos import ServerTimingMiddleware
+from top_ventas import TOP_K, TopSellers
+from ventas_diarias import ajustar_ventas, registrar_ventas
+from paginacion import PAGE_SIZE, MAX_PAGE_SIZE, NEXT_HEADER, keyset_query, where_clause, end_of_day, set_next_cursor, stream_rows
+import anyio.to_thread
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import datetime
-from typing import List
+import json
+from typing import Dict, List, Literal
 
 app = FastAPI()
 
@@ -19,20 +43,142 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_HEADER, "ETag", REPLAYED_HEADER],
 )
 
+# gzip/brotli según Accept-Encoding; los cuerpos repetidos se sirven ya comprimidos
+compressed_cache = CompressedBodyCache()
+app.add_middleware(CompressionMiddleware, cache=compressed_cache, minimum_size=COMPRESS_MIN_SIZE)
+
+# Server-Timing: connect, query y serialize de cada petición
+app.add_middleware(ServerTimingMiddleware)
+
+# Métricas de Prometheus en /metrics. Se añade la última para que envuelva a los demás middlewares
+metricas = Registry()
+http_metricas = HTTPMetrics(metricas)
+app.add_middleware(MetricsMiddleware, metrics=http_metricas)
+app.add_exception_handler(HTTPException, http_metricas.http_exception_handler)
+
+
+# Duración, filas y ejecuciones por consulta; las que pasan del umbral van al log de consultas lentas
+SLOW_QUERY_THRESHOLD = 0.5  # segundos
+query_log = QueryLog(slow_threshold=SLOW_QUERY_THRESHOLD)
+
+
+# Pool de conexiones: se reutilizan en lugar de abrir una conexión ODBC por petición
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 10
+POOL_MAX_LIFETIME = 1800  # segundos antes de reciclar una conexión
+POOL_TIMEOUT = 30  # segundos de espera máxima por una conexión libre
+
+# Plazas de trabajo de BD: cada conexión de un handler síncrono y cada tarea de
+# db_executor ocupa una, así que entre los dos no pasan de POOL_MAX_SIZE
+db_limiter = DBLimiter(POOL_MAX_SIZE, timeout=POOL_TIMEOUT)
+
+pool = ConnectionPool(
+    f"DRIVER={{ODBC Driver 18 for SQL Server}};"
+    f"SERVER={SERVER};"
+    f"DATABASE={DATABASE};"
+    f"UID={USERNAME};"
+    f"PWD={PASSWORD};"
+    "Encrypt=no;"
+    "TrustServerCertificate=no;"
+    "Connection Timeout=30;",
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    max_lifetime=POOL_MAX_LIFETIME,
+    timeout=POOL_TIMEOUT,
+    metrics=DBMetrics(metricas, queries=query_log),
+    limiter=db_limiter,
+)
+
+
+# Ejecutor para el trabajo bloqueante de BD de los handlers async: sus propios POOL_MAX_SIZE
+# hilos, aparte de los de los handlers síncronos, y las plazas de db_limiter
+db_executor = DBExecutor(db_limiter, max_workers=POOL_MAX_SIZE)
+
 
 def get_connection():
-    return pyodbc.connect(
-        f"DRIVER={{ODBC Driver 18 for SQL Server}};"
-        f"SERVER={SERVER};"
-        f"DATABASE={DATABASE};"
-        f"UID={USERNAME};"
-        f"PWD={PASSWORD};"
-        "Encrypt=no;"
-        "TrustServerCertificate=no;"
-        "Connection Timeout=30;"
-    )
+    # La conexión vuelve al pool con close() o al salir del bloque with
+    return pool.acquire()
+
+
+@app.on_event("startup")
+def warm_pool():
+    try:
+        pool.warm()
+    except Exception as e:
+        print(f"Error al precalentar el pool de conexiones: {str(e)}")
+
+
+@app.on_event("startup")
+def check_schema():
+    # Sin las migraciones al día faltan tablas o índices: mejor no arrancar
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"No se ha podido comprobar la versión del esquema: {str(e)}")
+        return
+    with conn:
+        version = comprobar_schema(conn)
+    print(f"Esquema de la base de datos en la versión {version}")
+
+
+@app.on_event("shutdown")
+def close_pool():
+    # La cola de pedidos y las recargas terminan lo que tengan en curso antes de que se cierre el pool
+    if cola_pedidos is not None:
+        cola_pedidos.stop()
+    recarga_stock_bajo.stop()
+    recarga_top_ventas.stop()
+    pool.close()
+
+
+@app.get("/sistema/pool")
+def get_pool_stats():
+    return {"pool": pool.stats(), "limiter": db_limiter.stats(), "executor": db_executor.stats()}
+
+
+def _conexiones_pool():
+    stats = pool.stats()
+    return {(estado,): stats[estado] for estado in ("in_use", "idle", "waiting")}
+
+
+def _tareas_executor():
+    stats = db_executor.stats()
+    return {("queued",): stats["queue_depth"], ("running",): stats["running"]}
+
+
+metricas.gauge("db_pool_connections", "Conexiones del pool por estado", ("state",), func=_conexiones_pool)
+metricas.gauge("db_executor_tasks", "Tareas del ejecutor de BD en cola y en curso", ("state",), func=_tareas_executor)
+
+
+@app.get("/sistema/consultas")
+def get_consultas_stats(limit: int = Query(20, ge=1, le=1000),
+                        orden: Literal["total", "max", "calls", "rows", "slow"] = "total"):
+    return query_log.stats(limit, orden)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metricas.response()
+
+
+# Caché de los endpoints de analítica del panel. Las escrituras de la API invalidan
+# las entradas por etiqueta (tabla afectada); el TTL cubre los cambios hechos fuera de la API.
+CACHE_MAX_ENTRIES = 256
+cache = ResponseCache(max_entries=CACHE_MAX_ENTRIES)
+fotos_cache = ResponseCache(max_entries=FOTOS_MAX_ENTRIES)
+
+
+@app.get("/sistema/cache")
+def get_cache_stats():
+    return cache.stats()
+
+
+@app.get("/sistema/compresion")
+def get_compression_stats():
+    return compressed_cache.stats()
 
 class Producto(BaseModel):
     id_producto: int | None = None
@@ -58,6 +204,11 @@ class CategorySalesData(BaseModel):
 class LowStockCount(BaseModel):
     stock: int
 
+class UmbralesStock(BaseModel):
+    umbral: int | None = None
+    categorias: Dict[str, int] | None = None
+    productos: Dict[int, int] | None = None
+
 class Users(BaseModel):
     id: int | None = None
     name: str
@@ -86,7 +237,7 @@ class ProductUpdate(BaseModel):
 
 class LineaPedido(BaseModel):
     id_producto: int
-    cantidad: int
+    cantidad: int = Field(gt=0)  # una cantidad negativa sumaría stock en lugar de reservarlo
     precio: float
 
 class Pedido(BaseModel):
@@ -101,153 +252,307 @@ class Pedido(BaseModel):
     cantidad_total: float
     lineas: List[LineaPedido]
 
-@app.post("/pedidos")
-async def crear_pedido(pedido: Pedido):
-    try:
-        conn = get_connection()
+reservas = StockReservations()
+
+
+@app.get("/sistema/stock")
+def get_stock_stats():
+    return reservas.stats()
+
+
+def _insertar_pedido(pedido, fecha=None):
+    fecha = fecha or datetime.datetime.now()
+    with get_connection() as conn, top_ventas.escritura():
+        cursor = conn.cursor()
+
+        # Lo primero es reservar el stock: bloquea los productos en orden de id y
+        # falla antes de escribir nada si alguna línea no se puede servir
+        restantes = reservas.reserve(cursor, [(linea.id_producto, linea.cantidad) for linea in pedido.lineas])
+        pedido_id = _escribir_pedido(cursor, pedido, fecha)
+        conn.commit()
+        top_ventas.registrar(fecha.date(), _ventas_pedido(pedido))
+    stock_bajo.actualizar_unidades(restantes)
+    return pedido_id
+
+
+def _insertar_lote(pedidos):
+    # Varios pedidos (pares pedido, fecha) en una transacción: el stock de todo el lote se
+    # reserva de una vez (mismo orden de bloqueo que un pedido suelto) y después se escriben
+    with get_connection() as conn, top_ventas.escritura():
         cursor = conn.cursor()
+        restantes = reservas.reserve(cursor, [
+            (linea.id_producto, linea.cantidad) for pedido, _ in pedidos for linea in pedido.lineas
+        ])
+        ids = [_escribir_pedido(cursor, pedido, fecha) for pedido, fecha in pedidos]
+        conn.commit()
+        for pedido, fecha in pedidos:
+            top_ventas.registrar((fecha or datetime.datetime.now()).date(), _ventas_pedido(pedido))
+    stock_bajo.actualizar_unidades(restantes)
+    return ids
+
+
+def _ventas_pedido(pedido):
+    # Filas (producto_id, cantidad, total) que el pedido escribe en Ventas
+    return [
+        (linea.id_producto, linea.cantidad, linea.cantidad * linea.precio)
+        for linea in pedido.lineas
+    ]
+
+
+QUERY_LINEA_PEDIDO = """
+    INSERT INTO Linea_pedidos (id_orden, id_producto, cantidad, precio)
+    VALUES (?, ?, ?, ?)
+"""
+
 
-        # First insert into Pedidos
-        query_pedido = """
-            INSERT INTO Pedidos (id_usuario, fecha_pedido, estado, direccion, 
-                               ciudad, pais, codigo_postal, metodo_pago, cantidad_total)
-            OUTPUT INSERTED.id
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+def _insertar_lineas(cursor, pedido_id, lineas):
+    # Una sentencia para todas las líneas: fast_executemany envía los parámetros en un único viaje
+    cursor.fast_executemany = True
+    cursor.executemany(QUERY_LINEA_PEDIDO, [
+        (pedido_id, linea.id_producto, linea.cantidad, linea.precio)
+        for linea in lineas
+    ])
+
+
+def _escribir_pedido(cursor, pedido, fecha=None):
+    # Pedidos, Ventas, Ventas_diarias y Linea_pedidos; sin commit. `fecha` es la de
+    # recepción del pedido (los de la cola se escriben un rato después)
+    fecha = fecha or datetime.datetime.now()
+    # First insert into Pedidos
+    query_pedido = """
+        INSERT INTO Pedidos (id_usuario, fecha_pedido, estado, direccion, 
+                           ciudad, pais, codigo_postal, metodo_pago, cantidad_total)
+        OUTPUT INSERTED.id
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    cursor.execute(query_pedido, (
+        pedido.id_usuario,
+        fecha,
+        pedido.estado,
+        pedido.direccion,
+        pedido.ciudad,
+        pedido.pais,
+        pedido.codigo_postal,
+        pedido.metodo_pago,
+        pedido.cantidad_total
+    ))
+    pedido_id = cursor.fetchone()[0]
+
+    # Las líneas se escriben en bloque: una sentencia por tabla sea cual sea el número
+    # de líneas (fast_executemany envía todos los parámetros en un único viaje)
+    if pedido.lineas:
+        cursor.fast_executemany = True
+        fecha_venta = fecha
+
+        query_venta = """
+            INSERT INTO Ventas (producto_id, fecha_venta, cantidad, total)
+            VALUES (?, ?, ?, ?)
         """
-        cursor.execute(query_pedido, (
-            pedido.id_usuario,
-            datetime.datetime.now(),
-            pedido.estado,
-            pedido.direccion,
-            pedido.ciudad,
-            pedido.pais,
-            pedido.codigo_postal,
-            pedido.metodo_pago,
-            pedido.cantidad_total
-        ))
-        pedido_id = cursor.fetchone()[0]
-
-        # Then insert sales records for each product
-        for linea in pedido.lineas:
-            # Calculate total for this line
-            total_linea = linea.cantidad * linea.precio
-            
-            query_venta = """
-                INSERT INTO Ventas (producto_id, fecha_venta, cantidad, total)
-                OUTPUT INSERTED.id
-                VALUES (?, ?, ?, ?)
-            """
-            cursor.execute(query_venta, (
-                linea.id_producto,
-                datetime.datetime.now(),
-                linea.cantidad,
-                total_linea
-            ))
-            venta_id = cursor.fetchone()[0]
+        ventas = _ventas_pedido(pedido)
+        cursor.executemany(query_venta, [
+            (producto_id, fecha_venta, cantidad, total)
+            for producto_id, cantidad, total in ventas
+        ])
+        registrar_ventas(cursor, fecha_venta.date(), ventas)
 
-            # Insert order lines using the sale ID
-            query_linea = """
-                INSERT INTO Linea_pedidos (id_orden, id_producto, cantidad, precio)
-                VALUES (?, ?, ?, ?)
-            """
-            cursor.execute(query_linea, (
-                venta_id,
-                linea.id_producto,
-                linea.cantidad,
-                linea.precio
-            ))
+        _insertar_lineas(cursor, pedido_id, pedido.lineas)
 
-            # Update product stock
-            query_stock = """
-                UPDATE Productos 
-                SET unidades = unidades - ?
-                WHERE id_producto = ?
-            """
-            cursor.execute(query_stock, (linea.cantidad, linea.id_producto))
+    return pedido_id
 
-        conn.commit()
+
+idempotencia = IdempotencyStore()
+
+
+@app.get("/sistema/idempotencia")
+def get_idempotency_stats():
+    return idempotencia.stats()
+
+
+# Modo con cola: POST /pedidos guarda el pedido en un fichero SQLite local y responde 202;
+# un hilo lo escribe después en SQL Server por lotes. None = se escribe en la propia petición
+COLA_PEDIDOS_PATH = None
+
+
+def _pedido_de_cola(payload):
+    datos = json.loads(payload)
+    return Pedido.model_validate(datos["pedido"]), datetime.datetime.fromisoformat(datos["recibido"])
+
+
+def _insertar_lote_cola(payloads):
+    return reservas.run(_insertar_lote, [_pedido_de_cola(payload) for payload in payloads])
+
+
+def _insertar_uno_cola(payload):
+    try:
+        return reservas.run(_insertar_pedido, *_pedido_de_cola(payload))
+    except StockInsuficiente as e:
+        raise PedidoRechazado({"message": str(e), "faltantes": e.faltantes})
+
+
+cola_pedidos = None
+if COLA_PEDIDOS_PATH:
+    cola_pedidos = IntakeQueue(
+        COLA_PEDIDOS_PATH, _insertar_lote_cola, _insertar_uno_cola,
+        al_terminar=lambda: cache.invalidate("pedidos", "productos", "ventas"),
+    )
+
+
+@app.on_event("startup")
+def start_cola_pedidos():
+    if cola_pedidos is not None:
+        cola_pedidos.start()
+
+
+@app.get("/sistema/cola")
+def get_cola_stats():
+    if cola_pedidos is None:
+        return {"activo": False}
+    return cola_pedidos.stats()
+
+
+@app.get("/pedidos/cola/{id_seguimiento}")
+def get_estado_cola(id_seguimiento: str):
+    if cola_pedidos is None:
+        raise HTTPException(status_code=404, detail="La cola de pedidos no está activa")
+    estado = cola_pedidos.estado(id_seguimiento)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Pedido no encontrado en la cola")
+    return estado
+
+
+@app.post("/pedidos")
+async def crear_pedido(pedido: Pedido, idempotency_key: str | None = Header(None, max_length=255)):
+    crear = _encolar_pedido if cola_pedidos is not None else _crear_pedido
+    # Con Idempotency-Key los reintentos del cliente reciben la respuesta original
+    # en lugar de crear otro pedido
+    if idempotency_key is None:
+        return await crear(pedido)
+    return await idempotencia.run(idempotency_key, pedido.model_dump_json(), lambda: crear(pedido))
+
+
+async def _encolar_pedido(pedido):
+    try:
+        payload = json.dumps({"recibido": datetime.datetime.now().isoformat(), "pedido": pedido.model_dump()})
+        # La escritura en la cola espera al fsync: va a un hilo para no bloquear el event loop
+        id_seguimiento = await anyio.to_thread.run_sync(cola_pedidos.encolar, payload)
+    except Exception as e:
+        print(f"Error queuing order: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(
+        {"message": "Pedido recibido", "id_seguimiento": id_seguimiento, "estado": "pendiente"},
+        status_code=202,
+        headers={"Location": f"/pedidos/cola/{id_seguimiento}"},
+    )
+
+
+async def _crear_pedido(pedido):
+    try:
+        # El trabajo de pyodbc va al ejecutor de BD para no bloquear el event loop
+        # reservas.run repite la transacción si SQL Server la elige víctima de un interbloqueo
+        pedido_id = await db_executor.run(reservas.run, _insertar_pedido, pedido)
+        cache.invalidate("pedidos", "productos", "ventas")
         return {
             "message": "Pedido creado correctamente",
             "id_pedido": pedido_id
         }
 
+    except StockInsuficiente as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "faltantes": e.faltantes})
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
+        # La conexión hace rollback al volver al pool
         print(f"Error creating order: {str(e)}")  # Debug print
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if 'conn' in locals():
-            conn.close()
             
+
+
+QUERY_PEDIDOS_RECIENTES = """
+    SELECT TOP 5
+        p.*, 
+        u.name as cliente_nombre
+    FROM Pedidos p
+    JOIN users u ON p.id_usuario = u.id
+    ORDER BY p.fecha_pedido DESC
+"""
+
+
+def _pedidos_recientes(rows):
+    return [
+        {
+            "id": row.id,
+            "cliente_nombre": row.cliente_nombre,
+            "fecha": row.fecha_pedido.strftime('%Y-%m-%d'),
+            "estado": row.estado,
+            "cantidad_total": float(row.cantidad_total),
+            "direccion": row.direccion,
+            "ciudad": row.ciudad,
+            "pais": row.pais,
+            "codigo_postal": row.codigo_postal,
+            "metodo_pago": row.metodo_pago
+        }
+        for row in rows
+    ]
+
+
 @app.get("/pedidos/recientes")
 def get_recent_orders():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT TOP 5
-                p.*, 
-                u.name as cliente_nombre
-            FROM Pedidos p
-            JOIN users u ON p.id_usuario = u.id
-            ORDER BY p.fecha_pedido DESC
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {
-                "id": row.id,
-                "cliente_nombre": row.cliente_nombre,
-                "fecha": row.fecha_pedido.strftime('%Y-%m-%d'),
-                "estado": row.estado,
-                "cantidad_total": float(row.cantidad_total),
-                "direccion": row.direccion,
-                "ciudad": row.ciudad,
-                "pais": row.pais,
-                "codigo_postal": row.codigo_postal,
-                "metodo_pago": row.metodo_pago
-            }
-            for row in rows
-        ]
+        return run_query(get_connection, QUERY_PEDIDOS_RECIENTES, _pedidos_recientes)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Versión del pedido para el ETag: checksum de la fila, del cliente y de sus líneas
+QUERY_PEDIDO_VERSION = """
+    SELECT
+        BINARY_CHECKSUM(p.id_usuario, p.fecha_pedido, p.estado, p.direccion, p.ciudad, p.pais,
+                        p.codigo_postal, p.metodo_pago, p.cantidad_total, u.name, u.email) AS version,
+        (SELECT COUNT_BIG(*)
+         FROM Linea_pedidos lp
+         WHERE lp.id_orden = p.id) AS lineas,
+        (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(lp.id, lp.id_producto, lp.cantidad, lp.precio, pr.nombre))
+         FROM Linea_pedidos lp
+         JOIN Productos pr ON lp.id_producto = pr.id_producto
+         WHERE lp.id_orden = p.id) AS version_lineas
+    FROM Pedidos p
+    JOIN users u ON p.id_usuario = u.id
+    WHERE p.id = ?
+"""
+
+
 @app.get("/pedidos/{pedido_id}")
-def get_pedido(pedido_id: int):
+def get_pedido(pedido_id: int, request: Request, response: Response):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Obtener datos del pedido
-        query = """
-            SELECT p.*, u.name as nombre_cliente, u.email
-            FROM Pedidos p
-            JOIN users u ON p.id_usuario = u.id
-            WHERE p.id = ?
-        """
-        cursor.execute(query, (pedido_id,))
-        pedido = cursor.fetchone()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Si el cliente ya tiene esta versión del pedido no se leen ni serializan las filas
+            etag = fetch_etag(cursor, QUERY_PEDIDO_VERSION, (pedido_id,), pedido_id)
+            if matches(request, etag):
+                return not_modified(etag)
         
-        if not pedido:
-            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+            # Obtener datos del pedido
+            query = """
+                SELECT p.*, u.name as nombre_cliente, u.email
+                FROM Pedidos p
+                JOIN users u ON p.id_usuario = u.id
+                WHERE p.id = ?
+            """
+            cursor.execute(query, (pedido_id,))
+            pedido = cursor.fetchone()
         
-        # Obtener líneas del pedido
-        query = """
-            SELECT lp.*, pr.nombre as nombre_producto
-            FROM Linea_pedidos lp
-            JOIN Productos pr ON lp.id_producto = pr.id_producto
-            WHERE lp.id_orden = ?
-        """
-        cursor.execute(query, (pedido_id,))
-        lineas = cursor.fetchall()
+            if not pedido:
+                raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
-        conn.close()
+            # Obtener líneas del pedido
+            query = """
+                SELECT lp.*, pr.nombre as nombre_producto
+                FROM Linea_pedidos lp
+                JOIN Productos pr ON lp.id_producto = pr.id_producto
+                WHERE lp.id_orden = ?
+            """
+            cursor.execute(query, (pedido_id,))
+            lineas = cursor.fetchall()
         
+        response.headers["ETag"] = etag
         return {
             "id": pedido.id,
             "cliente_nombre": pedido.nombre_cliente,
@@ -273,88 +578,138 @@ def get_pedido(pedido_id: int):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+
+# Campos del listado de pedidos (row_mapper): clave -> columna o (función, columnas...)
+CAMPOS_PEDIDO = {
+    "id": "id",
+    "cliente_nombre": "nombre_cliente",
+    "cliente_email": "email",
+    "fecha": (fecha_dia, "fecha_pedido"),
+    "total": "cantidad_total",
+    "estado": "estado",
+    "direccion": "direccion",
+    "ciudad": "ciudad",
+    "pais": "pais",
+    "codigo_postal": "codigo_postal",
+    "metodo_pago": "metodo_pago",
+}
+
+
 @app.get("/pedidos")
-def get_pedidos():
+def get_pedidos(
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = None,
+    estado: str | None = None,
+    desde: datetime.date | None = None,
+    hasta: datetime.date | None = None,
+    todos: bool = False,
+    stream: Literal["json", "ndjson"] | None = None,
+):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Obtener todos los pedidos
-        query = """
-            SELECT p.*, u.name as nombre_cliente, u.email
+        # Paginación por clave: `after` es el último id recibido. todos=true devuelve la lista completa
+        limit = None if todos else limit
+        query, params = keyset_query(
+            """p.*, u.name as nombre_cliente, u.email
             FROM Pedidos p
-            JOIN users u ON p.id_usuario = u.id
-        """
-        cursor.execute(query)
-        pedidos = cursor.fetchall()
-        
-        conn.close()
+            JOIN users u ON p.id_usuario = u.id""",
+            "p.id",
+            [
+                ("p.estado = ?", estado),
+                ("p.fecha_pedido >= ?", desde),
+                ("p.fecha_pedido < ?", end_of_day(hasta)),
+            ],
+            limit=limit,
+            after=after,
+        )
+        # Exportaciones grandes: stream=json|ndjson envía las filas por bloques
+        if stream:
+            return stream_rows(get_connection, query, params, CAMPOS_PEDIDO, stream)
+
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            pedidos = cursor.fetchall()
+            result = map_rows(cursor, pedidos, CAMPOS_PEDIDO)
         
-        return [
-            {
-                "id": pedido.id,
-                "cliente_nombre": pedido.nombre_cliente,
-                "cliente_email": pedido.email,
-                "fecha": pedido.fecha_pedido.strftime('%Y-%m-%d'),
-                "total": float(pedido.cantidad_total),
-                "estado": pedido.estado,
-                "direccion": pedido.direccion,
-                "ciudad": pedido.ciudad,
-                "pais": pedido.pais,
-                "codigo_postal": pedido.codigo_postal,
-                "metodo_pago": pedido.metodo_pago
-                
-            }
-            for pedido in pedidos
-        ]
+        set_next_cursor(response, pedidos, "id", limit)
+        return json_response(result, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _ajustar_ventas(cursor, fecha_pedido, lineas_antiguas, lineas_nuevas):
+    # Aplica al resumen diario, en la fecha del pedido, la diferencia entre las líneas antiguas
+    # y las nuevas, una fila por producto cuya cantidad o importe cambia. Devuelve esas filas
+    diferencias = {}
+    for id_producto, cantidad, total in (
+        [(l.id_producto, -l.cantidad, -float(l.cantidad * l.precio)) for l in lineas_antiguas]
+        + [(l.id_producto, l.cantidad, l.cantidad * l.precio) for l in lineas_nuevas]
+    ):
+        acumulado = diferencias.setdefault(id_producto, [0, 0.0])
+        acumulado[0] += cantidad
+        acumulado[1] += total
+
+    ventas = [
+        (id_producto, cantidad, round(total, 2))
+        for id_producto, (cantidad, total) in sorted(diferencias.items())
+        if cantidad or round(total, 2)
+    ]
+    if not ventas or fecha_pedido is None:
+        return []
+
+    ajustar_ventas(cursor, fecha_pedido, ventas)
+    return ventas
+
+
 @app.put("/pedidos/{pedido_id}")
 def update_pedido(pedido_id: int, pedido: Pedido):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with get_connection() as conn, top_ventas.escritura():
+            cursor = conn.cursor()
         
-        # Actualizar pedido
-        query = """
-            UPDATE Pedidos
-            SET estado = ?, direccion = ?, ciudad = ?, 
-                pais = ?, codigo_postal = ?, metodo_pago = ?
-            WHERE id = ?
-        """
-        cursor.execute(query, (
-            pedido.estado,
-            pedido.direccion,
-            pedido.ciudad,
-            pedido.pais,
-            pedido.codigo_postal,
-            pedido.metodo_pago,
-            pedido_id
-        ))
+            # Actualizar pedido
+            query = """
+                UPDATE Pedidos
+                SET estado = ?, direccion = ?, ciudad = ?, 
+                    pais = ?, codigo_postal = ?, metodo_pago = ?
+                OUTPUT INSERTED.fecha_pedido
+                WHERE id = ?
+            """
+            cursor.execute(query, (
+                pedido.estado,
+                pedido.direccion,
+                pedido.ciudad,
+                pedido.pais,
+                pedido.codigo_postal,
+                pedido.metodo_pago,
+                pedido_id
+            ))
+            row = cursor.fetchone()
+            fecha_pedido = row.fecha_pedido if row else None
         
-        # Actualizar líneas de pedido
-        if pedido.lineas:
-            # Eliminar líneas existentes
-            cursor.execute("DELETE FROM Linea_pedidos WHERE id_orden = ?", (pedido_id,))
+            # Actualizar líneas de pedido
+            ajuste = []
+            if pedido.lineas:
+                cursor.execute(
+                    "SELECT id_producto, cantidad, precio FROM Linea_pedidos WHERE id_orden = ?",
+                    (pedido_id,)
+                )
+                lineas_antiguas = cursor.fetchall()
+
+                # Eliminar líneas existentes
+                cursor.execute("DELETE FROM Linea_pedidos WHERE id_orden = ?", (pedido_id,))
             
-            # Insertar nuevas líneas
-            for linea in pedido.lineas:
-                query = """
-                    INSERT INTO Linea_pedidos (id_orden, id_producto, cantidad, precio)
-                    VALUES (?, ?, ?, ?)
-                """
-                cursor.execute(query, (
-                    pedido_id,
-                    linea.id_producto,
-                    linea.cantidad,
-                    linea.precio
-                ))
+                # Insertar nuevas líneas, todas en una sentencia
+                _insertar_lineas(cursor, pedido_id, pedido.lineas)
+
+                ajuste = _ajustar_ventas(cursor, fecha_pedido, lineas_antiguas, pedido.lineas)
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+            if fecha_pedido is not None:
+                top_ventas.ajustar(fecha_pedido, ajuste)
         
+        cache.invalidate("pedidos", "productos", "ventas")
         return {"message": "Pedido actualizado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -363,266 +718,426 @@ def update_pedido(pedido_id: int, pedido: Pedido):
 @app.put("/productos/{id_producto}")
 def editar_producto(id_producto: int, producto: ProductUpdate):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = conn.cursor()
         
-        query = """
-            UPDATE Productos
-            SET nombre = ?, descripcion = ?, categoria = ?, tipo = ?, 
-                precio = ?, unidades = ?, foto = ?
-            WHERE id_producto = ?
-        """
+            query = f"""
+                UPDATE Productos
+                SET nombre = ?, descripcion = ?, categoria = ?, tipo = ?, 
+                    precio = ?, unidades = ?, foto = ?
+                OUTPUT {OUTPUT_PRODUCTO}
+                WHERE id_producto = ?
+            """
         
-        cursor.execute(query, (
-            producto.nombre,
-            producto.descripcion,
-            producto.categoria,
-            producto.tipo,
-            producto.precio,
-            producto.unidades,
-            producto.foto,
-            id_producto
-        ))
+            cursor.execute(query, (
+                producto.nombre,
+                producto.descripcion,
+                producto.categoria,
+                producto.tipo,
+                producto.precio,
+                producto.unidades,
+                producto.foto,
+                id_producto
+            ))
+            row = cursor.fetchone()
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
+        cache.invalidate("productos")
+        if row:
+            busqueda.actualizar(row)
+            stock_bajo.actualizar(row)
         return {"message": "Producto actualizado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al actualizar producto: {str(e)}")
+
+
+CAMPOS_PRODUCTO = {
+    "id_producto": "id_producto",
+    "nombre": "nombre",
+    "descripcion": "descripcion",
+    "categoria": "categoria",
+    "marca": "marca",
+    "tipo": "tipo",
+    "precio": "precio",
+    "unidades": "unidades",
+    "foto": (foto_url, "id_producto", "foto_hash"),
+}
+
+
+COLUMNAS_PRODUCTO = "id_producto, nombre, descripcion, categoria, marca, tipo, precio, unidades, foto"
+
+# El listado devuelve la URL de la foto (con su hash) en lugar de la foto
+COLUMNAS_LISTADO = f"id_producto, nombre, descripcion, categoria, marca, tipo, precio, unidades, {FOTO_HASH} AS foto_hash"
+
+# Versión del catálogo para el ETag; se le añade el mismo WHERE que al listado
+QUERY_PRODUCTOS_VERSION = f"""
+    SELECT COUNT_BIG(*) AS filas, CHECKSUM_AGG(BINARY_CHECKSUM({COLUMNAS_PRODUCTO})) AS version
+    FROM Productos
+"""
+
+
 # Endpoint para datos de productos
 @app.get("/productos", response_model=List[Producto])
-def get_Productos():
-    conn = get_connection()
-    cursor = conn.cursor()
-    query = "SELECT * FROM Productos"
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
+def get_Productos(
+    request: Request,
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = None,
+    categoria: str | None = None,
+    todos: bool = False,
+    stream: Literal["json", "ndjson"] | None = None,
+):
+    limit = None if todos else limit
+    query, params = keyset_query(
+        f"{COLUMNAS_LISTADO} FROM Productos",
+        "id_producto",
+        [("categoria = ?", categoria)],
+        limit=limit,
+        after=after,
+    )
+    if stream:
+        return stream_rows(get_connection, query, params, CAMPOS_PRODUCTO, stream)
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        where, version_params = where_clause("id_producto", [("categoria = ?", categoria)], after)
+        etag = fetch_etag(cursor, QUERY_PRODUCTOS_VERSION + where, version_params, limit, after, categoria)
+        if matches(request, etag):
+            return not_modified(etag)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        productos = map_rows(cursor, rows, CAMPOS_PRODUCTO)
     
-    return [
-        {
-            "id_producto": row.id_producto,
-            "nombre": row.nombre,
-            "descripcion": row.descripcion,
-            "categoria": row.categoria,
-            "marca": row.marca,
-            "tipo": row.tipo,
-            "precio": float(row.precio),
-            "unidades": row.unidades,
-            "foto": row.foto
+    response.headers["ETag"] = etag
+    set_next_cursor(response, rows, "id_producto", limit)
+    # Filas ya con la forma de Producto: se codifican sin volver a validarlas
+    return json_response(productos, response)
 
-        }
-        for row in rows
-    ]
 
-@app.get("/productos/mas_vendidos")
-def get_top_products():
-    try:
-        conn = get_connection()
+
+# Búsqueda de productos en un índice invertido en memoria (busqueda.py): por prefijo, sin
+# tildes y con erratas. Se carga al arrancar y los endpoints de productos lo mantienen al día.
+QUERY_INDICE_BUSQUEDA = f"SELECT {', '.join(CAMPOS_BUSQUEDA)} FROM Productos"
+
+# Columnas que devuelven el INSERT y el UPDATE de productos para actualizar el índice de
+# búsqueda y el de stock bajo
+OUTPUT_PRODUCTO = ", ".join(f"INSERTED.{campo}" for campo in (*CAMPOS_BUSQUEDA, "unidades"))
+
+busqueda = ProductSearchIndex()
+
+
+def _productos_busqueda():
+    with get_connection() as conn:
         cursor = conn.cursor()
-        
-        query = """
-            SELECT TOP 5
-                p.nombre,
-                p.categoria,
-                p.precio,
-                COUNT(lp.id_producto) as unidades_vendidas,
-                SUM(lp.cantidad * lp.precio) as ingresos_totales
-            FROM Productos p
-            LEFT JOIN Linea_pedidos lp ON p.id_producto = lp.id
-            GROUP BY p.nombre, p.categoria, p.precio
-            ORDER BY unidades_vendidas DESC
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {
+        cursor.execute(QUERY_INDICE_BUSQUEDA)
+        return cursor.fetchall()
+
+
+@app.on_event("startup")
+def build_search_index():
+    # En segundo plano: el arranque no espera a leer el catálogo
+    busqueda.reconstruir_en_segundo_plano(_productos_busqueda)
+
+
+@app.get("/sistema/busqueda")
+def get_busqueda_stats():
+    return busqueda.stats()
+
+
+@app.post("/sistema/busqueda/reconstruir", status_code=202)
+def rebuild_search_index():
+    # Las búsquedas siguen usando el índice actual hasta que el nuevo esté listo
+    return {"iniciada": busqueda.reconstruir_en_segundo_plano(_productos_busqueda)}
+
+
+@app.get("/productos/buscar")
+def buscar_productos(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(BUSQUEDA_LIMIT, ge=1, le=100),
+):
+    if not busqueda.listo:
+        # Si la carga del arranque falló (p. ej. sin conexión a la BD) se vuelve a intentar
+        busqueda.reconstruir_en_segundo_plano(_productos_busqueda)
+        raise HTTPException(status_code=503, detail="El índice de búsqueda todavía se está cargando")
+    return busqueda.buscar(q, limit)
+
+
+# Más vendidos por ventana (7d, 30d, total): contadores en memoria (top_ventas.py) que se
+# actualizan al escribir los pedidos; de la BD solo se leen los datos de los k productos
+QUERY_PRODUCTOS_TOP = "SELECT id_producto, nombre, categoria, precio FROM Productos WHERE id_producto IN ({})"
+
+# Cada cuánto se rehacen los contadores desde Ventas_diarias: las ventas de otros procesos
+# tardan como mucho esto en contarse
+MAS_VENDIDOS_RECARGA = 300  # segundos
+
+top_ventas = TopSellers()
+recarga_top_ventas = PeriodicReload("mas_vendidos", lambda: top_ventas.cargar(get_connection), MAS_VENDIDOS_RECARGA)
+
+
+@app.on_event("startup")
+def load_top_sellers():
+    try:
+        top_ventas.cargar(get_connection)
+    except Exception as e:
+        print(f"Error al cargar los contadores de más vendidos: {str(e)}")
+    recarga_top_ventas.start()
+
+
+@app.get("/sistema/mas_vendidos")
+def get_top_sellers_stats():
+    return {**top_ventas.stats(), "recarga": recarga_top_ventas.stats()}
+
+
+def _consulta_mas_vendidos(ventana="total", k=TOP_K):
+    # (sql, parámetros, forma) para run_query y el lote del panel; el ranking sale de los
+    # contadores y la consulta solo trae nombre, categoría y precio actuales de esos k
+    if not top_ventas.listo:
+        # Si la carga del arranque falló (p. ej. sin conexión a la BD) se repite aquí
+        top_ventas.cargar(get_connection)
+    top = top_ventas.top(ventana, k)
+    ids = [producto["id_producto"] for producto in top]
+
+    def shape(rows):
+        productos = {row.id_producto: row for row in rows}
+        result = []
+        for producto in top:
+            row = productos.get(producto["id_producto"])
+            if row is None:
+                continue  # borrado después de venderse
+            result.append({
+                "id_producto": row.id_producto,
                 "nombre": row.nombre,
                 "categoria": row.categoria,
                 "precio": float(row.precio),
-                "unidades_vendidas": row.unidades_vendidas or 0,
-                "ingresos_totales": float(row.ingresos_totales or 0)
-            }
-            for row in rows
-        ]
+                "unidades_vendidas": producto["unidades_vendidas"],
+                "ingresos_totales": producto["ingresos_totales"],
+            })
+        return result
+
+    return QUERY_PRODUCTOS_TOP.format(", ".join("?" * len(ids)) or "NULL"), tuple(ids), shape
+
+
+@app.get("/productos/mas_vendidos")
+@cache.cached_json(ttl=300, tags=("pedidos", "productos"))
+def get_top_products(
+    ventana: Literal["7d", "30d", "total"] = "total",
+    k: int = Query(TOP_K, ge=1, le=100),
+):
+    try:
+        return run_query(get_connection, _consulta_mas_vendidos(ventana, k))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+# Series de ventas: rango sargable sobre Ventas_diarias y agrupado por periodo en Python
+# (series.py). Las funciones _serie_* devuelven (sql, parámetros, forma) con el rango
+# calculado al ejecutarse, así sirven igual para los endpoints y para el lote del panel.
+@app.get("/ventas/serie")
+@cache.cached_json(ttl=300, tags=("ventas",))
+def get_sales_series(
+    desde: datetime.date | None = None,
+    hasta: datetime.date | None = None,
+    granularidad: Literal["day", "week", "month", "quarter"] = "month",
+):
+    # Sin fechas: los últimos 12 meses naturales hasta hoy. Ambos extremos se incluyen.
+    hasta = hasta or datetime.date.today()
+    desde = desde or ultimos_meses(12, hasta)[0]
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'")
+    try:
+        query = consulta_serie(desde, hasta, granularidad)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return run_query(get_connection, query)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener la serie de ventas: {str(e)}")
+
+
+def _ventas_por_mes(puntos):
+    return [
+        {"month": MESES[punto["desde"].month - 1], "amount": punto["total"]}
+        for punto in puntos
+    ]
+
+
+def _pedidos_por_mes(puntos):
+    return [
+        {"month": MESES[punto["desde"].month - 1], "amount": float(punto["num_ventas"])}
+        for punto in puntos
+    ]
+
+
+def _serie_ventas_ultimo_mes():
+    return consulta_serie(*mes_anterior(), "month", _ventas_por_mes)
+
+
 @app.get("/ventas/mensuales_ultimo_mes", response_model=List[SalesData])
+@cache.cached_json(ttl=300, tags=("ventas",))
 def get_monthly_sales():
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Asumiendo que tienes una tabla 'sales' con columnas 'amount' y 'date'
-            query = """
-            SELECT 
-                MONTH(fecha_venta) AS month_num,
-                FORMAT(fecha_venta, 'MMM') AS month_name,
-                SUM(total) AS total_amount
-            FROM 
-                Ventas
-            
-            WHERE 
-                fecha_venta >= DATEFROMPARTS(YEAR(DATEADD(MONTH, -1, GETDATE())), MONTH(DATEADD(MONTH, -1, GETDATE())), 1)
-                AND fecha_venta < DATEFROMPARTS(YEAR(GETDATE()), MONTH(GETDATE()), 1)
-            GROUP BY 
-                MONTH(fecha_venta),
-                FORMAT(fecha_venta, 'MMM')
+    try:
+        return run_query(get_connection, _serie_ventas_ultimo_mes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener datos de ventas mensuales: {str(e)}")
+
+
+def _serie_ventas_mensual():
+    # Los últimos 12 meses naturales en orden cronológico
+    return consulta_serie(*ultimos_meses(12), "month", _ventas_por_mes)
+
 
-            """
-            
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [
-                {"month": row.month_name, "amount": float(row.total_amount)}
-                for row in rows
-            ]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error al obtener datos de ventas mensuales: {str(e)}")
-        
 @app.get("/ventas/mensual", response_model=List[SalesData])
+@cache.cached_json(ttl=300, tags=("ventas",))
 def get_monthly_sales():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Consulta adaptada a la tabla Ventas con nombres en español
-        query = """
-        SELECT 
-            MONTH(fecha_venta) as month_num,
-            FORMAT(fecha_venta, 'MMM') as month_name,
-            SUM(total) as total_amount
-        FROM 
-            Ventas
-        WHERE 
-            fecha_venta >= DATEADD(YEAR, -1, GETDATE())
-        GROUP BY 
-            MONTH(fecha_venta),
-            FORMAT(fecha_venta, 'MMM')
-        ORDER BY 
-            MONTH(fecha_venta)
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        # Aquí adaptamos los nombres de campo para que coincidan con SalesData
-        return [
-            {"month": row.month_name, "amount": float(row.total_amount)}
-            for row in rows
-        ]
+        return run_query(get_connection, _serie_ventas_mensual)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos de ventas mensuales: {str(e)}")
-    
 
-        
+
+def _serie_pedidos_ultimo_mes():
+    return consulta_serie(*mes_anterior(), "month", _pedidos_por_mes)
+
+
 @app.get("/ventas/total_ultimo_mes", response_model=List[SalesData])
+@cache.cached_json(ttl=300, tags=("ventas",))
 def get_last_month_order_count():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Consulta para obtener el conteo de pedidos del mes anterior
-        query = """
-            SELECT 
-                MONTH(fecha_venta) AS month_num,
-                FORMAT(fecha_venta, 'MMM') AS month_name,
-                COUNT(*) AS total_pedidos
-            FROM 
-                Ventas
-            WHERE 
-                fecha_venta >= DATEFROMPARTS(YEAR(DATEADD(MONTH, -1, GETDATE())), MONTH(DATEADD(MONTH, -1, GETDATE())), 1)
-                AND fecha_venta < DATEFROMPARTS(YEAR(GETDATE()), MONTH(GETDATE()), 1)
-            GROUP BY
-                MONTH(fecha_venta),
-                FORMAT(fecha_venta, 'MMM')
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {"month": row.month_name, "amount": float(row.total_pedidos)}
-            for row in rows
-        ]
+        return run_query(get_connection, _serie_pedidos_ultimo_mes)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener conteo de pedidos del último mes: {str(e)}")
-    
+
+
+# Productos con poco stock: índice en memoria (stock_bajo.py) en lugar de un COUNT(*) por
+# petición. El umbral de un producto es el suyo, si no el de su categoría y si no el general
+STOCK_BAJO_CATEGORIAS = {}  # categoria -> umbral
+STOCK_BAJO_PRODUCTOS = {}  # id_producto -> umbral
+# Cada cuánto se relee Productos entera: los cambios de otros procesos tardan como mucho esto
+STOCK_BAJO_RECARGA = 60  # segundos
+
+QUERY_STOCK_BAJO = "SELECT id_producto, nombre, categoria, unidades FROM Productos"
+
+stock_bajo = LowStockIndex(STOCK_BAJO_UMBRAL, STOCK_BAJO_CATEGORIAS, STOCK_BAJO_PRODUCTOS)
+
+
+def _productos_stock():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(QUERY_STOCK_BAJO)
+        return cursor.fetchall()
+
+
+recarga_stock_bajo = PeriodicReload("stock_bajo", lambda: stock_bajo.cargar(_productos_stock), STOCK_BAJO_RECARGA)
+
+
+@app.on_event("startup")
+def load_low_stock():
+    try:
+        stock_bajo.cargar(_productos_stock)
+    except Exception as e:
+        print(f"Error al cargar el índice de stock bajo: {str(e)}")
+    recarga_stock_bajo.start()
+
+
+def _cargar_stock_bajo():
+    # Si la carga del arranque falló (p. ej. sin conexión a la BD) se repite en la primera consulta
+    if not stock_bajo.listo:
+        stock_bajo.cargar(_productos_stock)
+
+
+def _poco_stock():
+    _cargar_stock_bajo()
+    return [{"stock": stock_bajo.total()}]
+
+
 @app.get("/productos/poco_stock", response_model=List[LowStockCount])
 def get_low_stock_Productos():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = """
-            SELECT
-                COUNT(*) AS cantidad
-            FROM
-                Productos
-            WHERE
-                unidades <= 10
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        return [{"stock": row.cantidad} for row in rows]
+        return _poco_stock()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener productos con bajo stock: {str(e)}")
+
+
+@app.get("/productos/poco_stock/detalle")
+def get_low_stock_detail(limit: int = Query(STOCK_BAJO_LIMIT, ge=1, le=1000)):
+    # Número de productos con poco stock y los `limit` más cerca de agotarse
+    try:
+        _cargar_stock_bajo()
+        return stock_bajo.lista(limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener productos con bajo stock: {str(e)}")
-          
 
 
+@app.get("/sistema/stock_bajo")
+def get_stock_bajo_stats():
+    return {**stock_bajo.stats(), "umbrales": stock_bajo.umbrales(), "recarga": recarga_stock_bajo.stats()}
+
+
+@app.put("/sistema/stock_bajo/umbrales")
+def update_low_stock_thresholds(umbrales: UmbralesStock):
+    # Solo en memoria: al reiniciar se vuelve a STOCK_BAJO_UMBRAL y compañía
+    stock_bajo.configurar(umbrales.umbral, umbrales.categorias, umbrales.productos)
+    cache.invalidate("productos")
+    return stock_bajo.umbrales()
+
 @app.post("/productos")
 def create_product(product: ProductUpdate):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = conn.cursor()
 
-        query = """
-            INSERT INTO Productos (nombre, tipo, precio, unidades, categoria, descripcion)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
+            query = f"""
+                INSERT INTO Productos (nombre, tipo, precio, unidades, categoria, descripcion)
+                OUTPUT {OUTPUT_PRODUCTO}
+                VALUES (?, ?, ?, ?, ?, ?)
+            """
         
-        cursor.execute(query, (
-            product.nombre,
-            product.tipo,
-            product.precio,
-            product.unidades,
-            product.categoria,
-            product.descripcion
-        ))
+            cursor.execute(query, (
+                product.nombre,
+                product.tipo,
+                product.precio,
+                product.unidades,
+                product.categoria,
+                product.descripcion
+            ))
+            row = cursor.fetchone()
         
-        conn.commit()
-        conn.close()
+            conn.commit()
 
+        cache.invalidate("productos")
+        busqueda.actualizar(row)
+        stock_bajo.actualizar(row)
         return {"message": "Producto creado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear producto: {str(e)}")
 
 @app.get("/productos/{product_id}")
-def get_product(product_id: int):
+def get_product(product_id: int, request: Request, response: Response):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            etag = fetch_etag(
+                cursor,
+                f"SELECT BINARY_CHECKSUM({COLUMNAS_PRODUCTO}) AS version FROM Productos WHERE id_producto = ?",
+                (product_id,),
+                product_id,
+            )
+            if matches(request, etag):
+                return not_modified(etag)
         
-        query = """
-            SELECT id_producto, nombre, precio, unidades, categoria, descripcion, foto, marca, tipo from Productos
-            WHERE id_producto = ?
-        """
-        cursor.execute(query, (product_id,))
-        row = cursor.fetchone()
-        conn.close()
+            query = """
+                SELECT id_producto, nombre, precio, unidades, categoria, descripcion, foto, marca, tipo from Productos
+                WHERE id_producto = ?
+            """
+            cursor.execute(query, (product_id,))
+            row = cursor.fetchone()
 
         if not row:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
 
+        response.headers["ETag"] = etag
         return {
             "id_producto": row.id_producto,
             "nombre": row.nombre,
@@ -630,76 +1145,111 @@ def get_product(product_id: int):
             "unidades": row.unidades,
             "categoria": row.categoria,
             "descripcion": row.descripcion,
-            "foto": row.foto,
+            "foto": sin_vacia(row.foto),
             "marca": row.marca,
             "tipo": row.tipo
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener producto: {str(e)}")
     
-@app.get("/users/users_ultimo_mes")
-def get_users_last_month():
+
+
+@app.get("/productos/{product_id}/foto")
+def get_foto_producto(
+    product_id: int,
+    request: Request,
+    v: str | None = None,
+    tam: Literal["original", "miniatura"] = "original",
+):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        return servir_foto(get_connection, fotos_cache, product_id, request, v, tam)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener la foto: {str(e)}")
 
-        query = """
-            SELECT COUNT(*) AS total_users
-            FROM users
-            WHERE created_at >= DATEADD(MONTH, -1, GETDATE())
-            AND created_at < GETDATE()
-        """
 
-        cursor.execute(query)
-        row = cursor.fetchone()
-        conn.close()
+QUERY_USUARIOS_ULTIMO_MES = """
+    SELECT COUNT(*) AS total_users
+    FROM users
+    WHERE created_at >= DATEADD(MONTH, -1, GETDATE())
+    AND created_at < GETDATE()
+"""
 
-        return [{"total_users": row.total_users if row else 0}]
+
+def _usuarios_ultimo_mes(rows):
+    return [{"total_users": rows[0].total_users if rows else 0}]
+
+
+@app.get("/users/users_ultimo_mes")
+@cache.cached_json(ttl=300, tags=("usuarios",))
+def get_users_last_month():
+    try:
+        return run_query(get_connection, QUERY_USUARIOS_ULTIMO_MES, _usuarios_ultimo_mes)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener users: {str(e)}")
 
 
+# Campos del listado de usuarios; de ultima_sesion solo se devuelve el día
+CAMPOS_USUARIO = {
+    "id": "id",
+    "name": "name",
+    "email": "email",
+    "role": "role",
+    "ultima_sesion": (fecha_dia, "ultima_sesion"),
+    "estado": "estado",
+}
+
+# Versión de la lista de usuarios para el ETag; se le añade el mismo WHERE que al listado
+QUERY_USUARIOS_VERSION = """
+    SELECT COUNT_BIG(*) AS filas,
+           CHECKSUM_AGG(BINARY_CHECKSUM(id, name, email, role, ultima_sesion, estado)) AS version
+    FROM users
+"""
+
+
 @app.get("/users", response_model=List[Users])
-def get_users():
+def get_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = None,
+    role: str | None = None,
+    todos: bool = False,
+):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = "SELECT id, name, email, role, ultima_sesion, estado FROM users"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        result = []
-        for row in rows:
-            last_login_str = None
-            if row.ultima_sesion:
-                if isinstance(row.ultima_sesion, datetime.datetime):
-                    last_login_str = row.ultima_sesion.strftime('%Y-%m-%d')  # Solo día
-                else:
-                    last_login_str = str(row.ultima_sesion)
-            
-            result.append({
-                "id": row.id,
-                "name": row.name,
-                "email": row.email,
-                "role": row.role,
-                "ultima_sesion": last_login_str,
-                "estado": row.estado,
-            })
+        limit = None if todos else limit
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            where, version_params = where_clause("id", [("role = ?", role)], after)
+            etag = fetch_etag(cursor, QUERY_USUARIOS_VERSION + where, version_params, limit, after, role)
+            if matches(request, etag):
+                return not_modified(etag)
+            query, params = keyset_query(
+                "id, name, email, role, ultima_sesion, estado FROM users",
+                "id",
+                [("role = ?", role)],
+                limit=limit,
+                after=after,
+            )
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            result = map_rows(cursor, rows, CAMPOS_USUARIO)
         
-        return result
+        response.headers["ETag"] = etag
+        set_next_cursor(response, rows, "id", limit)
+        return json_response(result, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
     
 @app.get("/users/{user_id}", response_model=Users)
 def get_user(user_id: int):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = "SELECT id, name, email, role, ultima_sesion, estado FROM users WHERE id = ?"
-        cursor.execute(query, user_id)
-        row = cursor.fetchone()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            query = "SELECT id, name, email, role, ultima_sesion, estado FROM users WHERE id = ?"
+            cursor.execute(query, user_id)
+            row = cursor.fetchone()
         
         if not row:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -722,30 +1272,35 @@ def get_user(user_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener usuario: {str(e)}")
 
-@app.delete("/productos/{id_producto}")
-async def eliminar_producto(id_producto: int):
-    try:
-        conn = get_connection()
+def _borrar_producto(id_producto):
+    with get_connection() as conn:
         cursor = conn.cursor()
-        
+
         query = "DELETE FROM Productos WHERE id_producto = ?"
         cursor.execute(query, (id_producto,))
-        
+
         conn.commit()
-        conn.close()
-        
+
+
+@app.delete("/productos/{id_producto}")
+async def eliminar_producto(id_producto: int):
+    try:
+        await db_executor.run(_borrar_producto, id_producto)
+        cache.invalidate("productos")
+        busqueda.eliminar(id_producto)
+        stock_bajo.eliminar(id_producto)
         return {"message": "Producto eliminado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))   
 @app.delete("/users/{user_id}")
 def delete_user(user_id: int):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = "DELETE FROM users WHERE id = ?"
-        cursor.execute(query, user_id)
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            query = "DELETE FROM users WHERE id = ?"
+            cursor.execute(query, user_id)
+            conn.commit()
+        cache.invalidate("usuarios")
         return {"message": "Usuario eliminado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al eliminar usuario: {str(e)}")
@@ -755,29 +1310,29 @@ def delete_user(user_id: int):
 @app.put("/users/{user_id}", response_model=Users)
 def update_user(user_id: int, user: UserUpdate):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = conn.cursor()
         
-        if user.password:
-            query = """
-                UPDATE users
-                SET name = ?, email = ?, role = ?, estado = ?, password = ?
-                WHERE id = ?
-            """
-            cursor.execute(query, (user.name, user.email, user.role, 
-                                 user.estado, user.password, user_id))
-        else:
-            query = """
-                UPDATE users 
-                SET name = ?, email = ?, role = ?, estado = ?
-                WHERE id = ?
-            """
-            cursor.execute(query, (user.name, user.email, user.role, 
-                                 user.estado, user_id))
+            if user.password:
+                query = """
+                    UPDATE users
+                    SET name = ?, email = ?, role = ?, estado = ?, password = ?
+                    WHERE id = ?
+                """
+                cursor.execute(query, (user.name, user.email, user.role, 
+                                     user.estado, user.password, user_id))
+            else:
+                query = """
+                    UPDATE users 
+                    SET name = ?, email = ?, role = ?, estado = ?
+                    WHERE id = ?
+                """
+                cursor.execute(query, (user.name, user.email, user.role, 
+                                     user.estado, user_id))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
+        cache.invalidate("usuarios")
         return {
             "id": user_id,
             "name": user.name,
@@ -790,143 +1345,202 @@ def update_user(user_id: int, user: UserUpdate):
         raise HTTPException(status_code=500, detail=f"Error al actualizar usuario: {str(e)}")
 
 
+QUERY_VENTAS_CATEGORIAS = """
+    SELECT
+        p.categoria,
+        SUM(s.total) as total_amount
+    FROM 
+        Ventas_diarias s
+    JOIN 
+        Productos p ON s.producto_id = p.id_producto
+    GROUP BY 
+        p.categoria
+    ORDER BY 
+        total_amount DESC
+"""
+
+
+def _ventas_categorias(rows):
+    return [
+        {"category": row.categoria, "amount": float(row.total_amount)}
+        for row in rows
+    ]
 
 
 # # Endpoint para ventas por categoría (para el gráfico de dona)
 @app.get("/ventas/categorias", response_model=List[CategorySalesData])
+@cache.cached_json(ttl=300, tags=("ventas", "productos"))
 def get_category_sales():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Asumiendo que tienes una relación entre ventas y productos que te permite agrupar por categoría
-        query = """
-           SELECT 
-            p.categoria,
-            SUM(s.total) as total_amount
-        FROM 
-            Ventas s
-        JOIN 
-            Productos p ON s.producto_id = p.id_producto
-        GROUP BY 
-            p.categoria
-        ORDER BY 
-            total_amount DESC
-
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {"category": row.categoria, "amount": float(row.total_amount)}
-            for row in rows
-        ]
+        return run_query(get_connection, QUERY_VENTAS_CATEGORIAS, _ventas_categorias)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos de ventas por categoría: {str(e)}")
 
+
+def _tendencia(puntos):
+    current_year = datetime.datetime.now().year
+    last_year = current_year - 1
+
+    # Organizar datos por año: enero a diciembre del año pasado y hasta el mes actual de este
+    por_anio = {}
+    for punto in puntos:
+        por_anio.setdefault(punto["desde"].year, []).append(punto["total"])
+
+    return {
+        "months": list(MESES),
+        "series": [
+            {
+                "name": str(last_year),
+                "data": por_anio.get(last_year, [])
+            },
+            {
+                "name": str(current_year),
+                "data": por_anio.get(current_year, [])
+            }
+        ]
+    }
+
+
+def _serie_tendencia():
+    hoy = datetime.date.today()
+    return consulta_serie(datetime.date(hoy.year - 1, 1, 1), hoy, "month", _tendencia)
+
+
 # # Endpoint para comparar ventas por año (para el gráfico de tendencia)
 @app.get("/ventas/tendencia")
+@cache.cached_json(ttl=300, tags=("ventas",))
 def get_sales_trend():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        current_year = datetime.datetime.now().year
-        last_year = current_year - 1
-        
-        # Consulta para obtener ventas mensuales de los últimos dos años
-        query = """
-        SELECT 
-            YEAR(fecha_venta) as year,
-            MONTH(fecha_venta) as month_num,
-            FORMAT(fecha_venta, 'MMM') as month_name,
-            SUM(total) as total_amount
-        FROM 
-            Ventas
-        WHERE 
-            fecha_venta >= DATEADD(YEAR, -2, GETDATE())
-        GROUP BY 
-            YEAR(fecha_venta),
-            MONTH(fecha_venta),
-            FORMAT(fecha_venta, 'MMM')
-        ORDER BY 
-            YEAR(fecha_venta),
-            MONTH(fecha_venta)
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        # Organizar datos por año
-        current_year_data = []
-        last_year_data = []
-        months = []
-        
-        for row in rows:
-            if row.year == current_year:
-                current_year_data.append(float(row.total_amount))
-                if row.month_name not in months:
-                    months.append(row.month_name)
-            elif row.year == last_year:
-                last_year_data.append(float(row.total_amount))
-        
-        return {
-            "months": months,
-            "series": [
-                {
-                    "name": str(last_year),
-                    "data": last_year_data
-                },
-                {
-                    "name": str(current_year),
-                    "data": current_year_data
-                }
-            ]
-        }
+        return run_query(get_connection, _serie_tendencia)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos de tendencia de ventas: {str(e)}")
 
+
+QUERY_VENTAS_CATEGORIA_DETALLE = """
+    SELECT 
+        p.categoria,
+        SUM(s.total) as total_amount
+    FROM 
+        Ventas_diarias s
+    JOIN 
+        Productos p ON s.producto_id = p.id_producto
+    GROUP BY 
+        p.categoria
+    ORDER BY 
+        total_amount DESC
+"""
+
+
+def _ventas_categoria_detalle(rows):
+    categories = []
+    amounts = []
+
+    for row in rows:
+        categories.append(row.categoria)
+        amounts.append(float(row.total_amount))
+
+    return {
+        "categories": categories,
+        "series": [{
+            "name": "Ventas",
+            "data": amounts
+        }]
+    }
+
+
 # # Endpoint para ventas por categoría (para el gráfico de barras)
 @app.get("/ventas/categoria/detalle")
+@cache.cached_json(ttl=300, tags=("ventas", "productos"))
 def get_category_sales_detail():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        query = """
-        SELECT 
-            p.categoria,
-            SUM(s.total) as total_amount
-        FROM 
-            Ventas s
-        JOIN 
-            Productos p ON s.producto_id = p.id_producto
-        GROUP BY 
-            p.categoria
-        ORDER BY 
-            total_amount DESC
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        categories = []
-        amounts = []
-        
-        for row in rows:
-            categories.append(row.categoria)
-            amounts.append(float(row.total_amount))
-        
-        return {
-            "categories": categories,
-            "series": [{
-                "name": "Ventas",
-                "data": amounts
-            }]
-        }
+        return run_query(get_connection, QUERY_VENTAS_CATEGORIA_DETALLE, _ventas_categoria_detalle)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener datos detallados de ventas por categoría: {str(e)}")
+
+
+# Widgets del panel de administración: nombre -> (consulta, forma del resultado); las series
+# de ventas son funciones que preparan (sql, parámetros, forma) en cada ejecución
+DASHBOARD_WIDGETS = {
+    "ventas_mensual": (_serie_ventas_mensual, None),
+    "ventas_ultimo_mes": (_serie_ventas_ultimo_mes, None),
+    "pedidos_ultimo_mes": (_serie_pedidos_ultimo_mes, None),
+    "poco_stock": (None, _poco_stock),
+    "usuarios_ultimo_mes": (QUERY_USUARIOS_ULTIMO_MES, _usuarios_ultimo_mes),
+    "mas_vendidos": (_consulta_mas_vendidos, None),
+    "pedidos_recientes": (QUERY_PEDIDOS_RECIENTES, _pedidos_recientes),
+    "ventas_categorias": (QUERY_VENTAS_CATEGORIAS, _ventas_categorias),
+    "ventas_categoria_detalle": (QUERY_VENTAS_CATEGORIA_DETALLE, _ventas_categoria_detalle),
+    "tendencia": (_serie_tendencia, None),
+}
+
+
+@app.get("/dashboard/resumen")
+@cache.cached_json(ttl=300, tags=("pedidos", "productos", "usuarios", "ventas"))
+def get_dashboard(widgets: List[str] | None = Query(None)):
+    # Todos los widgets (o los pedidos en ?widgets=a&widgets=b) en un único lote de consultas
+    nombres = [n for w in widgets or DASHBOARD_WIDGETS for n in w.split(",") if n]
+    desconocidos = [n for n in nombres if n not in DASHBOARD_WIDGETS]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Widgets desconocidos: {', '.join(desconocidos)}")
+    try:
+        return run_batch(get_connection, [
+            (nombre, *DASHBOARD_WIDGETS[nombre]) for nombre in dict.fromkeys(nombres)
+        ])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al obtener datos detallados de ventas por categoría: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error al obtener el resumen del panel: {str(e)}")
+
+
+# Etiquetas de caché de las que depende cada widget: cuando una escritura las
+# invalida, el widget se recalcula y se envía a los suscriptores de /eventos
+WIDGET_TAGS = {
+    "ventas_mensual": ("ventas",),
+    "ventas_ultimo_mes": ("ventas",),
+    "pedidos_ultimo_mes": ("ventas",),
+    "poco_stock": ("productos",),
+    "usuarios_ultimo_mes": ("usuarios",),
+    "mas_vendidos": ("pedidos", "productos"),
+    "pedidos_recientes": ("pedidos", "usuarios"),
+    "ventas_categorias": ("ventas", "productos"),
+    "ventas_categoria_detalle": ("ventas", "productos"),
+    "tendencia": ("ventas",),
+}
+
+
+async def _cargar_widgets(nombres):
+    # Pasa por get_dashboard para compartir caché y agrupación con /dashboard/resumen
+    return await db_executor.run(get_dashboard.contenido, widgets=nombres)
+
+
+broadcaster = Broadcaster(_cargar_widgets, WIDGET_TAGS)
+cache.add_listener(broadcaster.notify)
+
+
+@app.on_event("startup")
+async def start_broadcaster():
+    broadcaster.start()
+
+
+@app.on_event("shutdown")
+async def stop_broadcaster():
+    await broadcaster.stop()
+
+
+@app.get("/sistema/eventos")
+def get_eventos_stats():
+    return broadcaster.stats()
+
+
+@app.get("/eventos")
+async def get_eventos(widgets: List[str] | None = Query(None)):
+    # Server-Sent Events: un evento "cambios" con las tablas modificadas y los widgets recalculados
+    nombres = [n for w in widgets or () for n in w.split(",") if n]
+    desconocidos = [n for n in nombres if n not in WIDGET_TAGS]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Widgets desconocidos: {', '.join(desconocidos)}")
+    if broadcaster.lleno():
+        raise HTTPException(status_code=503, detail="Demasiados suscriptores a /eventos")
+    return StreamingResponse(
+        broadcaster.eventos(nombres),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
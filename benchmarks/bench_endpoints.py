@@ -0,0 +1,346 @@
+"""Latencia y rendimiento de los endpoints contra una base de datos local sembrada.
+
+Uso:
+    python -m benchmarks.bench_endpoints [--app api|main] [--concurrencia 1,8,32]
+        [--peticiones 200] [--latencia-ms 1.0] [--endpoints productos,pedido,...]
+        [--sin-cache] [--salida resultados.json] [--comparar anterior.json]
+
+Arranca la aplicación con uvicorn en un puerto local sobre el stand-in sqlite
+(sin SQL Server), la siembra con datos deterministas y lanza las peticiones
+desde hilos con conexiones keep-alive. Por endpoint y nivel de concurrencia se
+miden percentiles de latencia, peticiones por segundo y errores. Con --salida
+se guarda el resultado en JSON y con --comparar se muestran las diferencias
+respecto a otra ejecución.
+"""
+import argparse
+import datetime
+import http.client
+import importlib
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+
+import ventas_diarias
+from benchmarks.standin import StandInDatabase, create_schema
+
+# nombre -> (método, ruta); {producto}, {pedido} y {usuarios} se rellenan en cada petición
+ESCENARIOS = {
+    "productos": ("GET", "/productos?limit=100"),
+    "producto": ("GET", "/productos/{producto}"),
+    "pedidos": ("GET", "/pedidos?limit=100"),
+    "pedido": ("GET", "/pedidos/{pedido}"),
+    "usuarios": ("GET", "{usuarios}?limit=100"),
+    "pedidos_recientes": ("GET", "/pedidos/recientes"),
+    "mas_vendidos": ("GET", "/productos/mas_vendidos"),
+    "poco_stock": ("GET", "/productos/poco_stock"),
+    "ventas_mensual": ("GET", "/ventas/mensual"),
+    "ventas_categorias": ("GET", "/ventas/categorias"),
+    "dashboard": ("GET", "/dashboard/resumen"),
+    "crear_pedido": ("POST", "/pedidos"),
+}
+
+CATEGORIAS = ("Portátiles", "Móviles", "Audio", "Accesorios", "Monitores", "Componentes")
+ESTADOS = ("pendiente", "pagado", "enviado", "entregado", "cancelado")
+
+
+def sembrar(db, productos, usuarios, pedidos, semilla=42):
+    """Rellena el stand-in con un catálogo, usuarios y un año de pedidos."""
+    rng = random.Random(semilla)
+    ahora = datetime.datetime.now().replace(microsecond=0)
+
+    db.executemany(
+        "INSERT INTO Productos (nombre, descripcion, categoria, marca, tipo, precio, unidades, foto) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+        [(f"Producto {i}", f"Descripción del producto {i}", rng.choice(CATEGORIAS), f"Marca {i % 40}",
+          "fisico", round(rng.uniform(5, 1500), 2), rng.randint(0, 1000000))
+         for i in range(1, productos + 1)],
+    )
+    filas_usuarios = [
+        (f"Usuario {i}", f"usuario{i}@example.com", "admin" if i % 50 == 0 else "cliente", "x",
+         (ahora - datetime.timedelta(days=rng.randint(0, 30))).isoformat(" "), "activo",
+         (ahora - datetime.timedelta(days=rng.randint(0, 730))).isoformat(" "))
+        for i in range(1, usuarios + 1)
+    ]
+    for tabla, columnas in (("users", "name, email, role, password, ultima_sesion, estado, created_at"),
+                            ("Usuarios", "nombre_completo, email, rol, contrasena, ultima_sesion, estado, fecha_alta")):
+        db.executemany(f"INSERT INTO {tabla} ({columnas}) VALUES (?, ?, ?, ?, ?, ?, ?)", filas_usuarios)
+
+    filas_pedidos, filas_lineas, filas_ventas = [], [], []
+    for pedido_id in range(1, pedidos + 1):
+        fecha = (ahora - datetime.timedelta(minutes=rng.randint(0, 365 * 24 * 60))).isoformat(" ")
+        total = 0.0
+        for _ in range(rng.randint(1, 5)):
+            producto_id = rng.randint(1, productos)
+            cantidad = rng.randint(1, 4)
+            precio = round(rng.uniform(5, 1500), 2)
+            total += cantidad * precio
+            filas_lineas.append((pedido_id, producto_id, cantidad, precio))
+            filas_ventas.append((producto_id, fecha, cantidad, round(cantidad * precio, 2)))
+        filas_pedidos.append((rng.randint(1, usuarios), fecha, rng.choice(ESTADOS), "Calle Mayor 1",
+                              "Madrid", "España", "28001", "tarjeta", round(total, 2)))
+    db.executemany(
+        "INSERT INTO Pedidos (id_usuario, fecha_pedido, estado, direccion, ciudad, pais, codigo_postal, "
+        "metodo_pago, cantidad_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        filas_pedidos,
+    )
+    db.executemany("INSERT INTO Linea_pedidos (id_orden, id_producto, cantidad, precio) VALUES (?, ?, ?, ?)",
+                   filas_lineas)
+    db.executemany("INSERT INTO Ventas (producto_id, fecha_venta, cantidad, total) VALUES (?, ?, ?, ?)",
+                   filas_ventas)
+    ventas_diarias.reconstruir(db.connect())
+
+
+def cuerpo_pedido(rng, productos, usuarios):
+    lineas = [
+        {"id_producto": rng.randint(1, productos), "cantidad": 1, "precio": 10.0}
+        for _ in range(rng.randint(1, 5))
+    ]
+    return {
+        "id_usuario": rng.randint(1, usuarios),
+        "fecha_pedido": datetime.date.today().isoformat(),
+        "estado": "pendiente",
+        "direccion": "Calle Mayor 1",
+        "ciudad": "Madrid",
+        "pais": "España",
+        "codigo_postal": "28001",
+        "metodo_pago": "tarjeta",
+        "cantidad_total": 10.0 * len(lineas),
+        "lineas": lineas,
+    }
+
+
+def percentil(valores, p):
+    # Percentil por rango más cercano sobre la lista ya ordenada
+    if not valores:
+        return 0.0
+    indice = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[indice]
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Servidor:
+    """uvicorn en un hilo aparte, con los eventos de arranque y parada de la app."""
+
+    def __init__(self, app, puerto):
+        self.puerto = puerto
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=puerto, log_level="warning", access_log=False, lifespan="on",
+        ))
+        self._hilo = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        while not self._server.started:
+            if not self._hilo.is_alive():
+                raise RuntimeError("uvicorn no ha podido arrancar")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._server.should_exit = True
+        self._hilo.join()
+        return False
+
+
+def medir(puerto, metodo, ruta, concurrencia, peticiones, contexto, semilla):
+    """Lanza `peticiones` repartidas entre `concurrencia` hilos y devuelve las métricas."""
+    reparto = [peticiones // concurrencia + (1 if i < peticiones % concurrencia else 0)
+               for i in range(concurrencia)]
+
+    def trabajador(indice, cuantas):
+        rng = random.Random(semilla * 1000 + indice)
+        conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+        tiempos, errores = [], 0
+        try:
+            for _ in range(cuantas):
+                url = ruta.format(
+                    producto=rng.randint(1, contexto["productos"]),
+                    pedido=rng.randint(1, contexto["pedidos"]),
+                    usuarios=contexto["ruta_usuarios"],
+                )
+                body, headers = None, {}
+                if metodo == "POST":
+                    body = json.dumps(cuerpo_pedido(rng, contexto["productos"], contexto["usuarios"]))
+                    headers["Content-Type"] = "application/json"
+                inicio = time.perf_counter()
+                try:
+                    conn.request(metodo, url, body=body, headers=headers)
+                    respuesta = conn.getresponse()
+                    respuesta.read()
+                    if respuesta.status >= 400:
+                        errores += 1
+                except (OSError, http.client.HTTPException):
+                    errores += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+                tiempos.append(time.perf_counter() - inicio)
+        finally:
+            conn.close()
+        return tiempos, errores
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        resultados = list(executor.map(trabajador, range(concurrencia), reparto))
+    duracion = time.perf_counter() - inicio
+
+    tiempos = sorted(t * 1000 for parcial, _ in resultados for t in parcial)
+    return {
+        "peticiones": len(tiempos),
+        "errores": sum(errores for _, errores in resultados),
+        "duracion_s": round(duracion, 4),
+        "rps": round(len(tiempos) / duracion, 2) if duracion else 0.0,
+        "ms": {
+            "media": round(statistics.fmean(tiempos), 3) if tiempos else 0.0,
+            "p50": round(percentil(tiempos, 50), 3),
+            "p90": round(percentil(tiempos, 90), 3),
+            "p95": round(percentil(tiempos, 95), 3),
+            "p99": round(percentil(tiempos, 99), 3),
+            "max": round(tiempos[-1], 3) if tiempos else 0.0,
+        },
+    }
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(resultados, anterior):
+    previos = {(r["endpoint"], r["concurrencia"]): r for r in anterior["resultados"]}
+    print()
+    print(f"comparación con {anterior['meta'].get('commit') or 'ejecución anterior'} "
+          f"({anterior['meta'].get('fecha', '?')})")
+    print(f"{'endpoint':>18} {'conc':>5} {'p50 ms':>18} {'p95 ms':>18} {'rps':>20}")
+
+    def delta(antes, ahora):
+        cambio = (ahora - antes) / antes * 100 if antes else 0.0
+        return f"{antes:.1f}->{ahora:.1f} ({cambio:+.0f}%)"
+
+    for r in resultados:
+        previo = previos.get((r["endpoint"], r["concurrencia"]))
+        if previo is None:
+            continue
+        print(f"{r['endpoint']:>18} {r['concurrencia']:>5} "
+              f"{delta(previo['ms']['p50'], r['ms']['p50']):>18} "
+              f"{delta(previo['ms']['p95'], r['ms']['p95']):>18} "
+              f"{delta(previo['rps'], r['rps']):>20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="api", choices=["api", "main"])
+    parser.add_argument("--concurrencia", default="1,8,32",
+                        help="niveles de concurrencia separados por comas")
+    parser.add_argument("--peticiones", type=int, default=200,
+                        help="peticiones por endpoint y nivel de concurrencia")
+    parser.add_argument("--calentamiento", type=int, default=10)
+    parser.add_argument("--latencia-ms", type=float, default=1.0,
+                        help="retardo simulado por viaje a la base de datos")
+    parser.add_argument("--endpoints", help="escenarios a medir separados por comas (por defecto todos)")
+    parser.add_argument("--productos", type=int, default=2000)
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--pedidos", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="desactiva la caché de respuestas para medir siempre la consulta")
+    parser.add_argument("--salida", help="fichero JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="fichero JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    niveles = [int(n) for n in args.concurrencia.split(",") if n.strip()]
+    nombres = [n.strip() for n in args.endpoints.split(",")] if args.endpoints else list(ESCENARIOS)
+    desconocidos = [n for n in nombres if n not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"escenarios desconocidos: {', '.join(desconocidos)}")
+
+    app_module = importlib.import_module(args.app)
+    if not hasattr(app_module, "crear_pedido") and "crear_pedido" in nombres:
+        # main.py no expone POST /pedidos
+        nombres.remove("crear_pedido")
+
+    # En fichero y con WAL: la base en memoria compartida bloquea la tabla entera
+    # y las escrituras concurrentes fallarían en lugar de esperar
+    directorio = tempfile.TemporaryDirectory()
+    db = StandInDatabase(os.path.join(directorio.name, "bench.db"), latency=args.latencia_ms / 1000)
+    db.executescript("PRAGMA journal_mode=WAL;")
+    create_schema(db)
+    sembrar(db, args.productos, args.usuarios, args.pedidos, args.semilla)
+    app_module.pool.connect = db.connect
+    if args.sin_cache:
+        app_module.cache.max_entries = 0
+
+    contexto = {
+        "productos": args.productos,
+        "usuarios": args.usuarios,
+        "pedidos": args.pedidos,
+        "ruta_usuarios": "/users" if args.app == "api" else "/usuarios",
+    }
+
+    resultados = []
+    print(f"app={args.app} latencia simulada={args.latencia_ms} ms peticiones={args.peticiones} "
+          f"cache={'no' if args.sin_cache else 'si'}")
+    print(f"{'endpoint':>18} {'conc':>5} {'rps':>9} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} "
+          f"{'max':>8} {'errores':>8}")
+    with Servidor(app_module.app, puerto_libre()) as servidor:
+        for nombre in nombres:
+            metodo, ruta = ESCENARIOS[nombre]
+            if args.calentamiento:
+                medir(servidor.puerto, metodo, ruta, 1, args.calentamiento, contexto, args.semilla)
+            for concurrencia in niveles:
+                r = medir(servidor.puerto, metodo, ruta, concurrencia, args.peticiones, contexto, args.semilla)
+                r = {"endpoint": nombre, "metodo": metodo, "ruta": ruta, "concurrencia": concurrencia, **r}
+                resultados.append(r)
+                ms = r["ms"]
+                print(f"{nombre:>18} {concurrencia:>5} {r['rps']:>9.1f} {ms['p50']:>8.2f} {ms['p90']:>8.2f} "
+                      f"{ms['p95']:>8.2f} {ms['p99']:>8.2f} {ms['max']:>8.2f} {r['errores']:>8}")
+
+    salida = {
+        "meta": {
+            "app": args.app,
+            "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit_actual(),
+            "python": platform.python_version(),
+            "latencia_ms": args.latencia_ms,
+            "peticiones": args.peticiones,
+            "concurrencia": niveles,
+            "cache": not args.sin_cache,
+            "datos": {
+                "productos": args.productos,
+                "usuarios": args.usuarios,
+                "pedidos": args.pedidos,
+                "semilla": args.semilla,
+            },
+        },
+        "resultados": resultados,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(salida, f, ensure_ascii=False, indent=2)
+        print(f"resultados guardados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultados, json.load(f))
+    app_module.pool.close()
+    directorio.cleanup()
+
+
+if __name__ == "__main__":
+    main()
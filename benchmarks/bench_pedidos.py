@@ -0,0 +1,109 @@
+"""Compara la creación de pedidos línea a línea con la escritura en bloque.
+
+Uso:
+    python -m benchmarks.bench_pedidos [--latencia-ms 1.0] [--repeticiones 5]
+
+Cada viaje al servidor suma la latencia indicada, para que el coste de red del
+camino línea a línea se vea igual que contra SQL Server.
+"""
+import argparse
+import datetime
+import statistics
+import time
+
+import api
+from benchmarks.standin import StandInDatabase, create_schema
+
+LINEAS = (1, 50, 500)
+
+
+def pedido_por_lineas(pedido):
+    # Implementación anterior: cuatro viajes por línea
+    with api.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO Pedidos (id_usuario, fecha_pedido, estado, direccion,
+                               ciudad, pais, codigo_postal, metodo_pago, cantidad_total)
+            OUTPUT INSERTED.id
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (pedido.id_usuario, datetime.datetime.now(), pedido.estado, pedido.direccion,
+              pedido.ciudad, pedido.pais, pedido.codigo_postal, pedido.metodo_pago,
+              pedido.cantidad_total))
+        pedido_id = cursor.fetchone()[0]
+        for linea in pedido.lineas:
+            cursor.execute("""
+                INSERT INTO Ventas (producto_id, fecha_venta, cantidad, total)
+                OUTPUT INSERTED.id
+                VALUES (?, ?, ?, ?)
+            """, (linea.id_producto, datetime.datetime.now(), linea.cantidad,
+                  linea.cantidad * linea.precio))
+            cursor.fetchone()
+            cursor.execute("""
+                INSERT INTO Linea_pedidos (id_orden, id_producto, cantidad, precio)
+                VALUES (?, ?, ?, ?)
+            """, (pedido_id, linea.id_producto, linea.cantidad, linea.precio))
+            cursor.execute("""
+                UPDATE Productos SET unidades = unidades - ? WHERE id_producto = ?
+            """, (linea.cantidad, linea.id_producto))
+        conn.commit()
+    return pedido_id
+
+
+def crear_pedido(num_lineas, num_productos):
+    return api.Pedido(
+        id_usuario=1,
+        fecha_pedido=datetime.date.today().isoformat(),
+        estado="pendiente",
+        direccion="Calle Mayor 1",
+        ciudad="Madrid",
+        pais="España",
+        codigo_postal="28001",
+        metodo_pago="tarjeta",
+        cantidad_total=num_lineas * 10.0,
+        lineas=[
+            api.LineaPedido(id_producto=i % num_productos + 1, cantidad=1, precio=10.0)
+            for i in range(num_lineas)
+        ],
+    )
+
+
+def medir(db, funcion, pedido, repeticiones):
+    tiempos = []
+    viajes = []
+    for _ in range(repeticiones):
+        antes = db.round_trips
+        inicio = time.perf_counter()
+        funcion(pedido)
+        tiempos.append(time.perf_counter() - inicio)
+        viajes.append(db.round_trips - antes)
+    return statistics.median(tiempos) * 1000, statistics.median(viajes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latencia-ms", type=float, default=1.0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    db = StandInDatabase(latency=args.latencia_ms / 1000)
+    create_schema(db)
+    num_productos = max(LINEAS)
+    db.executescript("".join(
+        f"INSERT INTO Productos (nombre, descripcion, categoria, marca, tipo, precio, unidades) "
+        f"VALUES ('p{i}', '', 'c{i % 10}', 'm', 't', 10.0, 1000000);"
+        for i in range(num_productos)
+    ))
+    api.pool.connect = db.connect
+
+    print(f"latencia simulada por viaje: {args.latencia_ms} ms")
+    print(f"{'lineas':>7} {'camino':>12} {'ms (mediana)':>14} {'viajes':>8}")
+    for num_lineas in LINEAS:
+        pedido = crear_pedido(num_lineas, num_productos)
+        for nombre, funcion in (("por lineas", pedido_por_lineas), ("en bloque", api._insertar_pedido)):
+            ms, viajes = medir(db, funcion, pedido, args.repeticiones)
+            print(f"{num_lineas:>7} {nombre:>12} {ms:>14.2f} {viajes:>8}")
+    api.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Coste de CPU por fila al serializar listados grandes, antes y después de row_mapper.
+
+Uso:
+    python -m benchmarks.bench_serializacion [--filas 100000] [--repeticiones 3]
+
+Las filas se leen una vez del stand-in y después solo se mide la CPU de
+convertirlas en la respuesta JSON:
+
+- antes: dict por fila con acceso por atributo, float()/strftime() fila a fila,
+  validación contra el response_model con pydantic y codificación a JSON (lo
+  que hacía FastAPI al devolver la lista desde el handler).
+- después: row_mapper precompilado desde cursor.description y FastJSONResponse.
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+
+import main as aplicacion
+from benchmarks.standin import StandInDatabase, create_schema
+from serializacion import FastJSONResponse, map_rows, orjson
+
+
+def producto_antes(row):
+    return {
+        "id_producto": row.id_producto,
+        "nombre": row.nombre,
+        "descripcion": row.descripcion,
+        "categoria": row.categoria,
+        "marca": row.marca,
+        "tipo": row.tipo,
+        "precio": float(row.precio),
+        "unidades": row.unidades,
+        "foto": aplicacion.foto_url(row.id_producto, row.foto_hash),
+    }
+
+
+def usuario_antes(row):
+    last_login_str = None
+    if row.ultima_sesion:
+        if isinstance(row.ultima_sesion, datetime.datetime):
+            last_login_str = row.ultima_sesion.strftime('%Y-%m-%d')
+        else:
+            last_login_str = str(row.ultima_sesion)
+    return {
+        "id": row.id,
+        "nombre_completo": row.nombre_completo,
+        "email": row.email,
+        "rol": row.rol,
+        "ultima_sesion": last_login_str,
+        "estado": row.estado,
+    }
+
+
+def sembrar(db, filas):
+    rng = random.Random(1)
+    ahora = datetime.datetime.now().replace(microsecond=0)
+    db.executemany(
+        "INSERT INTO Productos (nombre, descripcion, categoria, marca, tipo, precio, unidades, foto) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"Producto {i}", f"Descripción del producto {i}", f"Categoría {i % 12}", f"Marca {i % 40}",
+          "fisico", round(rng.uniform(5, 1500), 2), rng.randint(0, 500),
+          "data:image/png;base64,AAAA" if i % 3 == 0 else None)
+         for i in range(filas)],
+    )
+    db.executemany(
+        "INSERT INTO Usuarios (nombre_completo, email, rol, contrasena, ultima_sesion, estado, fecha_alta) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"Usuario {i}", f"usuario{i}@example.com", "cliente", "x",
+          (ahora - datetime.timedelta(minutes=rng.randint(0, 100000))).isoformat(" "), "activo",
+          ahora.isoformat(" "))
+         for i in range(filas)],
+    )
+
+
+def leer(db, query):
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return cursor, cursor.fetchall()
+
+
+def cpu(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        cuerpo = funcion()
+        tiempos.append(time.process_time() - inicio)
+    return statistics.median(tiempos), len(cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    db = StandInDatabase()
+    create_schema(db)
+    sembrar(db, args.filas)
+
+    casos = []
+    cursor, rows = leer(db, f"SELECT {aplicacion.COLUMNAS_LISTADO} FROM Productos ORDER BY id_producto")
+    modelo = TypeAdapter(List[aplicacion.Producto])
+    casos.append((
+        "productos",
+        lambda: modelo.dump_json(modelo.validate_python([producto_antes(row) for row in rows])),
+        lambda: FastJSONResponse(map_rows(cursor, rows, aplicacion.CAMPOS_PRODUCTO)).body,
+    ))
+    cursor_u, rows_u = leer(db, "SELECT id, nombre_completo, email, rol, ultima_sesion, estado FROM Usuarios ORDER BY id")
+    modelo_u = TypeAdapter(List[aplicacion.Users])
+    casos.append((
+        "usuarios",
+        lambda: modelo_u.dump_json(modelo_u.validate_python([usuario_antes(row) for row in rows_u])),
+        lambda: FastJSONResponse(map_rows(cursor_u, rows_u, aplicacion.CAMPOS_USUARIO)).body,
+    ))
+
+    print(f"filas: {args.filas}  codificador: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'listado':>10} {'camino':>8} {'CPU total s':>12} {'us/fila':>9} {'bytes':>11}")
+    for nombre, antes, despues in casos:
+        resultados = {}
+        for camino, funcion in (("antes", antes), ("despues", despues)):
+            segundos, tamano = cpu(funcion, args.repeticiones)
+            resultados[camino] = segundos
+            print(f"{nombre:>10} {camino:>8} {segundos:>12.3f} {segundos / args.filas * 1e6:>9.2f} {tamano:>11}")
+        print(f"{nombre:>10} {'x':>8} {resultados['antes'] / resultados['despues']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Base de datos local que imita la interfaz de pyodbc sobre sqlite3.
+
+Sirve para medir la API sin un SQL Server remoto. Traduce el T-SQL que usan
+api.py y main.py (TOP, OUTPUT INSERTED, GETDATE, DATEADD, FORMAT...) y permite
+simular la latencia de red sumando un retardo por cada viaje al servidor.
+"""
+import datetime
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import migraciones
+
+
+class Row(tuple):
+    # Fila con acceso por atributo, como pyodbc.Row
+
+    def __new__(cls, values, columns):
+        row = super().__new__(cls, values)
+        row._columns = columns
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._columns[name]]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def _to_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    return datetime.datetime.fromisoformat(str(value))
+
+
+def _fmt(value):
+    return value.isoformat(sep=" ") if value is not None else None
+
+
+def _dateadd(part, amount, value):
+    value = _to_datetime(value)
+    if value is None:
+        return None
+    part = part.upper()
+    if part in ("YEAR", "YY", "YYYY"):
+        part, amount = "MONTH", amount * 12
+    if part in ("MONTH", "MM", "M"):
+        month = value.month - 1 + amount
+        year = value.year + month // 12
+        month = month % 12 + 1
+        day = min(value.day, [31, 29 if year % 4 == 0 and (year % 100 or year % 400 == 0) else 28,
+                              31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
+        return _fmt(value.replace(year=year, month=month, day=day))
+    if part in ("WEEK", "WK", "WW"):
+        return _fmt(value + datetime.timedelta(weeks=amount))
+    if part in ("DAY", "DD", "D"):
+        return _fmt(value + datetime.timedelta(days=amount))
+    if part in ("HOUR", "HH"):
+        return _fmt(value + datetime.timedelta(hours=amount))
+    raise ValueError(f"DATEADD no soportado para {part}")
+
+
+def _format(value, pattern):
+    value = _to_datetime(value)
+    if value is None:
+        return None
+    if pattern == "MMM":
+        return value.strftime("%b")
+    return value.strftime(pattern.replace("yyyy", "%Y").replace("MM", "%m").replace("dd", "%d"))
+
+
+def _binary_checksum(*values):
+    # Equivalente aproximado: basta con que cambie cuando cambia alguna columna
+    return zlib.crc32(repr(values).encode()) - 2 ** 31
+
+
+def _hashbytes(algorithm, value):
+    # Como en SQL Server con una columna NVARCHAR: hash de los bytes UTF-16LE
+    if value is None:
+        return None
+    return hashlib.new(algorithm.replace("SHA2_", "sha").lower(), value.encode("utf-16-le")).digest()
+
+
+class _ChecksumAgg:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= value
+
+    def finalize(self):
+        return self.value
+
+
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("DATE", lambda raw: datetime.date.fromisoformat(raw.decode()[:10]))
+
+
+def _register_functions(conn):
+    conn.create_function("GETDATE", 0, lambda: _fmt(datetime.datetime.now()))
+    conn.create_function("SYSDATETIME", 0, lambda: _fmt(datetime.datetime.now()))
+    conn.create_function("DATEADD", 3, _dateadd)
+    conn.create_function("DATEFROMPARTS", 3, lambda y, m, d: datetime.date(y, m, d).isoformat())
+    conn.create_function("YEAR", 1, lambda v: _to_datetime(v).year if v is not None else None)
+    conn.create_function("MONTH", 1, lambda v: _to_datetime(v).month if v is not None else None)
+    conn.create_function("DAY", 1, lambda v: _to_datetime(v).day if v is not None else None)
+    conn.create_function("FORMAT", 2, _format)
+    conn.create_function("BINARY_CHECKSUM", -1, _binary_checksum)
+    conn.create_function("HASHBYTES", 2, _hashbytes)
+    conn.create_aggregate("CHECKSUM_AGG", 1, _ChecksumAgg)
+
+
+_MERGE = re.compile(
+    r"^MERGE\s+(\w+)(?:\s+WITH\s*\(HOLDLOCK\))?\s+AS\s+(\w+)\s+"
+    r"USING\s*\(SELECT\s+(.*?)\)\s*AS\s+(\w+)\s+ON\s+(.*?)\s+"
+    r"WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(.*?)\s+"
+    r"WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT.*$",
+    re.I | re.S,
+)
+
+
+def _translate_merge(match):
+    # MERGE ... USING (SELECT ? AS a, ...) -> INSERT ... ON CONFLICT DO UPDATE
+    table, target, source, alias, on, updates = match.groups()
+    columns = re.findall(r"AS\s+(\w+)", source, re.I)
+    keys = re.findall(rf"{target}\.(\w+)\s*=\s*{alias}\.\1", on)
+    updates = re.sub(rf"\b{target}\.(\w+)", r"\1", updates)
+    updates = re.sub(rf"\b{alias}\.(\w+)", r"excluded.\1", updates)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+
+
+_CREATE_IF_MISSING = re.compile(r"IF\s+OBJECT_ID\([^)]*\)\s+IS\s+NULL\s+CREATE\s+TABLE", re.I)
+_CAST_DATE = re.compile(r"CAST\(\s*(\w+)\s+AS\s+DATE\s*\)", re.I)
+_NOCOUNT = re.compile(r"^\s*SET\s+NOCOUNT\s+ON\s*$", re.I)
+_TOP = re.compile(r"^(\s*SELECT\s+)TOP\s*\(?\s*(\d+|\?)\s*\)?\s", re.I)
+_OUTPUT = re.compile(r"\s+OUTPUT\s+(INSERTED\.\w+(?:\s*,\s*INSERTED\.\w+)*)", re.I)
+_INSERTED = re.compile(r"INSERTED\.", re.I)
+_DATEPART = re.compile(r"DATEADD\(\s*(\w+)\s*,", re.I)
+_COUNT_BIG = re.compile(r"\bCOUNT_BIG\(", re.I)
+_TABLE_HINTS = re.compile(r"\s+WITH\s*\(\s*(?:UPDLOCK|HOLDLOCK|ROWLOCK|XLOCK|NOLOCK)(?:\s*,\s*\w+)*\s*\)", re.I)
+
+
+def translate(sql):
+    # Traducción mínima del T-SQL de la API al dialecto de sqlite
+    sql = sql.strip().rstrip(";")
+    merge = _MERGE.match(sql)
+    if merge:
+        return _translate_merge(merge)
+    sql = _CREATE_IF_MISSING.sub("CREATE TABLE IF NOT EXISTS", sql)
+    sql = _CAST_DATE.sub(r"DATE(\1)", sql)
+    top = _TOP.match(sql)
+    if top:
+        sql = top.group(1) + sql[top.end():] + f" LIMIT {top.group(2)}"
+    output = _OUTPUT.search(sql)
+    if output:
+        sql = sql[:output.start()] + sql[output.end():] + f" RETURNING {_INSERTED.sub('', output.group(1))}"
+    sql = _DATEPART.sub(lambda m: f"DATEADD('{m.group(1)}',", sql)
+    sql = _COUNT_BIG.sub("COUNT(", sql)
+    # sqlite bloquea la base entera al escribir: las pistas de bloqueo sobran
+    sql = _TABLE_HINTS.sub("", sql)
+    return sql
+
+
+class Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn._sqlite.cursor()
+        self.fast_executemany = False
+        self.description = None
+        self.rowcount = -1
+        self._columns = {}
+        self._pending = []
+
+    def _round_trip(self):
+        self._conn.round_trips += 1
+        if self._conn.latency:
+            time.sleep(self._conn.latency)
+
+    def _bind(self, params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        return [
+            _fmt(p) if isinstance(p, datetime.datetime)
+            else p.isoformat() if isinstance(p, datetime.date)
+            else p
+            for p in params
+        ]
+
+    def _after(self):
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        self._columns = {d[0]: i for i, d in enumerate(self.description or ())}
+
+    def execute(self, sql, *params):
+        self._round_trip()
+        params = self._bind(params)
+        statements = [st for st in sql.split(";") if st.strip()] if ";" in sql else [sql]
+        statements = [st for st in statements if not _NOCOUNT.match(st)]
+        # Los lotes con varias consultas se ejecutan de una en una y nextset() avanza
+        # al siguiente resultado, como con varios conjuntos de resultados en SQL Server
+        self._pending = []
+        for statement in statements:
+            count = statement.count("?")
+            self._pending.append((translate(statement), params[:count]))
+            params = params[count:]
+        self._next_statement()
+        return self
+
+    def _next_statement(self):
+        sql, params = self._pending.pop(0)
+        self._cursor.execute(sql, params)
+        self._after()
+
+    def nextset(self):
+        if not self._pending:
+            return False
+        self._next_statement()
+        return True
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = [self._bind((p,)) for p in seq_of_params]
+        if not seq_of_params:
+            raise ValueError("The second parameter to executemany must not be empty.")
+        # Con fast_executemany pyodbc envía todos los parámetros en un solo viaje
+        if self.fast_executemany:
+            self._round_trip()
+        else:
+            for _ in seq_of_params:
+                self._round_trip()
+        self._cursor.executemany(translate(sql), seq_of_params)
+        self._after()
+
+    def _wrap(self, values):
+        return Row(values, self._columns)
+
+    def fetchone(self):
+        values = self._cursor.fetchone()
+        return None if values is None else self._wrap(values)
+
+    def fetchmany(self, size=1):
+        return [self._wrap(values) for values in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._wrap(values) for values in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+
+class Connection:
+    def __init__(self, database, latency=0.0):
+        self._sqlite = sqlite3.connect(
+            database, uri=True, check_same_thread=False, isolation_level="DEFERRED", timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        _register_functions(self._sqlite)
+        self.latency = latency
+        self.round_trips = 0
+        self.autocommit = False
+
+    def cursor(self):
+        return Cursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self.round_trips += 1
+        self._sqlite.commit()
+
+    def rollback(self):
+        self._sqlite.rollback()
+
+    def close(self):
+        self._sqlite.close()
+
+
+class StandInDatabase:
+    """Base de datos sqlite compartida entre conexiones (en memoria o en fichero)."""
+
+    def __init__(self, path=None, latency=0.0):
+        self.database = path or f"file:standin_{id(self)}?mode=memory&cache=shared"
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._connections = []
+        # Mantiene viva la base de datos en memoria mientras exista el objeto
+        self._keepalive = self.connect()
+
+    def connect(self, connection_string=None, **kwargs):
+        conn = Connection(self.database, latency=self.latency)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def round_trips(self):
+        with self._lock:
+            return sum(conn.round_trips for conn in self._connections)
+
+    def executescript(self, script):
+        self._keepalive._sqlite.executescript(script)
+
+    def executemany(self, sql, rows):
+        # Carga masiva de datos de prueba (sqlite directo, sin traducir ni contar viajes)
+        self._keepalive._sqlite.executemany(sql, rows)
+        self._keepalive._sqlite.commit()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Productos (
+    id_producto INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT, descripcion TEXT, categoria TEXT, marca TEXT, tipo TEXT,
+    precio REAL, unidades INTEGER, foto TEXT
+);
+CREATE TABLE IF NOT EXISTS Pedidos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_usuario INTEGER, fecha_pedido TIMESTAMP, estado TEXT, direccion TEXT, ciudad TEXT,
+    pais TEXT, codigo_postal TEXT, metodo_pago TEXT, cantidad_total REAL
+);
+CREATE TABLE IF NOT EXISTS Ventas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    producto_id INTEGER, fecha_venta TIMESTAMP, cantidad INTEGER, total REAL
+);
+CREATE TABLE IF NOT EXISTS Linea_pedidos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_orden INTEGER, id_producto INTEGER, cantidad INTEGER, precio REAL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, email TEXT, role TEXT, password TEXT, ultima_sesion TIMESTAMP, estado TEXT,
+    created_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS Usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre_completo TEXT, email TEXT, rol TEXT, contrasena TEXT, ultima_sesion TIMESTAMP, estado TEXT,
+    fecha_alta TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS Ventas_diarias (
+    fecha DATE NOT NULL, producto_id INTEGER NOT NULL, total REAL NOT NULL,
+    num_ventas INTEGER NOT NULL, unidades INTEGER NOT NULL,
+    PRIMARY KEY (fecha, producto_id)
+);
+CREATE TABLE IF NOT EXISTS Ventas_ajustes (
+    fecha DATE NOT NULL, producto_id INTEGER NOT NULL, total REAL NOT NULL, unidades INTEGER NOT NULL,
+    PRIMARY KEY (fecha, producto_id)
+);
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY, nombre TEXT NOT NULL, checksum TEXT NOT NULL, aplicada TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Ventas_fecha_venta ON Ventas (fecha_venta, total, producto_id, cantidad);
+CREATE INDEX IF NOT EXISTS IX_Linea_pedidos_id_orden ON Linea_pedidos (id_orden, id_producto, cantidad, precio);
+CREATE INDEX IF NOT EXISTS IX_Linea_pedidos_id_producto ON Linea_pedidos (id_producto, cantidad, precio);
+CREATE INDEX IF NOT EXISTS IX_Pedidos_fecha_pedido ON Pedidos (fecha_pedido DESC);
+CREATE INDEX IF NOT EXISTS IX_Pedidos_id_usuario ON Pedidos (id_usuario);
+CREATE INDEX IF NOT EXISTS IX_Productos_unidades ON Productos (unidades);
+"""
+
+
+def create_schema(db):
+    # Equivalente en sqlite de las migraciones de migraciones/: se registran como aplicadas
+    db.executescript(SCHEMA)
+    db.executemany(
+        "INSERT OR IGNORE INTO schema_version (version, nombre, checksum, aplicada) VALUES (?, ?, ?, ?)",
+        [(m.version, m.nombre, m.checksum, _fmt(datetime.datetime.now())) for m in migraciones.cargar()],
+    )
@@ -0,0 +1,300 @@
+"""Índice invertido en memoria para /productos/buscar.
+
+Indexa nombre, descripcion, marca y categoria de cada producto. Los textos se
+normalizan igual que las consultas (minúsculas y sin tildes: "cámara" y
+"camara" son el mismo término), así que la búsqueda no depende de la
+colación de SQL Server ni hace un LIKE '%...%' sobre toda la tabla.
+
+Cada palabra de la consulta encaja con un término del índice de tres formas,
+de más a menos puntuación:
+- exacta;
+- por prefijo ("tecl" -> "teclado"), con una búsqueda binaria en la lista
+  ordenada de términos;
+- con erratas: distancia de edición (con transposiciones) de hasta 1 en
+  palabras de 4 a 7 letras y de hasta 2 a partir de 8. Solo se comparan los
+  términos de longitud parecida y el cálculo se corta en cuanto supera el
+  máximo.
+
+Un producto tiene que encajar con todas las palabras de la consulta. La
+puntuación suma, por palabra, la mejor coincidencia multiplicada por el peso
+del campo donde aparece (el nombre pesa más que la descripción), y da un
+extra si el nombre empieza por la consulta completa.
+
+Los endpoints de productos actualizan el índice al escribir (actualizar y
+eliminar). La reconstrucción completa lee el catálogo y monta un índice nuevo
+fuera del lock; las consultas siguen usando el anterior hasta el cambio, y
+los cambios que llegan mientras tanto se repiten sobre el nuevo antes de
+sustituirlo.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+BUSQUEDA_LIMIT = 20
+MAX_PREFIJOS = 200  # términos que se prueban como mucho por prefijo
+
+# Peso de cada campo indexado
+PESOS = {"nombre": 4.0, "marca": 3.0, "categoria": 2.0, "descripcion": 1.0}
+
+# Campos del producto que se guardan para devolverlos en los resultados
+CAMPOS = ("id_producto", "nombre", "descripcion", "categoria", "marca", "tipo", "precio")
+
+EXACTA = 1.0
+PREFIJO = 0.6  # más hasta 0.3 según la parte del término que cubre la palabra
+ERRATA = (None, 0.5, 0.3)  # por distancia de edición
+BONUS_NOMBRE = 2.0
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes ni diacríticos ("Cámara" -> "camara")."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto).casefold())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokens(texto):
+    palabra = []
+    result = []
+    for c in normalizar(texto):
+        if c.isalnum():
+            palabra.append(c)
+        elif palabra:
+            result.append("".join(palabra))
+            palabra = []
+    if palabra:
+        result.append("".join(palabra))
+    return result
+
+
+def max_erratas(palabra):
+    if len(palabra) >= 8:
+        return 2
+    if len(palabra) >= 4:
+        return 1
+    return 0
+
+
+def distancia(a, b, maximo):
+    """Distancia de edición con transposiciones, o maximo + 1 si la supera."""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        minimo = i
+        for j in range(1, len(b) + 1):
+            coste = 0 if a[i - 1] == b[j - 1] else 1
+            valor = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + coste)
+            if anterior2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                valor = min(valor, anterior2[j - 2] + 1)
+            actual[j] = valor
+            minimo = min(minimo, valor)
+        if minimo > maximo:
+            return maximo + 1
+        anterior2, anterior = anterior, actual
+    return anterior[-1] if anterior[-1] <= maximo else maximo + 1
+
+
+def _documento(producto):
+    get = producto.get if isinstance(producto, dict) else lambda campo: getattr(producto, campo, None)
+    doc = {campo: get(campo) for campo in CAMPOS}
+    if doc["precio"] is not None:
+        doc["precio"] = float(doc["precio"])
+    return doc
+
+
+class _Indice:
+    """Índice sin sincronización; ProductSearchIndex lo protege con su lock."""
+
+    def __init__(self):
+        self.docs = {}  # id_producto -> campos del producto
+        self.nombres = {}  # id_producto -> palabras del nombre normalizadas
+        self.terminos_doc = {}  # id_producto -> {término: peso}
+        self.postings = {}  # término -> {id_producto: peso}
+        self.ordenados = []  # términos ordenados, para los prefijos
+        self.por_longitud = {}  # longitud -> términos, para las erratas
+
+    def actualizar(self, producto):
+        doc = _documento(producto)
+        id_producto = doc["id_producto"]
+        self.eliminar(id_producto)
+        terminos = {}
+        for campo, peso in PESOS.items():
+            for termino in tokens(doc[campo]):
+                if peso > terminos.get(termino, 0.0):
+                    terminos[termino] = peso
+        self.docs[id_producto] = doc
+        self.nombres[id_producto] = " ".join(tokens(doc["nombre"]))
+        self.terminos_doc[id_producto] = terminos
+        for termino, peso in terminos.items():
+            posting = self.postings.get(termino)
+            if posting is None:
+                posting = self.postings[termino] = {}
+                insort(self.ordenados, termino)
+                self.por_longitud.setdefault(len(termino), set()).add(termino)
+            posting[id_producto] = peso
+
+    def eliminar(self, id_producto):
+        terminos = self.terminos_doc.pop(id_producto, None)
+        if terminos is None:
+            return False
+        del self.docs[id_producto]
+        del self.nombres[id_producto]
+        for termino in terminos:
+            posting = self.postings[termino]
+            del posting[id_producto]
+            if not posting:
+                del self.postings[termino]
+                del self.ordenados[bisect_left(self.ordenados, termino)]
+                self.por_longitud[len(termino)].discard(termino)
+        return True
+
+    def coincidencias(self, palabra):
+        """{término: factor} de los términos que encajan con `palabra`."""
+        result = {}
+        if palabra in self.postings:
+            result[palabra] = EXACTA
+        i = bisect_left(self.ordenados, palabra)
+        for termino in self.ordenados[i:i + MAX_PREFIJOS]:
+            if not termino.startswith(palabra):
+                break
+            if termino != palabra:
+                result[termino] = PREFIJO + 0.3 * len(palabra) / len(termino)
+        maximo = max_erratas(palabra)
+        for longitud in range(len(palabra) - maximo, len(palabra) + maximo + 1):
+            for termino in self.por_longitud.get(longitud, ()):
+                if termino in result:
+                    continue
+                d = distancia(palabra, termino, maximo)
+                if d <= maximo:
+                    result[termino] = ERRATA[d]
+        return result
+
+    def buscar(self, consulta, limit):
+        palabras = tokens(consulta)
+        if not palabras:
+            return []
+        puntuaciones = None
+        for palabra in dict.fromkeys(palabras):
+            mejores = {}
+            for termino, factor in self.coincidencias(palabra).items():
+                for id_producto, peso in self.postings[termino].items():
+                    valor = factor * peso
+                    if valor > mejores.get(id_producto, 0.0):
+                        mejores[id_producto] = valor
+            if puntuaciones is None:
+                puntuaciones = mejores
+            else:
+                # Todas las palabras tienen que encajar
+                puntuaciones = {i: p + mejores[i] for i, p in puntuaciones.items() if i in mejores}
+            if not puntuaciones:
+                return []
+        frase = " ".join(palabras)
+        for id_producto in puntuaciones:
+            if self.nombres[id_producto].startswith(frase):
+                puntuaciones[id_producto] += BONUS_NOMBRE
+        mejores = heapq.nsmallest(
+            limit, puntuaciones.items(), key=lambda item: (-item[1], self.nombres[item[0]], item[0])
+        )
+        return [{**self.docs[id_producto], "puntuacion": round(p, 3)} for id_producto, p in mejores]
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indice = _Indice()
+        self._listo = False
+        self._pendientes = None  # cambios recibidos durante una reconstrucción
+        self._stats = {
+            "busquedas": 0,
+            "actualizaciones": 0,
+            "reconstrucciones": 0,
+            "reconstruccion_ms": None,
+            "error": None,
+        }
+
+    @property
+    def listo(self):
+        return self._listo
+
+    @property
+    def reconstruyendo(self):
+        return self._pendientes is not None
+
+    def buscar(self, consulta, limit=BUSQUEDA_LIMIT):
+        with self._lock:
+            self._stats["busquedas"] += 1
+            return self._indice.buscar(consulta, limit)
+
+    def actualizar(self, producto):
+        """Añade o sustituye un producto (fila o dict con los campos de CAMPOS)."""
+        with self._lock:
+            self._stats["actualizaciones"] += 1
+            self._indice.actualizar(producto)
+            if self._pendientes is not None:
+                self._pendientes.append(("actualizar", producto))
+
+    def eliminar(self, id_producto):
+        with self._lock:
+            self._stats["actualizaciones"] += 1
+            self._indice.eliminar(id_producto)
+            if self._pendientes is not None:
+                self._pendientes.append(("eliminar", id_producto))
+
+    def reconstruir(self, cargar):
+        """Monta el índice con las filas de `cargar()` sin bloquear las búsquedas.
+
+        Devuelve False si ya había otra reconstrucción en marcha.
+        """
+        with self._lock:
+            if self._pendientes is not None:
+                return False
+            self._pendientes = []
+        start = time.perf_counter()
+        try:
+            nuevo = _Indice()
+            for producto in cargar():
+                nuevo.actualizar(producto)
+        except Exception as e:
+            with self._lock:
+                self._pendientes = None
+                self._stats["error"] = str(e)
+            raise
+        with self._lock:
+            for operacion, argumento in self._pendientes:
+                getattr(nuevo, operacion)(argumento)
+            self._indice = nuevo
+            self._pendientes = None
+            self._listo = True
+            self._stats["reconstrucciones"] += 1
+            self._stats["reconstruccion_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._stats["error"] = None
+        return True
+
+    def reconstruir_en_segundo_plano(self, cargar):
+        """Lanza reconstruir() en un hilo. Devuelve False si ya había una en marcha."""
+        if self.reconstruyendo:
+            return False
+
+        def run():
+            try:
+                self.reconstruir(cargar)
+            except Exception as e:
+                print(f"Error al reconstruir el índice de búsqueda: {str(e)}")
+
+        threading.Thread(target=run, name="indice-busqueda", daemon=True).start()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "listo": self._listo,
+                "reconstruyendo": self._pendientes is not None,
+                "productos": len(self._indice.docs),
+                "terminos": len(self._indice.postings),
+            }
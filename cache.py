@@ -0,0 +1,173 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from serializacion import CachedJSON
+
+
+def _freeze(value):
+    # Las listas de los parámetros de consulta no son hashables
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class _Flight:
+    # Consulta en curso para una clave; los demás llamantes esperan a su resultado
+
+    def __init__(self, tags):
+        self.tags = frozenset(tags)
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+class ResponseCache:
+    """Caché en memoria con caducidad por entrada y tamaño acotado (LRU).
+
+    Cada entrada lleva etiquetas ("ventas", "productos"...) para poder
+    invalidar de golpe todo lo que depende de una tabla cuando se escribe en ella.
+    Los fallos de caché simultáneos para la misma clave se agrupan: solo uno
+    ejecuta la consulta y el resto comparte su resultado.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._listeners = []
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0, "coalesced": 0}
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, _, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, value
+            del self._entries[key]
+            self._stats["expired"] += 1
+        self._stats["misses"] += 1
+        return False, None
+
+    def _set(self, key, value, ttl, tags):
+        self._entries[key] = (time.monotonic() + ttl, frozenset(tags), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            self._set(key, value, ttl, tags)
+
+    def add_listener(self, callback):
+        # callback(*tags) se llama tras cada invalidación (p. ej. para avisar a /eventos)
+        self._listeners.append(callback)
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            keys = [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]
+            for key in keys:
+                del self._entries[key]
+            self._stats["invalidated"] += len(keys)
+            # Una consulta en curso puede haber leído datos anteriores a la escritura:
+            # no se guarda y los siguientes llamantes lanzan una nueva
+            for key, flight in list(self._in_flight.items()):
+                if flight.tags & tags:
+                    flight.stale = True
+                    del self._in_flight[key]
+        for callback in self._listeners:
+            callback(*tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "in_flight": len(self._in_flight),
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def get_or_compute(self, key, compute, ttl, tags=()):
+        """Devuelve la entrada o la calcula, una sola vez por clave aunque haya llamadas simultáneas.
+
+        Quien llega mientras otra llamada calcula la misma clave espera y
+        recibe el mismo resultado (o la misma excepción) sin repetir la consulta.
+        """
+        with self._lock:
+            hit, value = self._get(key)
+            if hit:
+                return value
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight(tags)
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+                if flight.error is None and not flight.stale:
+                    self._set(key, flight.value, ttl, tags)
+            flight.done.set()
+        return flight.value
+
+    def cached(self, ttl, tags=()):
+        """Decorador para handlers de solo lectura; la clave son la función y sus argumentos."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (func, _freeze(args), _freeze(sorted(kwargs.items())))
+                return self.get_or_compute(key, lambda: func(*args, **kwargs), ttl, tags)
+            return wrapper
+        return decorator
+
+    def cached_json(self, ttl, tags=()):
+        """Como cached(), pero la entrada guarda el JSON ya serializado y el handler devuelve la respuesta.
+
+        Los aciertos sirven los mismos bytes con el mismo ETag, sin volver a
+        serializar; la compresión usa ese ETag para encontrar el cuerpo ya
+        comprimido. wrapper.contenido(...) devuelve el valor de la misma entrada
+        para quien lo necesita sin serializar (p. ej. /eventos).
+        """
+        def decorator(func):
+            def entrada(*args, **kwargs):
+                key = (func, _freeze(args), _freeze(sorted(kwargs.items())))
+                return self.get_or_compute(key, lambda: CachedJSON(func(*args, **kwargs)), ttl, tags)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return entrada(*args, **kwargs).response()
+
+            wrapper.contenido = lambda *args, **kwargs: entrada(*args, **kwargs).content
+            return wrapper
+        return decorator
@@ -0,0 +1,276 @@
+"""Cola local de entrada de pedidos (write-behind).
+
+En el modo con cola, POST /pedidos valida el pedido, lo guarda en un fichero
+SQLite en modo WAL y responde 202 con un id de seguimiento sin tocar SQL
+Server. Un hilo vacía la cola en segundo plano: toma los pedidos pendientes
+por lotes y los escribe en SQL Server con una transacción por lote, usando una
+sola conexión del pool sea cual sea el ritmo de entrada.
+
+Estados de un pedido en la cola:
+    pendiente -> procesando -> creado | rechazado | error
+
+"rechazado" es un error del pedido (p. ej. falta de stock) y no se
+reintenta; "error" significa que se agotaron los reintentos.
+Si el proceso se detiene con un lote en "procesando", al arrancar esos
+pedidos vuelven a "pendiente": la entrega es al menos una vez.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+COLA_LOTE = 50
+COLA_INTERVALO = 0.2  # segundos entre vaciados cuando no hay avisos
+COLA_MAX_INTENTOS = 5
+COLA_BACKOFF = 1.0  # espera tras un lote fallido, se duplica en cada fallo seguido
+COLA_RETENCION = 7 * 24 * 3600  # segundos que se guardan los pedidos ya terminados
+
+ESTADOS_FINALES = ("creado", "rechazado", "error")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cola_pedidos (
+        id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        id_pedido INTEGER,
+        detalle TEXT,
+        intentos INTEGER NOT NULL DEFAULT 0,
+        creado REAL NOT NULL,
+        actualizado REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_cola_pedidos_estado ON cola_pedidos (estado, creado);
+"""
+
+
+class PedidoRechazado(Exception):
+    """El pedido no se puede crear tal cual: no se reintenta.
+
+    `detalle` se guarda como JSON y se devuelve en el endpoint de estado.
+    """
+
+    def __init__(self, detalle):
+        super().__init__(str(detalle))
+        self.detalle = detalle
+
+
+class IntakeQueue:
+    """Cola duradera de pedidos con un hilo que la vacía por lotes.
+
+    `insertar_lote(payloads)` escribe una lista de pedidos en una única
+    transacción y devuelve sus ids; `insertar_uno(payload)` escribe uno solo y
+    lanza PedidoRechazado si el pedido no es válido. Si el lote falla se
+    reintenta pedido a pedido, así un pedido malo no bloquea a los demás.
+    `al_terminar()` se llama tras cada lote con algún pedido creado.
+    """
+
+    def __init__(self, path, insertar_lote, insertar_uno, al_terminar=None, lote=COLA_LOTE,
+                 intervalo=COLA_INTERVALO, max_intentos=COLA_MAX_INTENTOS, backoff=COLA_BACKOFF,
+                 retencion=COLA_RETENCION):
+        self.path = path
+        self.insertar_lote = insertar_lote
+        self.insertar_uno = insertar_uno
+        self.al_terminar = al_terminar
+        self.lote = lote
+        self.intervalo = intervalo
+        self.max_intentos = max_intentos
+        self.backoff = backoff
+        self.retencion = retencion
+        # Una conexión compartida: las escrituras en SQLite se serializan de todos modos
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: el pedido está en disco antes de responder 202
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self._parar = threading.Event()
+        self._hilo = None
+        self._stats = {"encolados": 0, "lotes": 0, "lotes_fallidos": 0, "creados": 0,
+                       "rechazados": 0, "errores": 0, "reintentos": 0}
+        self._recuperar()
+
+    def _recuperar(self):
+        # Lotes que se estaban escribiendo cuando se detuvo el proceso
+        with self._lock:
+            self._conn.execute(
+                "UPDATE cola_pedidos SET estado = 'pendiente', actualizado = ? WHERE estado = 'procesando'",
+                (time.time(),),
+            )
+
+    def encolar(self, payload):
+        """Guarda el pedido (JSON) en la cola y devuelve su id de seguimiento."""
+        id_seguimiento = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cola_pedidos (id, payload, estado, creado, actualizado) "
+                "VALUES (?, ?, 'pendiente', ?, ?)",
+                (id_seguimiento, payload, now, now),
+            )
+            self._stats["encolados"] += 1
+        self._aviso.set()
+        return id_seguimiento
+
+    def estado(self, id_seguimiento):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, estado, id_pedido, detalle, intentos, creado, actualizado "
+                "FROM cola_pedidos WHERE id = ?",
+                (id_seguimiento,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "estado": row[1],
+            "id_pedido": row[2],
+            "detalle": json.loads(row[3]) if row[3] is not None else None,
+            "intentos": row[4],
+            "encolado": _iso(row[5]),
+            "actualizado": _iso(row[6]),
+        }
+
+    def _tomar_lote(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, intentos FROM cola_pedidos WHERE estado = 'pendiente' "
+                "ORDER BY creado LIMIT ?",
+                (self.lote,),
+            ).fetchall()
+            if rows:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE cola_pedidos SET estado = 'procesando', actualizado = ? WHERE id = ?",
+                    [(time.time(), row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+        return rows
+
+    def _marcar(self, cambios):
+        # cambios: (id, estado, id_pedido, detalle, intentos)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE cola_pedidos SET estado = ?, id_pedido = ?, detalle = ?, intentos = ?, "
+                "actualizado = ? WHERE id = ?",
+                [(estado, id_pedido, json.dumps(detalle, ensure_ascii=False) if detalle is not None else None,
+                  intentos, now, id_seguimiento)
+                 for id_seguimiento, estado, id_pedido, detalle, intentos in cambios],
+            )
+            self._conn.execute("COMMIT")
+            for _, estado, _, _, _ in cambios:
+                clave = {"creado": "creados", "rechazado": "rechazados",
+                         "error": "errores", "pendiente": "reintentos"}[estado]
+                self._stats[clave] += 1
+
+    def vaciar(self):
+        """Escribe un lote de pendientes en SQL Server. Devuelve False si algún pedido falló por error del servidor."""
+        rows = self._tomar_lote()
+        if not rows:
+            return True
+        with self._lock:
+            self._stats["lotes"] += 1
+        try:
+            ids = self.insertar_lote([row[1] for row in rows])
+        except Exception as e:
+            print(f"Error al escribir el lote de la cola de pedidos: {str(e)}")
+            with self._lock:
+                self._stats["lotes_fallidos"] += 1
+        else:
+            self._marcar([(row[0], "creado", id_pedido, None, row[2] + 1)
+                          for row, id_pedido in zip(rows, ids)])
+            if self.al_terminar is not None:
+                self.al_terminar()
+            return True
+
+        # El lote se ha deshecho entero: se reintenta pedido a pedido para aislar el que falla
+        cambios = []
+        creados = False
+        ok = True
+        for id_seguimiento, payload, intentos in rows:
+            intentos += 1
+            try:
+                id_pedido = self.insertar_uno(payload)
+            except PedidoRechazado as e:
+                cambios.append((id_seguimiento, "rechazado", None, e.detalle, intentos))
+            except Exception as e:
+                ok = False
+                estado = "error" if intentos >= self.max_intentos else "pendiente"
+                cambios.append((id_seguimiento, estado, None, {"message": str(e)}, intentos))
+            else:
+                creados = True
+                cambios.append((id_seguimiento, "creado", id_pedido, None, intentos))
+        self._marcar(cambios)
+        if creados and self.al_terminar is not None:
+            self.al_terminar()
+        return ok
+
+    def purgar(self):
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM cola_pedidos WHERE estado IN ({', '.join('?' * len(ESTADOS_FINALES))}) "
+                "AND actualizado < ?",
+                (*ESTADOS_FINALES, time.time() - self.retencion),
+            )
+
+    def _run(self):
+        fallos = 0
+        ultima_purga = 0.0
+        while not self._parar.is_set():
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            try:
+                # Se vacía mientras haya lotes completos; un fallo del servidor corta y espera
+                while not self._parar.is_set():
+                    if not self.vaciar():
+                        fallos += 1
+                        self._parar.wait(self.backoff * 2 ** min(fallos - 1, 6))
+                        break
+                    fallos = 0
+                    if self.pendientes() == 0:
+                        break
+                if time.monotonic() - ultima_purga > 3600:
+                    self.purgar()
+                    ultima_purga = time.monotonic()
+            except Exception as e:
+                print(f"Error en la cola de pedidos: {str(e)}")
+                self._parar.wait(self.backoff)
+
+    def pendientes(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cola_pedidos WHERE estado = 'pendiente'"
+            ).fetchone()[0]
+
+    def start(self):
+        if self._hilo is None:
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._run, name="cola-pedidos", daemon=True)
+            self._hilo.start()
+
+    def stop(self, timeout=10):
+        # El lote en curso termina; lo que quede pendiente se escribe en el próximo arranque
+        self._parar.set()
+        self._aviso.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def stats(self):
+        with self._lock:
+            por_estado = dict(self._conn.execute(
+                "SELECT estado, COUNT(*) FROM cola_pedidos GROUP BY estado"
+            ).fetchall())
+            return {
+                "path": self.path,
+                "activo": self._hilo is not None,
+                "lote": self.lote,
+                "por_estado": por_estado,
+                **self._stats,
+            }
+
+
+def _iso(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp))
@@ -0,0 +1,233 @@
+"""Compresión gzip/brotli de las respuestas según Accept-Encoding.
+
+CompressionMiddleware comprime las respuestas JSON/texto a partir de un tamaño
+mínimo. Los cuerpos comprimidos se guardan en CompressedBodyCache por
+codificación y, si la respuesta lleva ETag fuerte, por ruta, consulta y ETag
+(el ETag ya identifica los bytes, así que no se recorre el cuerpo); si no, por
+hash del cuerpo. Las respuestas que se repiten (las de la caché de respuestas,
+que salen ya serializadas y con ETag, los listados sin cambios...) se sirven ya
+comprimidas sin volver a comprimirlas. Las respuestas en streaming se comprimen
+por bloques y los eventos SSE no se tocan.
+"""
+import hashlib
+import zlib
+from collections import OrderedDict
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# Por debajo de este tamaño la cabecera y la CPU no compensan
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Cuerpos más grandes se comprimen en un hilo para no bloquear el bucle de eventos
+COMPRESS_IN_THREAD_SIZE = 64 * 1024
+COMPRESSED_CACHE_BYTES = 32 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "image/svg+xml", "text/")
+NOT_COMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def negotiate(accept_encoding):
+    """Elige "br", "gzip" o None a partir de la cabecera Accept-Encoding."""
+    pesos = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        pesos[nombre] = q
+    disponibles = ("br", "gzip") if brotli is not None else ("gzip",)
+    candidatas = [
+        (pesos.get(c, pesos.get("*", 0.0)), -i, c) for i, c in enumerate(disponibles)
+    ]
+    q, _, elegida = max(candidatas)
+    return elegida if q > 0 else None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip_compress(body)
+
+
+def gzip_compress(body):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class _StreamCompressor:
+    # Compresión por bloques: cada bloque se vacía para que el cliente lo reciba en cuanto se envía
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.finish() if self.encoding == "br" else self._compressor.flush()
+
+
+class CompressedBodyCache:
+    """LRU de cuerpos ya comprimidos, acotada por bytes."""
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0, "bytes_in": 0, "bytes_out": 0,
+                       "streamed": 0, "por_etag": 0}
+
+    async def get_or_compress(self, body, encoding, clave=None):
+        # `clave` identifica los bytes sin leerlos (ruta, consulta y ETag fuerte); sin ella se hashea el cuerpo
+        if clave is not None:
+            self._stats["por_etag"] += 1
+        else:
+            clave = hashlib.blake2b(body, digest_size=16).digest()
+        key = (clave, encoding)
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        else:
+            self._stats["misses"] += 1
+            if len(body) >= COMPRESS_IN_THREAD_SIZE:
+                compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            if len(compressed) <= self.max_bytes:
+                self._entries[key] = compressed
+                self._bytes += len(compressed)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self._stats["evicted"] += 1
+        self._stats["bytes_in"] += len(body)
+        self._stats["bytes_out"] += len(compressed)
+        return compressed
+
+    def record_stream(self):
+        self._stats["streamed"] += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "brotli": brotli is not None,
+            **self._stats,
+            "ratio": round(self._stats["bytes_out"] / self._stats["bytes_in"], 4) if self._stats["bytes_in"] else 0.0,
+        }
+
+
+def _compressible(headers):
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(NOT_COMPRESSIBLE_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, cache=None, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.cache = cache or CompressedBodyCache()
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                if not _compressible(Headers(raw=message["headers"])):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+
+            if compressor is None and not more_body:
+                # Respuesta completa: se comprime entera (o se reutiliza la ya comprimida)
+                headers.add_vary_header("Accept-Encoding")
+                if len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                body = await self.cache.get_or_compress(body, encoding, _clave_etag(scope, headers))
+                _set_encoding(headers, encoding)
+                headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            if compressor is None:
+                # Primer bloque de una respuesta en streaming
+                compressor = _StreamCompressor(encoding)
+                self.cache.record_stream()
+                headers.add_vary_header("Accept-Encoding")
+                _set_encoding(headers, encoding)
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(start)
+            data = compressor.chunk(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _clave_etag(scope, headers):
+    # Un ETag fuerte garantiza los mismos bytes para la misma URL; los débiles no sirven de clave
+    etag = headers.get("etag")
+    if not etag or etag.startswith("W/"):
+        return None
+    return (scope.get("path"), scope.get("query_string", b""), etag)
+
+
+def _set_encoding(headers, encoding):
+    headers["Content-Encoding"] = encoding
+    # La representación comprimida no es idéntica byte a byte: el ETag pasa a ser débil
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
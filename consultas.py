@@ -0,0 +1,108 @@
+"""Estadísticas por consulta y registro de consultas lentas.
+
+Cada sentencia que pasa por db.InstrumentedCursor se agrupa por su huella:
+el SQL con los literales sustituidos por ? y las listas IN (?, ?, ...) y los
+CASE WHEN ? THEN ? repetidos reducidos a uno, de modo que las variantes de
+una misma consulta suman en la misma entrada. Las sentencias que superan el
+umbral se escriben en el logger "consultas_lentas" como una línea JSON.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+SLOW_QUERY_THRESHOLD = 0.5  # segundos
+MAX_FINGERPRINTS = 1000
+SQL_LOG_MAX_CHARS = 2000
+
+logger = logging.getLogger("consultas_lentas")
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES = re.compile(r"\(\?\+\)(?:, \(\?\+\))+")
+_CASES = re.compile(r"(WHEN \? THEN \?)(?: WHEN \? THEN \?)+", re.I)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """SQL normalizado para agrupar las ejecuciones de una misma consulta."""
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _SPACES.sub(" ", sql).strip()
+    sql = re.sub(r"\s*,\s*", ", ", sql)
+    sql = _LISTS.sub("(?+)", sql)
+    sql = _VALUES.sub("(?+)+", sql)
+    sql = _CASES.sub(r"\1+", sql)
+    return sql
+
+
+class QueryLog:
+    """Duración, filas y número de ejecuciones por huella de consulta."""
+
+    def __init__(self, slow_threshold=SLOW_QUERY_THRESHOLD, max_fingerprints=MAX_FINGERPRINTS):
+        self.slow_threshold = slow_threshold
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._slow = 0
+        self._dropped = 0
+
+    def record(self, sql, seconds, rows):
+        huella = fingerprint(sql)
+        with self._lock:
+            entrada = self._queries.get(huella)
+            if entrada is None:
+                if len(self._queries) >= self.max_fingerprints:
+                    # Consultas generadas sin acotar: se cuentan pero no se guardan
+                    self._dropped += 1
+                    entrada = None
+                else:
+                    entrada = self._queries[huella] = {"calls": 0, "total": 0.0, "max": 0.0, "rows": 0, "slow": 0}
+            if entrada is not None:
+                entrada["calls"] += 1
+                entrada["total"] += seconds
+                entrada["max"] = max(entrada["max"], seconds)
+                entrada["rows"] += rows
+            lenta = self.slow_threshold is not None and seconds >= self.slow_threshold
+            if lenta:
+                self._slow += 1
+                if entrada is not None:
+                    entrada["slow"] += 1
+        if lenta:
+            logger.warning(json.dumps({
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "duration_ms": round(seconds * 1000, 3),
+                "rows": rows,
+                "fingerprint": huella,
+                "sql": _SPACES.sub(" ", sql).strip()[:SQL_LOG_MAX_CHARS],
+            }, ensure_ascii=False))
+
+    def stats(self, limit=20, orden="total"):
+        with self._lock:
+            queries = [(huella, dict(entrada)) for huella, entrada in self._queries.items()]
+            slow, dropped = self._slow, self._dropped
+        queries.sort(key=lambda item: item[1][orden], reverse=True)
+        return {
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 3) if self.slow_threshold is not None else None,
+            "fingerprints": len(queries),
+            "slow": slow,
+            "dropped": dropped,
+            "queries": [
+                {
+                    "fingerprint": huella,
+                    "calls": entrada["calls"],
+                    "total_ms": round(entrada["total"] * 1000, 3),
+                    "avg_ms": round(entrada["total"] / entrada["calls"] * 1000, 3),
+                    "max_ms": round(entrada["max"] * 1000, 3),
+                    "rows": entrada["rows"],
+                    "slow": entrada["slow"],
+                }
+                for huella, entrada in queries[:limit]
+            ],
+        }
@@ -0,0 +1,51 @@
+def _preparar(query, shape):
+    # `query` es una consulta fija, una tupla (sql, parámetros, forma) o una función que la
+    # devuelve al ejecutarse (p. ej. las series de ventas, que calculan su rango de fechas).
+    # Con query None el widget sale de memoria: su forma se llama sin filas
+    if callable(query):
+        query = query()
+    if isinstance(query, tuple):
+        return query
+    return query, (), shape
+
+
+def run_query(get_connection, query, shape=None):
+    # Ejecuta la consulta de un widget y da forma a sus filas
+    query, params, shape = _preparar(query, shape)
+    if query is None:
+        return shape()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, *params)
+        rows = cursor.fetchall()
+    return shape(rows)
+
+
+def run_batch(get_connection, widgets):
+    """Ejecuta las consultas de varios widgets en un único lote.
+
+    `widgets` es una lista de (nombre, consulta, función de forma). Las consultas
+    se envían juntas en un solo viaje y cada conjunto de resultados se recorre
+    con nextset(), en el mismo orden.
+    """
+    result = {}
+    if not widgets:
+        return result
+    widgets = [(name, *_preparar(query, shape)) for name, query, shape in widgets]
+    for name, query, _, shape in widgets:
+        if query is None:
+            result[name] = shape()
+    widgets = [widget for widget in widgets if widget[1] is not None]
+    if not widgets:
+        return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SET NOCOUNT ON;\n" + ";\n".join(query for _, query, _, _ in widgets),
+            *[param for _, _, params, _ in widgets for param in params],
+        )
+        for i, (name, _, _, shape) in enumerate(widgets):
+            if i and not cursor.nextset():
+                raise RuntimeError(f"Faltan conjuntos de resultados a partir de '{name}'")
+            result[name] = shape(cursor.fetchall())
+    return result
@@ -0,0 +1,485 @@
+import contextvars
+import threading
+import time
+
+import anyio
+import anyio.to_thread
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# True en el hilo de una tarea de DBExecutor, que ya tiene su plaza en el DBLimiter
+_con_plaza = contextvars.ContextVar("con_plaza", default=False)
+
+
+class DBLimiter:
+    # Plazas para trabajo de BD comunes a los handlers síncronos (cada conexión del pool
+    # ocupa una) y a los async (cada tarea de DBExecutor ocupa una mientras se ejecuta)
+
+    def __init__(self, size, timeout=30):
+        self.size = size
+        self.timeout = timeout
+        self._sem = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {"acquired": 0, "waits": 0, "timeouts": 0}
+
+    def acquire(self, timeout=None):
+        # Devuelve False si el hilo ya tiene plaza (una tarea de DBExecutor que pide conexión)
+        if _con_plaza.get():
+            return False
+        timeout = self.timeout if timeout is None else timeout
+        if not self._sem.acquire(blocking=False):
+            with self._lock:
+                self._waiting += 1
+                self._stats["waits"] += 1
+            try:
+                acquired = self._sem.acquire(timeout=timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeout(f"No hay plazas libres para la base de datos tras {timeout}s (límite={self.size})")
+        with self._lock:
+            self._in_use += 1
+            self._stats["acquired"] += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self._in_use -= 1
+        self._sem.release()
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "in_use": self._in_use, "waiting": self._waiting, **self._stats}
+
+
+class InstrumentedCursor:
+    # Cursor pyodbc que mide cada sentencia (su execute y el fetch de sus filas) para /metrics
+    # y el registro de consultas lentas; el resto se delega tal cual
+
+    def __init__(self, raw, metrics):
+        self._raw = raw
+        self._metrics = metrics
+        self._sql = None
+        self._elapsed = 0.0
+        self._rows = 0
+        self._fetched = False
+
+    def _timed(self, operation, func, *args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self._metrics.observe_error(e)
+            raise
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        if operation is None:
+            self._metrics.observe_fetch(elapsed)
+        else:
+            self._metrics.observe_execute(operation, elapsed)
+        return result
+
+    def _start(self, sql):
+        self.finish()
+        self._sql = sql
+        self._elapsed = 0.0
+        self._rows = 0
+        self._fetched = False
+
+    def finish(self):
+        # Cierra la sentencia en curso: la siguiente execute o la devolución de la conexión
+        # al pool marcan el final de sus filas
+        if self._sql is None:
+            return
+        if self._fetched:
+            rows = self._rows
+        else:
+            rows = max(getattr(self._raw, "rowcount", 0) or 0, 0)
+        sql, self._sql = self._sql, None
+        self._metrics.observe_statement(sql, self._elapsed, rows)
+
+    def execute(self, sql, *args):
+        self._start(sql)
+        self._timed("execute", self._raw.execute, sql, *args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._start(sql)
+        self._timed("executemany", self._raw.executemany, sql, *args)
+        return self
+
+    def fetchone(self):
+        row = self._timed(None, self._raw.fetchone)
+        self._fetched = True
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchall(self):
+        rows = self._timed(None, self._raw.fetchall)
+        self._fetched = True
+        self._rows += len(rows)
+        return rows
+
+    def fetchmany(self, *args):
+        rows = self._timed(None, self._raw.fetchmany, *args)
+        self._fetched = True
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # Los atributos del cursor (p. ej. fast_executemany) van al de pyodbc
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+
+class PooledConnection:
+    # Envoltorio de una conexión pyodbc: close() la devuelve al pool en lugar de cerrarla
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._checked_out = False
+        self._con_plaza = False  # la plaza del DBLimiter se devuelve con la conexión
+        self._cursors = []
+
+    def cursor(self):
+        metrics = self._pool.metrics
+        if metrics is None:
+            return self._raw.cursor()
+        cursor = InstrumentedCursor(self._raw.cursor(), metrics)
+        self._cursors.append(cursor)
+        return cursor
+
+    def _finish_cursors(self):
+        cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            cursor.finish()
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._checked_out:
+            plaza, self._con_plaza = self._con_plaza, False
+            try:
+                self._pool._release(self)
+            finally:
+                if plaza:
+                    self._pool.limiter.release()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, connection_string, min_size=2, max_size=10, max_lifetime=1800,
+                 ping_after=30, timeout=30, connect=None, metrics=None, limiter=None):
+        if min_size > max_size:
+            raise ValueError("min_size no puede ser mayor que max_size")
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.timeout = timeout
+        # connect permite sustituir pyodbc.connect (p. ej. por la base de datos local de benchmarks)
+        self.connect = connect
+        # metrics (metricas.DBMetrics) mide la espera por conexión y los cursores
+        self.metrics = metrics
+        # limiter (DBLimiter) es el límite de trabajo de BD compartido con DBExecutor
+        self.limiter = limiter
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def _open(self):
+        connect = self.connect
+        if connect is None:
+            import pyodbc
+            connect = pyodbc.connect
+        conn = PooledConnection(self, connect(self.connection_string))
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _expired(self, conn, now):
+        return self.max_lifetime is not None and now - conn.created_at >= self.max_lifetime
+
+    def _alive(self, conn):
+        try:
+            cursor = conn._raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn, reason="discarded"):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+
+    def warm(self):
+        # Abre las conexiones mínimas al arrancar para no pagar el handshake en la primera petición
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        plaza = self.limiter is not None and self.limiter.acquire(timeout)
+        try:
+            conn = self._checkout(start, timeout)
+        except BaseException:
+            if plaza:
+                self.limiter.release()
+            raise
+        conn._con_plaza = plaza
+        return conn
+
+    def _checkout(self, start, timeout):
+        deadline = start + timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("El pool de conexiones está cerrado")
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        if self.metrics is not None:
+                            self.metrics.observe_error(PoolTimeout())
+                        raise PoolTimeout(
+                            f"No hay conexiones libres tras {timeout}s (max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception as e:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    if self.metrics is not None:
+                        self.metrics.observe_error(e)
+                    raise
+            else:
+                now = time.monotonic()
+                if self._expired(conn, now):
+                    self._discard(conn, "recycled")
+                    continue
+                if now - conn.last_used >= self.ping_after and not self._alive(conn):
+                    self._discard(conn)
+                    continue
+
+            waited_for = time.monotonic() - start
+            with self._cond:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_time_total"] += waited_for
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited_for)
+            if self.metrics is not None:
+                self.metrics.observe_connect(waited_for)
+            conn._checked_out = True
+            return conn
+
+    def _release(self, conn):
+        conn._checked_out = False
+        conn._finish_cursors()
+        with self._cond:
+            self._in_use -= 1
+        # Deshace cualquier transacción sin confirmar para no devolver locks al pool
+        try:
+            conn._raw.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        now = time.monotonic()
+        if self._closed or self._expired(conn, now):
+            self._discard(conn, "recycled")
+            return
+        conn.last_used = now
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "size": self._size,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "created": self._stats["created"],
+                "recycled": self._stats["recycled"],
+                "discarded": self._stats["discarded"],
+                "checkouts": checkouts,
+                "waits": self._stats["waits"],
+                "timeouts": self._stats["timeouts"],
+                "wait_time_avg_ms": round(self._stats["wait_time_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_time_max_ms": round(self._stats["wait_time_max"] * 1000, 3),
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn, "recycled")
+
+
+class DBExecutor:
+    # Trabajo bloqueante de pyodbc desde handlers async. Las tareas tienen sus propios hilos
+    # (un CapacityLimiter de max_workers, por defecto tantos como plazas), aparte de los que
+    # anyio usa para los handlers síncronos, y cada una ocupa una plaza del DBLimiter del
+    # pool, así que comparten con los handlers síncronos el límite de trabajo de BD.
+
+    def __init__(self, limiter, max_workers=None):
+        self.limiter = limiter
+        self.max_workers = max_workers or limiter.size
+        self._hilos = anyio.CapacityLimiter(self.max_workers)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def _call(self, submitted_at, func, args, kwargs):
+        try:
+            self.limiter.acquire()
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+                self._stats["failed"] += 1
+            raise
+        waited = time.monotonic() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+        # Las conexiones que pida la tarea no ocupan otra plaza
+        _con_plaza.set(True)
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _con_plaza.set(False)
+            self.limiter.release()
+            with self._lock:
+                self._running -= 1
+                self._stats["failed" if failed else "completed"] += 1
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            self._queued += 1
+            self._stats["submitted"] += 1
+        # anyio.to_thread copia el contexto, así que el hilo ve el de la petición. La espera
+        # por un hilo propio cuenta como cola, igual que la espera por la plaza
+        return await anyio.to_thread.run_sync(
+            self._call, time.monotonic(), func, args, kwargs, limiter=self._hilos
+        )
+
+    def stats(self):
+        with self._lock:
+            started = self._stats["completed"] + self._stats["failed"] + self._running
+            return {
+                "max_workers": self.max_workers,
+                "limit": self.limiter.size,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "wait_time_avg_ms": round(self._stats["wait_time_total"] / started * 1000, 3) if started else 0.0,
+                "wait_time_max_ms": round(self._stats["wait_time_max"] * 1000, 3),
+            }
@@ -0,0 +1,39 @@
+import hashlib
+
+from fastapi import Response
+
+
+def make_etag(*parts):
+    # ETag fuerte a partir de la versión que devuelve la base de datos y de los parámetros
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+
+def fetch_etag(cursor, query, params, *extra):
+    """Calcula el ETag con una consulta de versión barata (COUNT/CHECKSUM_AGG).
+
+    `extra` lleva todo lo que cambia el cuerpo además de los datos (filtros,
+    paginación, id): dos respuestas distintas no deben compartir ETag aunque su
+    consulta de versión devuelva lo mismo. Devuelve None si la consulta no
+    devuelve filas (p. ej. el registro no existe), para que el handler siga su
+    camino normal.
+    """
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return make_etag(tuple(row), *extra)
+
+
+def matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag})
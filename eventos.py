@@ -0,0 +1,145 @@
+"""Notificaciones del panel por Server-Sent Events (/eventos).
+
+Las escrituras invalidan etiquetas de la caché ("pedidos", "productos"...).
+El Broadcaster escucha esas invalidaciones, recalcula una sola vez los widgets
+afectados y reparte el resultado a todos los suscriptores. Cada suscriptor
+tiene un buzón con el último valor de cada widget: si un cliente lento no ha
+leído el evento anterior, el nuevo lo sustituye en lugar de acumularse, así
+que la memoria por cliente está acotada sea cual sea su velocidad.
+"""
+import asyncio
+import json
+
+# Espera tras la primera escritura para agrupar ráfagas en un único recálculo
+DEBOUNCE = 1.0
+# Comentario SSE periódico para mantener viva la conexión y detectar clientes caídos
+HEARTBEAT = 15
+# Reintento que se indica a EventSource tras perder la conexión (ms)
+RETRY_MS = 5000
+MAX_SUSCRIPTORES = 500
+
+
+class _Suscriptor:
+    def __init__(self, widgets):
+        self.widgets = widgets
+        self.tablas = set()
+        self.pendiente = {}
+        self.aviso = asyncio.Event()
+
+    def entregar(self, tablas, datos):
+        # Devuelve cuántos widgets pendientes se han sustituido sin llegar a enviarse
+        delta = {n: v for n, v in datos.items() if self.widgets is None or n in self.widgets}
+        fusionados = len(self.pendiente.keys() & delta.keys())
+        self.tablas |= tablas
+        self.pendiente.update(delta)
+        self.aviso.set()
+        return fusionados
+
+    def recoger(self):
+        self.aviso.clear()
+        tablas, self.tablas = self.tablas, set()
+        pendiente, self.pendiente = self.pendiente, {}
+        return tablas, pendiente
+
+
+class Broadcaster:
+    """Reparte a los suscriptores de /eventos los widgets afectados por cada escritura.
+
+    `cargar` es una corrutina que recibe una lista de nombres de widget y
+    devuelve {nombre: datos}; `widget_tags` indica de qué etiquetas depende
+    cada widget. notify() se puede llamar desde cualquier hilo.
+    """
+
+    def __init__(self, cargar, widget_tags, debounce=DEBOUNCE, heartbeat=HEARTBEAT,
+                 max_suscriptores=MAX_SUSCRIPTORES):
+        self.cargar = cargar
+        self.widget_tags = {nombre: set(tags) for nombre, tags in widget_tags.items()}
+        self.debounce = debounce
+        self.heartbeat = heartbeat
+        self.max_suscriptores = max_suscriptores
+        self._loop = None
+        self._task = None
+        self._cambios = None
+        self._tags_pendientes = set()
+        self._suscriptores = set()
+        self._ultimo_id = 0
+        self._stats = {"notificaciones": 0, "recalculos": 0, "errores": 0, "eventos": 0, "fusionados": 0}
+
+    def start(self):
+        # Se llama desde el arranque de la app, ya dentro del bucle de eventos
+        self._loop = asyncio.get_running_loop()
+        self._cambios = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+
+    def notify(self, *tags):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._marcar, tags)
+
+    def _marcar(self, tags):
+        self._stats["notificaciones"] += 1
+        self._tags_pendientes.update(tags)
+        self._cambios.set()
+
+    async def _run(self):
+        while True:
+            await self._cambios.wait()
+            await asyncio.sleep(self.debounce)
+            self._cambios.clear()
+            tags, self._tags_pendientes = self._tags_pendientes, set()
+            if not self._suscriptores:
+                continue
+            widgets = [nombre for nombre, dependencias in self.widget_tags.items() if dependencias & tags]
+            datos = {}
+            if widgets:
+                try:
+                    datos = await self.cargar(widgets)
+                    self._stats["recalculos"] += 1
+                except Exception as e:
+                    self._stats["errores"] += 1
+                    print(f"Error al recalcular widgets para /eventos: {e}")
+                    continue
+            for suscriptor in list(self._suscriptores):
+                self._stats["fusionados"] += suscriptor.entregar(tags, datos)
+
+    def lleno(self):
+        return len(self._suscriptores) >= self.max_suscriptores
+
+    async def eventos(self, widgets=None):
+        """Generador de texto SSE para un suscriptor; se da de baja al desconectarse."""
+        suscriptor = _Suscriptor(set(widgets) if widgets else None)
+        self._suscriptores.add(suscriptor)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(suscriptor.aviso.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                tablas, pendiente = suscriptor.recoger()
+                self._ultimo_id += 1
+                self._stats["eventos"] += 1
+                data = json.dumps({"tablas": sorted(tablas), "widgets": pendiente},
+                                  ensure_ascii=False, default=str)
+                yield f"id: {self._ultimo_id}\nevent: cambios\ndata: {data}\n\n"
+        finally:
+            self._suscriptores.discard(suscriptor)
+
+    def stats(self):
+        return {
+            "suscriptores": len(self._suscriptores),
+            "max_suscriptores": self.max_suscriptores,
+            "pendientes": sorted(self._tags_pendientes),
+            **self._stats,
+        }
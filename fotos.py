@@ -0,0 +1,152 @@
+"""Fotos de producto servidas desde /productos/{id}/foto.
+
+Productos.foto guarda una data URL (base64) o una URL externa http(s); lo
+que no es ninguna de las dos (una ruta relativa, javascript:...) se trata
+como foto no válida y da 404 en lugar de redirigir a ello. Los listados
+no devuelven la foto sino la URL de este endpoint con el hash del contenido
+(?v=...): esa URL se puede guardar en caché indefinidamente porque cambia en
+cuanto cambia la foto. Con ?tam=miniatura se sirve una versión reducida.
+"""
+import base64
+import binascii
+import io
+import urllib.parse
+
+from fastapi import HTTPException, Response
+from fastapi.responses import RedirectResponse
+
+from etag import matches, not_modified
+
+# El hash lo calcula SQL Server, así el listado no transfiere la foto. Una foto vacía o
+# solo con espacios cuenta como sin foto: hash NULL y el listado devuelve None.
+# HASHBYTES solo acepta más de 8000 bytes de entrada (fotos de nvarchar(max)) desde SQL Server 2016;
+# en versiones anteriores la consulta falla con las fotos grandes
+FOTO_HASH = "CASE WHEN LTRIM(RTRIM(foto)) = '' THEN NULL ELSE HASHBYTES('SHA2_256', foto) END"
+
+QUERY_FOTO_HASH = f"SELECT {FOTO_HASH} AS foto_hash FROM Productos WHERE id_producto = ?"
+QUERY_FOTO = "SELECT foto FROM Productos WHERE id_producto = ?"
+
+# Tamaño máximo (ancho, alto) de cada variante; la miniatura es el doble de lo que pinta panel.html
+TAMANOS = {"original": None, "miniatura": (240, 160)}
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+# Fotos ya decodificadas (y miniaturas) en memoria; la clave incluye el hash del contenido
+FOTOS_MAX_ENTRIES = 128
+FOTOS_TTL = 24 * 3600
+
+
+def sin_vacia(foto):
+    # None en lugar de una foto vacía o solo con espacios
+    if foto is None or not foto.strip():
+        return None
+    return foto
+
+
+def foto_version(foto_hash):
+    if not foto_hash:
+        return None
+    return bytes(foto_hash).hex()[:16]
+
+
+def foto_url(product_id, foto_hash):
+    # URL que devuelven los listados en el campo foto
+    version = foto_version(foto_hash)
+    if version is None:
+        return None
+    return f"/productos/{product_id}/foto?v={version}"
+
+
+def url_externa(foto):
+    # Solo se redirige a URLs absolutas http(s), nunca a rutas relativas ni a otros esquemas
+    try:
+        partes = urllib.parse.urlsplit(foto.strip())
+    except ValueError:
+        return None
+    if partes.scheme.lower() not in ("http", "https") or not partes.netloc:
+        return None
+    return foto.strip()
+
+
+def decodificar(foto):
+    """Devuelve (tipo MIME, bytes) de una data URL, o None si no lo es."""
+    if not foto.startswith("data:"):
+        return None
+    cabecera, separador, datos = foto[5:].partition(",")
+    if not separador:
+        return None
+    mime = cabecera.split(";")[0] or "application/octet-stream"
+    if ";base64" in cabecera:
+        try:
+            return mime, base64.b64decode(datos)
+        except (binascii.Error, ValueError):
+            return None
+    return mime, urllib.parse.unquote_to_bytes(datos)
+
+
+def miniatura(contenido, mime, tamano):
+    # Pillow es opcional: sin él (o si la imagen no se puede abrir, p. ej. SVG) se sirve la original
+    try:
+        from PIL import Image
+    except ImportError:
+        return mime, contenido
+    try:
+        with Image.open(io.BytesIO(contenido)) as img:
+            formato = img.format if img.format in ("JPEG", "PNG", "WEBP", "GIF") else "PNG"
+            img.thumbnail(tamano)
+            if formato == "JPEG" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            salida = io.BytesIO()
+            img.save(salida, formato)
+            return Image.MIME[formato], salida.getvalue()
+    except Exception:
+        return mime, contenido
+
+
+def servir_foto(get_connection, cache, product_id, request, v=None, tam="original"):
+    """Respuesta de /productos/{id}/foto.
+
+    Solo se lee la foto si el cliente no tiene ya esta versión (If-None-Match)
+    y no está en `cache`. Si la URL trae la versión actual (?v=) la respuesta
+    es inmutable; si no, el navegador debe revalidar.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(QUERY_FOTO_HASH, (product_id,))
+        row = cursor.fetchone()
+        if row is None or row.foto_hash is None:
+            raise HTTPException(status_code=404, detail="Foto no encontrada")
+
+        version = foto_version(row.foto_hash)
+        etag = f'"{version}-{tam}"'
+        headers = {"ETag": etag, "Cache-Control": CACHE_INMUTABLE if v == version else CACHE_REVALIDAR}
+        if matches(request, etag):
+            respuesta = not_modified(etag)
+            respuesta.headers.update(headers)
+            return respuesta
+
+        def cargar():
+            cursor.execute(QUERY_FOTO, (product_id,))
+            row = cursor.fetchone()
+            foto = sin_vacia(row.foto) if row is not None else None
+            if foto is None:
+                # Borrada entre las dos consultas, o solo con espacios que no son ' '
+                raise HTTPException(status_code=404, detail="Foto no encontrada")
+            imagen = decodificar(foto)
+            if imagen is None:
+                # URL externa: se redirige a ella. Cualquier otra cosa no es una foto válida
+                url = url_externa(foto)
+                if url is None:
+                    raise HTTPException(status_code=404, detail="Foto no encontrada")
+                return None, url
+            mime, contenido = imagen
+            if TAMANOS[tam]:
+                mime, contenido = miniatura(contenido, mime, TAMANOS[tam])
+            return mime, contenido
+
+        mime, contenido = cache.get_or_compute((version, tam), cargar, ttl=FOTOS_TTL)
+
+    if mime is None:
+        return RedirectResponse(contenido, headers={"Cache-Control": headers["Cache-Control"]})
+    return Response(content=contenido, media_type=mime, headers=headers)
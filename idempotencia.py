@@ -0,0 +1,121 @@
+"""Cabecera Idempotency-Key para peticiones que crean recursos (POST /pedidos).
+
+La primera petición con una clave se ejecuta y su respuesta se guarda durante
+IDEMPOTENCY_TTL; las repeticiones con la misma clave reciben esa respuesta sin
+volver a tocar la base de datos. Si llega una repetición mientras la original
+sigue en curso, espera a que termine. Si la original falla con un error del
+servidor la clave se libera para que el reintento se ejecute de verdad.
+
+El almacén vive en memoria del proceso: con varios workers cada uno tiene el suyo.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL = 24 * 3600
+IDEMPOTENCY_MAX_ENTRIES = 100000
+
+
+class _Entrada:
+    __slots__ = ("huella", "expira", "status", "body", "terminada")
+
+    def __init__(self, huella, expira):
+        self.huella = huella
+        self.expira = expira
+        self.status = None
+        self.body = None
+        self.terminada = asyncio.Event()
+
+
+class IdempotencyStore:
+    """Respuestas guardadas por clave de idempotencia, con caducidad y tamaño acotado.
+
+    Solo se guarda lo necesario para repetir la respuesta: un resumen de 16
+    bytes del cuerpo de la petición, el código de estado y el cuerpo JSON.
+    Se usa desde el bucle de eventos, así que no necesita locks.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stats = {"ejecutadas": 0, "repetidas": 0, "esperas": 0, "conflictos": 0, "liberadas": 0}
+
+    def _purge(self, now):
+        # Las entradas se insertan en orden de caducidad: basta con mirar las más antiguas
+        while self._entries:
+            key, entrada = next(iter(self._entries.items()))
+            terminada = entrada.terminada.is_set()
+            if not terminada or (entrada.expira > now and len(self._entries) <= self.max_entries):
+                break
+            del self._entries[key]
+
+    async def run(self, key, payload, func):
+        """Ejecuta `func` (corrutina) una sola vez por clave y devuelve su resultado o el guardado.
+
+        `payload` es el cuerpo de la petición: reutilizar una clave con otro
+        cuerpo es un error del cliente (422).
+        """
+        huella = hashlib.sha256(payload.encode()).digest()[:16]
+        while True:
+            now = time.monotonic()
+            self._purge(now)
+            entrada = self._entries.get(key)
+            if entrada is not None and entrada.terminada.is_set() and entrada.expira <= now:
+                del self._entries[key]
+                entrada = None
+            if entrada is None:
+                entrada = _Entrada(huella, now + self.ttl)
+                self._entries[key] = entrada
+                break
+            if entrada.huella != huella:
+                self._stats["conflictos"] += 1
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} ya usada con otro cuerpo de petición",
+                )
+            if entrada.status is not None:
+                self._stats["repetidas"] += 1
+                return JSONResponse(entrada.body, status_code=entrada.status,
+                                    headers={REPLAYED_HEADER: "true"})
+            # La petición original sigue en curso
+            self._stats["esperas"] += 1
+            await entrada.terminada.wait()
+
+        try:
+            result = await func()
+        except HTTPException as e:
+            if e.status_code < 500:
+                # Los errores del cliente (p. ej. falta de stock) se repiten tal cual
+                entrada.status, entrada.body = e.status_code, {"detail": e.detail}
+            raise
+        else:
+            if isinstance(result, Response):
+                # Respuestas con otro código (p. ej. 202 del modo con cola)
+                entrada.status, entrada.body = result.status_code, json.loads(result.body)
+            else:
+                entrada.status, entrada.body = 200, result
+            self._stats["ejecutadas"] += 1
+            return result
+        finally:
+            if entrada.status is None:
+                # Error del servidor: se libera la clave para que el reintento se ejecute
+                self._stats["liberadas"] += 1
+                if self._entries.get(key) is entrada:
+                    del self._entries[key]
+            entrada.terminada.set()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            **self._stats,
+        }
@@ -0,0 +1,262 @@
+"""Métricas en formato de texto de Prometheus para /metrics.
+
+Contadores, gauges e histogramas mínimos, sin dependencias: cada observación
+es un bisect sobre los límites de los buckets y una suma bajo un lock, así que
+se pueden dejar activados en producción. Las series por etiquetas se crean la
+primera vez que se usan; las etiquetas de ruta son la plantilla de la ruta
+(/pedidos/{pedido_id}), no la URL, para que su número esté acotado.
+
+- HTTPMetrics + MetricsMiddleware: peticiones, latencia, peticiones en curso y
+  errores por tipo de excepción, por ruta.
+- DBMetrics: tiempo de espera por una conexión del pool y de execute/fetch de
+  los cursores (ver db.InstrumentedCursor). También reparte las sentencias al
+  QueryLog y suma los tiempos de la cabecera Server-Timing.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from fastapi import Response
+from fastapi.exception_handlers import http_exception_handler
+
+import tiempos
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Peticiones que no han encajado con ninguna ruta (404): una sola serie para todas
+SIN_RUTA = "sin_ruta"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pares.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in series
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge con valor propio (inc/dec) o calculado al exportar (`func`)."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), func=None):
+        super().__init__(name, help, labelnames)
+        self.func = func
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        if self.func is not None:
+            valor = self.func()
+            series = valor.items() if isinstance(valor, dict) else [((), valor)]
+        else:
+            with self._lock:
+                series = list(self._series.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in series
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=HTTP_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                # Cuentas por bucket (no acumuladas) + la de +Inf, suma
+                serie = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][bisect_left(self.buckets, value)] += 1
+            serie[1] += value
+
+    def render(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in series:
+            acumulado = 0
+            for limite, count in zip(self.buckets + (float("inf"),), counts):
+                acumulado += count
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, labels, (('le', _number(float(limite))),))} {acumulado}"
+                )
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acumulado}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), func=None):
+        return self._add(Gauge(name, help, labelnames, func))
+
+    def histogram(self, name, help, labelnames=(), buckets=HTTP_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.render(), media_type=CONTENT_TYPE)
+
+
+def exception_type(exc):
+    return type(exc).__name__
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return getattr(route, "path", SIN_RUTA) if route is not None else SIN_RUTA
+
+
+class HTTPMetrics:
+    def __init__(self, registry):
+        self.requests = registry.counter(
+            "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route"))
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "Peticiones HTTP en curso")
+        self.errors = registry.counter(
+            "http_errors_total", "Errores 5xx por ruta y tipo de excepción", ("route", "type"))
+
+    def error(self, scope, exc):
+        self.errors.inc(route_label(scope), exception_type(exc))
+
+    async def http_exception_handler(self, request, exc):
+        # Los handlers convierten las excepciones en HTTPException(500): se cuenta la original
+        if exc.status_code >= 500:
+            self.error(request.scope, exc.__cause__ or exc.__context__ or exc)
+        return await http_exception_handler(request, exc)
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            self.metrics.error(scope, e)
+            raise
+        finally:
+            self.metrics.in_flight.dec()
+            route = route_label(scope)
+            self.metrics.latency.observe(time.perf_counter() - start, scope["method"], route)
+            self.metrics.requests.inc(scope["method"], route, str(status))
+
+
+class DBMetrics:
+    # Interfaz que usan ConnectionPool e InstrumentedCursor (db.py)
+
+    def __init__(self, registry, queries=None):
+        # queries (consultas.QueryLog) recibe cada sentencia con su duración y filas
+        self.queries = queries
+        self.connect = registry.histogram(
+            "db_connect_seconds", "Espera hasta obtener una conexión del pool (incluye abrirla)",
+            buckets=DB_BUCKETS)
+        self.execute = registry.histogram(
+            "db_execute_seconds", "Duración de execute/executemany", ("operation",), buckets=DB_BUCKETS)
+        self.fetch = registry.histogram(
+            "db_fetch_seconds", "Duración de fetchone/fetchall/fetchmany", buckets=DB_BUCKETS)
+        self.errors = registry.counter(
+            "db_errors_total", "Errores de la base de datos por tipo de excepción", ("type",))
+
+    def observe_connect(self, seconds):
+        self.connect.observe(seconds)
+        tiempos.add("connect", seconds)
+
+    def observe_execute(self, operation, seconds):
+        self.execute.observe(seconds, operation)
+        tiempos.add("query", seconds)
+
+    def observe_fetch(self, seconds):
+        self.fetch.observe(seconds)
+        tiempos.add("query", seconds)
+
+    def observe_statement(self, sql, seconds, rows):
+        if self.queries is not None:
+            self.queries.record(sql, seconds, rows)
+
+    def observe_error(self, exc):
+        self.errors.inc(exception_type(exc))
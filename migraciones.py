@@ -0,0 +1,174 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada fichero de migraciones/ se llama NNNN_descripcion.sql y se aplica una
+sola vez, en orden de versión. Los lotes dentro de un fichero se separan con
+una línea GO, como en SSMS y sqlcmd. Cada migración se ejecuta en su propia
+transacción junto con su fila en schema_version, así que una migración a
+medias no queda registrada.
+
+Al arrancar, la API comprueba que la base de datos está en VERSION_ESPERADA
+(la última migración del directorio) y no arranca si le faltan migraciones.
+
+Uso:
+    python migraciones.py estado [--app api|main]
+    python migraciones.py aplicar [--app api|main] [--hasta N]
+"""
+import argparse
+import hashlib
+import importlib
+import os
+import re
+
+MIGRACIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migraciones")
+
+_FICHERO = re.compile(r"^(\d+)_(\w+)\.sql$")
+_GO = re.compile(r"^\s*GO\s*$", re.I | re.M)
+
+CREATE_TABLE = """
+    IF OBJECT_ID('schema_version', 'U') IS NULL
+    CREATE TABLE schema_version (
+        version INT NOT NULL PRIMARY KEY,
+        nombre NVARCHAR(200) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        aplicada DATETIME2 NOT NULL
+    )
+"""
+
+QUERY_APLICADAS = "SELECT version, nombre, checksum, aplicada FROM schema_version ORDER BY version"
+QUERY_VERSION = "SELECT MAX(version) AS version FROM schema_version"
+INSERT_VERSION = "INSERT INTO schema_version (version, nombre, checksum, aplicada) VALUES (?, ?, ?, SYSDATETIME())"
+
+
+class SchemaDesactualizado(Exception):
+    pass
+
+
+class Migracion:
+    def __init__(self, version, nombre, path):
+        self.version = version
+        self.nombre = nombre
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+    def lotes(self):
+        return [lote.strip() for lote in _GO.split(self.sql) if lote.strip()]
+
+
+def cargar(directorio=MIGRACIONES_DIR):
+    """Migraciones del directorio ordenadas por versión."""
+    migraciones = []
+    for fichero in os.listdir(directorio):
+        match = _FICHERO.match(fichero)
+        if match:
+            migraciones.append(Migracion(int(match.group(1)), match.group(2), os.path.join(directorio, fichero)))
+    migraciones.sort(key=lambda m: m.version)
+    versiones = [m.version for m in migraciones]
+    if len(set(versiones)) != len(versiones):
+        raise ValueError(f"Hay versiones de migración repetidas en {directorio}")
+    return migraciones
+
+
+def ultima_version(directorio=MIGRACIONES_DIR):
+    migraciones = cargar(directorio)
+    return migraciones[-1].version if migraciones else 0
+
+
+VERSION_ESPERADA = ultima_version()
+
+
+def version_actual(conn):
+    cursor = conn.cursor()
+    cursor.execute(QUERY_VERSION)
+    row = cursor.fetchone()
+    return (row.version or 0) if row else 0
+
+
+def aplicar(conn, hasta=None, directorio=MIGRACIONES_DIR):
+    """Aplica en orden las migraciones pendientes (hasta la versión `hasta`). Devuelve las aplicadas."""
+    cursor = conn.cursor()
+    cursor.execute(CREATE_TABLE)
+    conn.commit()
+    actual = version_actual(conn)
+    aplicadas = []
+    for migracion in cargar(directorio):
+        if migracion.version <= actual or (hasta is not None and migracion.version > hasta):
+            continue
+        cursor = conn.cursor()
+        try:
+            for lote in migracion.lotes():
+                cursor.execute(lote)
+            cursor.execute(INSERT_VERSION, (migracion.version, migracion.nombre, migracion.checksum))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(migracion)
+    return aplicadas
+
+
+def estado(conn, directorio=MIGRACIONES_DIR):
+    """Versión de cada migración: aplicada, pendiente o modificada después de aplicarse."""
+    cursor = conn.cursor()
+    cursor.execute(QUERY_APLICADAS)
+    aplicadas = {row.version: row for row in cursor.fetchall()}
+    result = []
+    for migracion in cargar(directorio):
+        row = aplicadas.get(migracion.version)
+        if row is None:
+            situacion = "pendiente"
+        elif row.checksum.strip() != migracion.checksum:
+            situacion = "modificada"
+        else:
+            situacion = "aplicada"
+        result.append({
+            "version": migracion.version,
+            "nombre": migracion.nombre,
+            "estado": situacion,
+            "aplicada": row.aplicada if row is not None else None,
+        })
+    return result
+
+
+def comprobar(conn, esperada=VERSION_ESPERADA):
+    """Lanza SchemaDesactualizado si a la base de datos le faltan migraciones."""
+    try:
+        actual = version_actual(conn)
+    except Exception as e:
+        raise SchemaDesactualizado(
+            f"No se puede leer schema_version ({str(e)}): ejecuta 'python migraciones.py aplicar'"
+        ) from e
+    if actual < esperada:
+        raise SchemaDesactualizado(
+            f"El esquema está en la versión {actual} y se espera la {esperada}: "
+            "ejecuta 'python migraciones.py aplicar'"
+        )
+    return actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la base de datos")
+    parser.add_argument("accion", choices=["estado", "aplicar"])
+    parser.add_argument("--app", default="api", choices=["api", "main"],
+                        help="módulo cuya configuración de conexión se usa")
+    parser.add_argument("--hasta", type=int, default=None, help="última versión que se aplica")
+    args = parser.parse_args()
+
+    app_module = importlib.import_module(args.app)
+    with app_module.get_connection() as conn:
+        if args.accion == "aplicar":
+            aplicadas = aplicar(conn, args.hasta)
+            for migracion in aplicadas:
+                print(f"Aplicada {migracion.version:04d}_{migracion.nombre}")
+            print(f"Esquema en la versión {version_actual(conn)}")
+        else:
+            cursor = conn.cursor()
+            cursor.execute(CREATE_TABLE)
+            conn.commit()
+            for fila in estado(conn):
+                print(f"{fila['version']:04d}_{fila['nombre']}: {fila['estado']}")
+
+
+if __name__ == "__main__":
+    main()
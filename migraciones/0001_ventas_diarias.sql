@@ -0,0 +1,18 @@
+-- Resumen diario de ventas por producto (ver ventas_diarias.py). Si la tabla no existía
+-- se llena a partir de Ventas; si ya existía no se toca.
+IF OBJECT_ID('Ventas_diarias', 'U') IS NULL
+BEGIN
+    CREATE TABLE Ventas_diarias (
+        fecha DATE NOT NULL,
+        producto_id INT NOT NULL,
+        total DECIMAL(18, 2) NOT NULL,
+        num_ventas INT NOT NULL,
+        unidades INT NOT NULL,
+        CONSTRAINT PK_Ventas_diarias PRIMARY KEY (fecha, producto_id)
+    );
+
+    INSERT INTO Ventas_diarias (fecha, producto_id, total, num_ventas, unidades)
+    SELECT CAST(fecha_venta AS DATE), producto_id, SUM(total), COUNT(*), SUM(cantidad)
+    FROM Ventas
+    GROUP BY CAST(fecha_venta AS DATE), producto_id;
+END
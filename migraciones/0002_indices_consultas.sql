@@ -0,0 +1,37 @@
+-- Índices de los caminos de acceso de las consultas de api.py y main.py. Cada uno solo
+-- se crea si no existe ya con ese nombre.
+
+-- Ventas por rango de fechas: reconstrucción de Ventas_diarias
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Ventas_fecha_venta' AND object_id = OBJECT_ID('Ventas'))
+    CREATE NONCLUSTERED INDEX IX_Ventas_fecha_venta
+    ON Ventas (fecha_venta) INCLUDE (total, producto_id, cantidad);
+GO
+
+-- Líneas de un pedido (/pedidos/{id}, update_pedido, versión para el ETag)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Linea_pedidos_id_orden' AND object_id = OBJECT_ID('Linea_pedidos'))
+    CREATE NONCLUSTERED INDEX IX_Linea_pedidos_id_orden
+    ON Linea_pedidos (id_orden) INCLUDE (id_producto, cantidad, precio);
+GO
+
+-- Unidades vendidas por producto (más vendidos)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Linea_pedidos_id_producto' AND object_id = OBJECT_ID('Linea_pedidos'))
+    CREATE NONCLUSTERED INDEX IX_Linea_pedidos_id_producto
+    ON Linea_pedidos (id_producto) INCLUDE (cantidad, precio);
+GO
+
+-- /pedidos/recientes (TOP 5 ORDER BY fecha_pedido DESC) y filtros por fecha de /pedidos
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Pedidos_fecha_pedido' AND object_id = OBJECT_ID('Pedidos'))
+    CREATE NONCLUSTERED INDEX IX_Pedidos_fecha_pedido
+    ON Pedidos (fecha_pedido DESC);
+GO
+
+-- Pedidos de un cliente y el JOIN con los usuarios
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Pedidos_id_usuario' AND object_id = OBJECT_ID('Pedidos'))
+    CREATE NONCLUSTERED INDEX IX_Pedidos_id_usuario
+    ON Pedidos (id_usuario);
+GO
+
+-- Recuento de productos con poco stock (unidades <= 10)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Productos_unidades' AND object_id = OBJECT_ID('Productos'))
+    CREATE NONCLUSTERED INDEX IX_Productos_unidades
+    ON Productos (unidades);
@@ -0,0 +1,11 @@
+-- Ajustes de los pedidos editados (ver ventas_diarias.py): update_pedido suma a Ventas_diarias
+-- la diferencia de unidades y total de cada producto sin escribir en Ventas, y la guarda
+-- aquí para que la reconstrucción del resumen la vuelva a sumar a lo agregado de Ventas.
+IF OBJECT_ID('Ventas_ajustes', 'U') IS NULL
+CREATE TABLE Ventas_ajustes (
+    fecha DATE NOT NULL,
+    producto_id INT NOT NULL,
+    total DECIMAL(18, 2) NOT NULL,
+    unidades INT NOT NULL,
+    CONSTRAINT PK_Ventas_ajustes PRIMARY KEY (fecha, producto_id)
+);
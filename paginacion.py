@@ -0,0 +1,94 @@
+import datetime
+
+from fastapi.responses import StreamingResponse
+
+from serializacion import dumps, row_mapper
+
+# Tamaño de página por defecto y máximo para los listados paginados
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Cabecera con el cursor de la siguiente página (el valor a pasar en `after`)
+NEXT_HEADER = "X-Next-After"
+
+
+def keyset_query(select, key, filters=(), limit=None, after=None):
+    """Construye una consulta paginada por clave (keyset).
+
+    `select` es la parte "columnas FROM ... JOIN ..." de la consulta y `filters`
+    una lista de pares (condición SQL con un ?, valor); los filtros con valor
+    None se omiten. Con `limit` None se devuelven todas las filas.
+    """
+    where, params = where_clause(key, filters, after)
+    top = f"TOP {int(limit)} " if limit is not None else ""
+    return f"SELECT {top}{select}{where} ORDER BY {key}", params
+
+
+def where_clause(key, filters=(), after=None):
+    # WHERE de los listados; lo comparten la consulta de datos y la de versión (ETag)
+    conditions = []
+    params = []
+    for condition, value in filters:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    if after is not None:
+        conditions.append(f"{key} > ?")
+        params.append(after)
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def end_of_day(fecha):
+    # Límite superior exclusivo para filtrar por fecha sin envolver la columna en funciones
+    if fecha is None:
+        return None
+    return datetime.datetime.combine(fecha + datetime.timedelta(days=1), datetime.time.min)
+
+
+def set_next_cursor(response, rows, key, limit):
+    # Solo hay siguiente página si se ha llenado la actual
+    if limit is not None and len(rows) == limit:
+        response.headers[NEXT_HEADER] = str(getattr(rows[-1], key))
+
+
+# Filas leídas por viaje al servidor en las respuestas en streaming
+STREAM_CHUNK_SIZE = 500
+
+STREAM_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def stream_rows(get_connection, query, params, fields, formato, chunk_size=STREAM_CHUNK_SIZE):
+    """Devuelve el resultado de la consulta como StreamingResponse.
+
+    El cursor se lee con fetchmany y cada bloque se serializa y se envía en
+    cuanto llega, así que la memoria no crece con el número de filas.
+    `fields` son los campos de row_mapper y `formato` es "json" (un array) o
+    "ndjson" (un objeto por línea).
+    """
+    def generate():
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            mapper = row_mapper(cursor.description, fields)
+            if formato == "json":
+                yield b"["
+            first = True
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if formato == "ndjson":
+                    yield b"\n".join(dumps(mapper(row)) for row in rows) + b"\n"
+                else:
+                    # El bloque se codifica como una lista y se le quitan los corchetes
+                    yield (b"" if first else b",") + dumps([mapper(row) for row in rows])[1:-1]
+                first = False
+            if formato == "json":
+                yield b"]"
+
+    return StreamingResponse(generate(), media_type=STREAM_MEDIA_TYPES[formato])
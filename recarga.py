@@ -0,0 +1,70 @@
+"""Recarga periódica de los índices en memoria (stock_bajo, top_ventas).
+
+Los índices se mantienen al día con las escrituras de este proceso, pero lo
+que escriben otros (otro worker de uvicorn, api.py frente a main.py o cambios
+hechos a mano en la base de datos) solo llega con una carga completa. Un hilo
+repite la carga cada `intervalo` segundos: esos cambios tardan como mucho un
+intervalo más lo que dure la carga en verse.
+"""
+import threading
+import time
+
+
+class PeriodicReload:
+    def __init__(self, nombre, cargar, intervalo):
+        # cargar() devuelve False si ha descartado la carga (se repite en el siguiente intervalo)
+        self.nombre = nombre
+        self.cargar = cargar
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "recargas": 0,
+            "descartadas": 0,
+            "fallos": 0,
+            "ultima": None,
+            "ultima_ms": None,
+            "error": None,
+        }
+
+    def recargar(self):
+        start = time.perf_counter()
+        try:
+            hecha = self.cargar() is not False
+        except Exception as e:
+            with self._lock:
+                self._stats["fallos"] += 1
+                self._stats["error"] = str(e)
+            print(f"Error al recargar {self.nombre}: {str(e)}")
+            return False
+        with self._lock:
+            if not hecha:
+                self._stats["descartadas"] += 1
+                return False
+            self._stats["recargas"] += 1
+            self._stats["ultima"] = time.time()
+            self._stats["ultima_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._stats["error"] = None
+        return True
+
+    def _run(self):
+        while not self._parar.wait(self.intervalo):
+            self.recargar()
+
+    def start(self):
+        if self._hilo is None:
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._run, name=f"recarga-{self.nombre}", daemon=True)
+            self._hilo.start()
+
+    def stop(self, timeout=10):
+        # Una carga en curso termina; no se empieza otra
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "activo": self._hilo is not None, "intervalo": self.intervalo}
@@ -0,0 +1,128 @@
+"""Serialización rápida de filas de la base de datos.
+
+row_mapper() genera una vez por consulta (a partir de cursor.description) una
+función que convierte cada fila en dict accediendo por índice, en lugar de
+buscar cada atributo por nombre en cada fila. FastJSONResponse codifica con
+orjson y, al devolverse directamente desde el handler, FastAPI no vuelve a
+validar las filas contra el response_model (que se mantiene para la
+documentación). Solo debe usarse con datos que ya tienen la forma del modelo.
+CachedJSON guarda en la caché de respuestas el JSON ya serializado y su ETag,
+así los aciertos no vuelven a serializar ni a hashear el cuerpo.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+import threading
+
+from fastapi import Response
+
+import tiempos
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json
+    orjson = None
+
+
+def _default(value):
+    # Lo que pyodbc devuelve y JSON no sabe representar
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, ensure_ascii=False, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        with tiempos.medir("serialize"):
+            return dumps(content)
+
+
+class CachedJSON:
+    # Entrada de ResponseCache.cached_json: el cuerpo y el ETag se calculan una vez, al guardarla
+    __slots__ = ("content", "body", "etag")
+
+    def __init__(self, content):
+        self.content = content
+        with tiempos.medir("serialize"):
+            self.body = dumps(content)
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+
+    def response(self):
+        return Response(self.body, media_type="application/json", headers={"ETag": self.etag})
+
+
+def json_response(content, response=None):
+    # Conserva las cabeceras puestas en el `response` inyectado (ETag, X-Next-After...)
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    return FastJSONResponse(content, headers=headers)
+
+
+def fecha_dia(value):
+    # datetime -> "AAAA-MM-DD" (lo que antes hacía strftime('%Y-%m-%d') fila a fila)
+    if value is None:
+        return None
+    if isinstance(value, datetime.date):
+        return value.isoformat()[:10]
+    return str(value)
+
+
+_mappers = {}
+_mappers_lock = threading.Lock()
+
+
+def row_mapper(description, fields=None):
+    """Devuelve una función fila -> dict precompilada para este cursor.description.
+
+    `fields` es {clave: columna} o {clave: (función, columna, ...)} para los
+    valores que hay que transformar; por defecto todas las columnas tal cual.
+    Los mappers se guardan por columnas y campos, así que solo se generan la
+    primera vez que se ve cada consulta.
+    """
+    columns = tuple(d[0] for d in description)
+    if fields is None:
+        fields = {name: name for name in columns}
+    cache_key = (columns, tuple(fields.items()))
+    with _mappers_lock:
+        mapper = _mappers.get(cache_key)
+    if mapper is not None:
+        return mapper
+
+    index = {name: i for i, name in enumerate(columns)}
+    namespace = {}
+    items = []
+    for key, spec in fields.items():
+        if isinstance(spec, str):
+            items.append(f"{key!r}: r[{index[spec]}]")
+        else:
+            func, *sources = spec
+            name = f"f{len(namespace)}"
+            namespace[name] = func
+            args = ", ".join(f"r[{index[source]}]" for source in sources)
+            items.append(f"{key!r}: {name}({args})")
+    source = "def mapper(r):\n    return {" + ", ".join(items) + "}\n"
+    exec(compile(source, "<row_mapper>", "exec"), namespace)
+    mapper = namespace["mapper"]
+    with _mappers_lock:
+        _mappers[cache_key] = mapper
+    return mapper
+
+
+def map_rows(cursor, rows, fields=None):
+    if not rows:
+        return []
+    with tiempos.medir("serialize"):
+        mapper = row_mapper(cursor.description, fields)
+        return [mapper(row) for row in rows]
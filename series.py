@@ -0,0 +1,145 @@
+"""Series temporales de ventas a partir de Ventas_diarias.
+
+La consulta solo filtra por un rango fecha >= ? AND fecha < ? (búsqueda por la
+clave primaria de Ventas_diarias) y agrupa por día. El agrupado en periodos
+(día, semana, mes o trimestre), sus etiquetas y el relleno de los periodos sin
+ventas se hacen aquí, en Python, en lugar de con MONTH()/FORMAT() por fila en
+SQL Server.
+
+consulta() devuelve (sql, parámetros, forma) para dashboard.run_query y
+run_batch; los endpoints de /ventas y los widgets del panel la usan con
+rangos distintos.
+"""
+import datetime
+
+GRANULARIDADES = ("day", "week", "month", "quarter")
+MAX_PERIODOS = 1000
+
+# Lo que devolvía FORMAT(fecha, 'MMM') con la cultura por defecto del servidor (en-US)
+MESES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+QUERY_SERIE = """
+    SELECT
+        fecha,
+        SUM(total) AS total,
+        SUM(num_ventas) AS num_ventas,
+        SUM(unidades) AS unidades
+    FROM
+        Ventas_diarias
+    WHERE
+        fecha >= ? AND fecha < ?
+    GROUP BY
+        fecha
+"""
+
+
+def inicio_periodo(fecha, granularidad):
+    if granularidad == "day":
+        return fecha
+    if granularidad == "week":
+        # Semanas ISO: empiezan en lunes
+        return fecha - datetime.timedelta(days=fecha.weekday())
+    if granularidad == "month":
+        return fecha.replace(day=1)
+    if granularidad == "quarter":
+        return fecha.replace(month=(fecha.month - 1) // 3 * 3 + 1, day=1)
+    raise ValueError(f"Granularidad desconocida: {granularidad}")
+
+
+def siguiente_periodo(inicio, granularidad):
+    if granularidad == "day":
+        return inicio + datetime.timedelta(days=1)
+    if granularidad == "week":
+        return inicio + datetime.timedelta(weeks=1)
+    meses = 1 if granularidad == "month" else 3
+    mes = inicio.month - 1 + meses
+    return inicio.replace(year=inicio.year + mes // 12, month=mes % 12 + 1, day=1)
+
+
+def etiqueta(inicio, granularidad):
+    if granularidad == "day":
+        return inicio.isoformat()
+    if granularidad == "week":
+        year, week, _ = inicio.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularidad == "month":
+        return f"{inicio.year}-{inicio.month:02d}"
+    return f"{inicio.year}-Q{(inicio.month - 1) // 3 + 1}"
+
+
+def periodos(desde, hasta, granularidad):
+    """Inicios de los periodos que cubren [desde, hasta] (ambos incluidos)."""
+    inicios = []
+    inicio = inicio_periodo(desde, granularidad)
+    while inicio <= hasta:
+        inicios.append(inicio)
+        if len(inicios) > MAX_PERIODOS:
+            raise ValueError(f"El rango tiene más de {MAX_PERIODOS} periodos")
+        inicio = siguiente_periodo(inicio, granularidad)
+    return inicios
+
+
+def agrupar(rows, desde, hasta, granularidad):
+    """Suma las filas diarias por periodo; los periodos sin ventas salen a cero.
+
+    El primer y el último periodo se recortan al rango pedido ("desde"/"hasta"
+    de cada punto).
+    """
+    inicios = periodos(desde, hasta, granularidad)
+    puntos = {}
+    for inicio in inicios:
+        fin = siguiente_periodo(inicio, granularidad) - datetime.timedelta(days=1)
+        puntos[inicio] = {
+            "periodo": etiqueta(inicio, granularidad),
+            "desde": max(inicio, desde),
+            "hasta": min(fin, hasta),
+            "total": 0.0,
+            "num_ventas": 0,
+            "unidades": 0,
+        }
+    for row in rows:
+        fecha = row.fecha
+        if isinstance(fecha, datetime.datetime):
+            fecha = fecha.date()
+        elif isinstance(fecha, str):
+            fecha = datetime.date.fromisoformat(fecha[:10])
+        punto = puntos.get(inicio_periodo(fecha, granularidad))
+        if punto is None:
+            continue
+        punto["total"] += float(row.total)
+        punto["num_ventas"] += row.num_ventas
+        punto["unidades"] += row.unidades
+    for punto in puntos.values():
+        # Quita el error de sumar en coma flotante los DECIMAL(18, 2) de cada día
+        punto["total"] = round(punto["total"], 2)
+    return [puntos[inicio] for inicio in inicios]
+
+
+def consulta(desde, hasta, granularidad, forma=None):
+    """(sql, parámetros, forma) de la serie entre `desde` y `hasta` (fechas, ambas incluidas).
+
+    `forma` recibe la lista de puntos ya agrupada y rellenada.
+    """
+    periodos(desde, hasta, granularidad)  # valida la granularidad y el tamaño del rango antes de consultar
+
+    def shape(rows):
+        puntos = agrupar(rows, desde, hasta, granularidad)
+        return forma(puntos) if forma is not None else puntos
+
+    return QUERY_SERIE, (desde, hasta + datetime.timedelta(days=1)), shape
+
+
+def mes_anterior(hoy=None):
+    """(primer día, último día) del mes natural anterior."""
+    hoy = hoy or datetime.date.today()
+    fin = hoy.replace(day=1) - datetime.timedelta(days=1)
+    return fin.replace(day=1), fin
+
+
+def ultimos_meses(n, hoy=None):
+    """(primer día, hoy) de los últimos `n` meses naturales, el actual incluido."""
+    hoy = hoy or datetime.date.today()
+    inicio = hoy.replace(day=1)
+    for _ in range(n - 1):
+        inicio = (inicio - datetime.timedelta(days=1)).replace(day=1)
+    return inicio, hoy
@@ -0,0 +1,144 @@
+"""Reserva de stock al crear pedidos.
+
+Las filas de Productos de un pedido se bloquean siempre en orden de
+id_producto, así dos pedidos con los mismos productos esperan uno al otro en
+lugar de interbloquearse. El descuento es condicional (unidades >= cantidad),
+de modo que el stock nunca queda negativo. Si aun así SQL Server elige la
+transacción como víctima de un interbloqueo, StockReservations.run la repite.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+
+DEADLOCK_RETRIES = 3
+RETRY_BACKOFF = 0.05
+
+# SQLSTATE 40001 (error 1205): la transacción ha sido elegida víctima de un interbloqueo
+DEADLOCK_SQLSTATE = "40001"
+DEADLOCK_ERROR = "1205"
+
+# UPDLOCK + HOLDLOCK mantiene el bloqueo de las filas leídas hasta el commit; la búsqueda
+# por la clave primaria recorre los ids de menor a mayor, que es el orden de bloqueo
+QUERY_BLOQUEO = """
+    SELECT id_producto, unidades
+    FROM Productos WITH (UPDLOCK, HOLDLOCK, ROWLOCK)
+    WHERE id_producto IN ({})
+    ORDER BY id_producto
+"""
+
+# Un único UPDATE por lote de productos; OUTPUT devuelve los que se han descontado y sus
+# unidades restantes
+QUERY_DESCUENTO = """
+    UPDATE Productos
+    SET unidades = unidades - CASE id_producto {casos} END
+    OUTPUT INSERTED.id_producto, INSERTED.unidades
+    WHERE id_producto IN ({ids}) AND unidades >= CASE id_producto {casos} END
+"""
+
+# Productos por UPDATE: 5 parámetros por producto y SQL Server admite 2100 por sentencia
+DESCUENTO_LOTE = 400
+
+# Productos por SELECT de bloqueo: un parámetro por producto
+BLOQUEO_LOTE = 2000
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        super().__init__(f"Stock insuficiente en {len(faltantes)} línea(s)")
+        self.faltantes = faltantes
+
+
+def es_interbloqueo(exc):
+    # pyodbc pone el SQLSTATE en args[0] y el número de error en el mensaje
+    args = getattr(exc, "args", ())
+    if args and args[0] == DEADLOCK_SQLSTATE:
+        return True
+    return f"({DEADLOCK_ERROR})" in str(exc)
+
+
+class StockReservations:
+    def __init__(self, retries=DEADLOCK_RETRIES, backoff=RETRY_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._stats = {"reservas": 0, "rechazadas": 0, "interbloqueos": 0, "reintentos_agotados": 0}
+
+    def reserve(self, cursor, lineas):
+        """Descuenta el stock de `lineas` (pares id_producto, cantidad) o lanza StockInsuficiente.
+
+        No hace commit: debe llamarse dentro de la transacción del pedido, antes
+        de escribir nada más, para que los bloqueos se tomen siempre primero y
+        en el mismo orden. StockInsuficiente.faltantes trae una entrada por
+        cada línea que no se puede servir. Devuelve {id_producto: unidades que
+        quedan} de los productos descontados. Una cantidad que no sea positiva
+        lanza ValueError (los modelos de la API ya la rechazan con un 422).
+        """
+        pedidas = defaultdict(int)
+        for id_producto, cantidad in lineas:
+            if cantidad <= 0:
+                # Con una cantidad negativa el descuento sumaría unidades
+                raise ValueError(f"La cantidad del producto {id_producto} debe ser mayor que 0")
+            pedidas[id_producto] += cantidad
+        ids = sorted(pedidas)
+        if not ids:
+            return {}
+
+        # Por tramos de ids ascendentes: el orden de bloqueo sigue siendo el mismo
+        disponibles = {}
+        for inicio in range(0, len(ids), BLOQUEO_LOTE):
+            lote = ids[inicio:inicio + BLOQUEO_LOTE]
+            cursor.execute(QUERY_BLOQUEO.format(", ".join("?" * len(lote))), lote)
+            disponibles.update((row.id_producto, row.unidades) for row in cursor.fetchall())
+
+        cortos = {i for i in ids if disponibles.get(i, 0) < pedidas[i]}
+        if not cortos:
+            # Las filas ya están bloqueadas; la condición unidades >= cantidad es la última defensa
+            descontados = {}
+            for inicio in range(0, len(ids), DESCUENTO_LOTE):
+                lote = ids[inicio:inicio + DESCUENTO_LOTE]
+                casos = " ".join("WHEN ? THEN ?" for _ in lote)
+                query = QUERY_DESCUENTO.format(casos=casos, ids=", ".join("?" * len(lote)))
+                casos_params = [v for i in lote for v in (i, pedidas[i])]
+                cursor.execute(query, casos_params + lote + casos_params)
+                descontados.update((row.id_producto, row.unidades) for row in cursor.fetchall())
+            cortos = set(ids) - descontados.keys()
+
+        if cortos:
+            with self._lock:
+                self._stats["rechazadas"] += 1
+            raise StockInsuficiente([
+                {
+                    "linea": i,
+                    "id_producto": id_producto,
+                    "cantidad": cantidad,
+                    "solicitado": pedidas[id_producto],
+                    "disponible": disponibles.get(id_producto),
+                }
+                for i, (id_producto, cantidad) in enumerate(lineas)
+                if id_producto in cortos
+            ])
+        with self._lock:
+            self._stats["reservas"] += 1
+        return descontados
+
+    def run(self, func, *args, **kwargs):
+        """Ejecuta una transacción completa y la repite si ha sido víctima de un interbloqueo."""
+        for intento in range(self.retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not es_interbloqueo(e):
+                    raise
+                with self._lock:
+                    self._stats["interbloqueos"] += 1
+                    if intento == self.retries:
+                        self._stats["reintentos_agotados"] += 1
+                if intento == self.retries:
+                    raise
+                # Espera exponencial con algo de azar para que las víctimas no choquen otra vez
+                time.sleep(self.backoff * 2 ** intento * random.uniform(0.5, 1.5))
+
+    def stats(self):
+        with self._lock:
+            return {"max_reintentos": self.retries, **self._stats}
@@ -0,0 +1,169 @@
+"""Índice en memoria de los productos con poco stock.
+
+Sustituye al COUNT(*) ... WHERE unidades <= 10 de cada petición. Guarda las
+unidades de cada producto y, aparte, la lista ordenada por (unidades,
+id_producto) de los que están en su umbral o por debajo. El número de
+productos con poco stock es su longitud y los k más cerca de agotarse son sus
+k primeros elementos.
+
+El umbral de un producto es el suyo propio si lo tiene, si no el de su
+categoría y si no el general.
+
+Se carga al arrancar y se actualiza con las escrituras de la API: al crear y
+editar productos (OUTPUT INSERTED de la propia sentencia), al borrarlos y al
+reservar el stock de los pedidos (stock.StockReservations.reserve devuelve
+las unidades que quedan). Los cambios de otros procesos llegan con la recarga
+periódica (recarga.PeriodicReload), así que pueden tardar un intervalo en
+verse; un cambio propio repetido sobre una lectura más nueva también puede
+dejar un valor antiguo hasta la siguiente recarga.
+"""
+import threading
+from bisect import bisect_left, insort
+
+STOCK_BAJO_UMBRAL = 10
+STOCK_BAJO_LIMIT = 20
+
+
+class LowStockIndex:
+    def __init__(self, umbral=STOCK_BAJO_UMBRAL, por_categoria=None, por_producto=None):
+        self._lock = threading.Lock()
+        self._carga = threading.Lock()  # una sola carga a la vez
+        self._umbral = umbral
+        self._por_categoria = dict(por_categoria or {})
+        self._por_producto = dict(por_producto or {})
+        self._productos = {}  # id_producto -> (nombre, categoria, unidades)
+        self._bajos = []  # (unidades, id_producto) de los que están en su umbral o por debajo
+        self._listo = False
+        self._pendientes = None  # cambios recibidos durante una carga
+
+    @property
+    def listo(self):
+        return self._listo
+
+    def _umbral_de(self, id_producto, categoria):
+        umbral = self._por_producto.get(id_producto)
+        if umbral is None:
+            umbral = self._por_categoria.get(categoria, self._umbral)
+        return umbral
+
+    def _quitar(self, id_producto):
+        producto = self._productos.pop(id_producto, None)
+        if producto is None:
+            return None
+        clave = (producto[2], id_producto)
+        i = bisect_left(self._bajos, clave)
+        if i < len(self._bajos) and self._bajos[i] == clave:
+            del self._bajos[i]
+        return producto
+
+    def _poner(self, id_producto, nombre, categoria, unidades):
+        self._quitar(id_producto)
+        self._productos[id_producto] = (nombre, categoria, unidades)
+        if unidades is not None and unidades <= self._umbral_de(id_producto, categoria):
+            insort(self._bajos, (unidades, id_producto))
+
+    def _aplicar(self, operacion, argumento):
+        if operacion == "actualizar":
+            self._poner(argumento.id_producto, argumento.nombre, argumento.categoria, argumento.unidades)
+        elif operacion == "unidades":
+            for id_producto, unidades in argumento.items():
+                producto = self._productos.get(id_producto)
+                if producto is not None:
+                    self._poner(id_producto, producto[0], producto[1], unidades)
+        else:
+            self._quitar(argumento)
+
+    def _registrar(self, operacion, argumento):
+        with self._lock:
+            self._aplicar(operacion, argumento)
+            if self._pendientes is not None:
+                self._pendientes.append((operacion, argumento))
+
+    def actualizar(self, producto):
+        """Añade o sustituye un producto (fila con id_producto, nombre, categoria y unidades)."""
+        self._registrar("actualizar", producto)
+
+    def actualizar_unidades(self, unidades):
+        """Nuevas unidades de productos ya conocidos ({id_producto: unidades})."""
+        if unidades:
+            self._registrar("unidades", dict(unidades))
+
+    def eliminar(self, id_producto):
+        self._registrar("eliminar", id_producto)
+
+    def cargar(self, leer):
+        """Sustituye el contenido por las filas de `leer()`.
+
+        Los cambios que llegan mientras se lee la tabla se repiten después
+        sobre lo leído, así no se pierden aunque la lectura sea anterior.
+        """
+        with self._carga:
+            with self._lock:
+                self._pendientes = []
+            try:
+                rows = leer()
+            except Exception:
+                with self._lock:
+                    self._pendientes = None
+                raise
+            with self._lock:
+                self._productos = {}
+                self._bajos = []
+                for row in rows:
+                    self._poner(row.id_producto, row.nombre, row.categoria, row.unidades)
+                for operacion, argumento in self._pendientes:
+                    self._aplicar(operacion, argumento)
+                self._pendientes = None
+                self._listo = True
+
+    def configurar(self, umbral=None, por_categoria=None, por_producto=None):
+        """Cambia los umbrales (los que no son None) y recalcula la lista."""
+        with self._lock:
+            if umbral is not None:
+                self._umbral = umbral
+            if por_categoria is not None:
+                self._por_categoria = dict(por_categoria)
+            if por_producto is not None:
+                self._por_producto = dict(por_producto)
+            self._bajos = sorted(
+                (unidades, id_producto)
+                for id_producto, (_, categoria, unidades) in self._productos.items()
+                if unidades is not None and unidades <= self._umbral_de(id_producto, categoria)
+            )
+
+    def umbrales(self):
+        with self._lock:
+            return {
+                "umbral": self._umbral,
+                "categorias": dict(self._por_categoria),
+                "productos": dict(self._por_producto),
+            }
+
+    def total(self):
+        return len(self._bajos)
+
+    def lista(self, limit=STOCK_BAJO_LIMIT):
+        """Número de productos con poco stock y los `limit` más cerca de agotarse."""
+        with self._lock:
+            productos = []
+            for unidades, id_producto in self._bajos[:limit]:
+                nombre, categoria, _ = self._productos[id_producto]
+                productos.append({
+                    "id_producto": id_producto,
+                    "nombre": nombre,
+                    "categoria": categoria,
+                    "unidades": unidades,
+                    "umbral": self._umbral_de(id_producto, categoria),
+                })
+            return {"total": len(self._bajos), "productos": productos}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "listo": self._listo,
+                "productos": len(self._productos),
+                "poco_stock": len(self._bajos),
+                "umbral": self._umbral,
+                "umbrales_categoria": len(self._por_categoria),
+                "umbrales_producto": len(self._por_producto),
+            }
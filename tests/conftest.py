@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos de la API están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standin import StandInDatabase, create_schema
+from db import ConnectionPool
+
+
+@pytest.fixture
+def standin(tmp_path):
+    # Base de datos sqlite con el esquema de la API (la de los benchmarks). En fichero: el nombre
+    # de las bases en memoria sale de id() y una prueba podría ver la de la anterior
+    db = StandInDatabase(str(tmp_path / "standin.db"))
+    create_schema(db)
+    return db
+
+
+@pytest.fixture
+def pool(standin):
+    # Pool sobre la base sqlite: get_connection de los módulos que lo necesitan es pool.acquire
+    pool = ConnectionPool("", min_size=0, max_size=4, timeout=5, connect=standin.connect)
+    yield pool
+    pool.close()
@@ -0,0 +1,81 @@
+import pytest
+
+from busqueda import ProductSearchIndex, distancia, normalizar
+
+PRODUCTOS = [
+    {"id_producto": 1, "nombre": "Teclado mecánico", "descripcion": "Interruptores rojos",
+     "categoria": "Periféricos", "marca": "Keychron", "tipo": None, "precio": 89.9},
+    {"id_producto": 2, "nombre": "Ratón inalámbrico", "descripcion": "Para teclado y portátil",
+     "categoria": "Periféricos", "marca": "Logitech", "tipo": None, "precio": 25},
+    {"id_producto": 3, "nombre": "Cámara web", "descripcion": "1080p",
+     "categoria": "Vídeo", "marca": "Logitech", "tipo": None, "precio": 60},
+    {"id_producto": 4, "nombre": "Monitor", "descripcion": "27 pulgadas",
+     "categoria": "Pantallas", "marca": "Dell", "tipo": None, "precio": 300},
+]
+
+
+@pytest.fixture
+def indice():
+    indice = ProductSearchIndex()
+    indice.reconstruir(lambda: PRODUCTOS)
+    return indice
+
+
+def _ids(indice, consulta):
+    return [p["id_producto"] for p in indice.buscar(consulta)]
+
+
+def test_normalizar_quita_mayusculas_y_tildes():
+    assert normalizar("Cámara PEQUEÑA") == "camara pequena"
+
+
+@pytest.mark.parametrize("a, b, maximo, esperada", [
+    ("teclado", "teclado", 1, 0),
+    ("teclado", "tecaldo", 1, 1),  # transposición
+    ("monitor", "monitr", 1, 1),
+    ("monitor", "mntr", 1, 2),  # supera el máximo
+    ("inalambrico", "inalambirco", 2, 1),
+])
+def test_distancia_con_transposiciones_y_corte(a, b, maximo, esperada):
+    assert distancia(a, b, maximo) == esperada
+
+
+def test_la_coincidencia_exacta_y_el_nombre_puntuan_mas(indice):
+    # "teclado" está en el nombre de 1 y en la descripción de 2
+    assert _ids(indice, "teclado") == [1, 2]
+    resultados = indice.buscar("teclado")
+    assert resultados[0]["puntuacion"] > resultados[1]["puntuacion"]
+
+
+def test_prefijo_tildes_y_erratas(indice):
+    assert _ids(indice, "tecl") == [1, 2]
+    assert _ids(indice, "camara") == [3]
+    assert _ids(indice, "monitr") == [4]
+    # Palabras cortas sin erratas
+    assert _ids(indice, "dul") == []
+
+
+def test_todas_las_palabras_tienen_que_encajar(indice):
+    assert _ids(indice, "logitech raton") == [2]
+    assert _ids(indice, "logitech monitor") == []
+
+
+def test_actualizar_y_eliminar_cambian_el_indice(indice):
+    indice.actualizar({**PRODUCTOS[3], "nombre": "Pantalla curva"})
+    assert _ids(indice, "monitor") == []
+    assert _ids(indice, "curva") == [4]
+    indice.eliminar(4)
+    assert _ids(indice, "curva") == []
+    assert indice.stats()["productos"] == 3
+
+
+def test_cambios_durante_la_reconstruccion_no_se_pierden(indice):
+    def cargar():
+        # Un producto creado mientras se lee el catálogo anterior
+        indice.actualizar({"id_producto": 5, "nombre": "Altavoces", "precio": 40})
+        assert indice.reconstruir(lambda: []) is False
+        return PRODUCTOS
+
+    assert indice.reconstruir(cargar) is True
+    assert _ids(indice, "altavoces") == [5]
+    assert indice.stats()["productos"] == 5
@@ -0,0 +1,75 @@
+import time
+
+from cache import ResponseCache
+
+
+def test_entrada_caduca_tras_su_ttl():
+    cache = ResponseCache()
+    cache.set("a", 1, ttl=0.01)
+    assert cache.get("a") == (True, 1)
+    time.sleep(0.02)
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["expired"] == 1
+
+
+def test_lru_descarta_la_menos_usada():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["evicted"] == 1
+
+
+def test_invalidar_borra_solo_las_entradas_con_la_etiqueta():
+    cache = ResponseCache()
+    cache.set("ventas", 1, ttl=60, tags=("ventas",))
+    cache.set("panel", 2, ttl=60, tags=("ventas", "productos"))
+    cache.set("usuarios", 3, ttl=60, tags=("usuarios",))
+    avisos = []
+    cache.add_listener(lambda *tags: avisos.append(tags))
+    cache.invalidate("ventas")
+    assert cache.get("ventas")[0] is False
+    assert cache.get("panel")[0] is False
+    assert cache.get("usuarios") == (True, 3)
+    assert avisos == [("ventas",)]
+    assert cache.stats()["invalidated"] == 2
+
+
+def test_cached_usa_la_funcion_y_los_argumentos_como_clave():
+    cache = ResponseCache()
+    llamadas = []
+
+    @cache.cached(ttl=60, tags=("ventas",))
+    def serie(granularidad, ids=None):
+        llamadas.append(granularidad)
+        return [granularidad, ids]
+
+    assert serie("month", ids=[1, 2]) == ["month", [1, 2]]
+    assert serie("month", ids=[1, 2]) == ["month", [1, 2]]
+    serie("day", ids=[1, 2])
+    assert llamadas == ["month", "day"]
+    cache.invalidate("ventas")
+    serie("month", ids=[1, 2])
+    assert llamadas == ["month", "day", "month"]
+
+
+def test_cached_json_sirve_los_mismos_bytes_y_etag():
+    cache = ResponseCache()
+    llamadas = []
+
+    @cache.cached_json(ttl=60)
+    def resumen(widgets=None):
+        llamadas.append(widgets)
+        return {"widgets": widgets}
+
+    primera = resumen(widgets=["a"])
+    segunda = resumen(widgets=["a"])
+    assert primera.body == segunda.body == b'{"widgets":["a"]}'
+    assert primera.headers["etag"] == segunda.headers["etag"]
+    assert primera.media_type == "application/json"
+    # contenido() comparte la entrada y devuelve el valor sin serializar
+    assert resumen.contenido(widgets=["a"]) == {"widgets": ["a"]}
+    assert llamadas == [["a"]]
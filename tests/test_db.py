@@ -0,0 +1,172 @@
+import threading
+import time
+
+import pytest
+
+from db import ConnectionPool, DBLimiter, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if self.conn.dead:
+            raise RuntimeError("conexión perdida")
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.dead = False
+        self.closed = False
+        self.rollbacks = 0
+        self.fail_rollback = False
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError("rollback fallido")
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnect:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self, connection_string):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+def make_pool(**kwargs):
+    connect = FakeConnect()
+    options = {"min_size": 1, "max_size": 2, "timeout": 0.2, "ping_after": 30}
+    options.update(kwargs)
+    return ConnectionPool("dsn", connect=connect, **options), connect
+
+
+def test_warm_abre_las_conexiones_minimas():
+    pool, connect = make_pool(min_size=2, max_size=3)
+    pool.warm()
+    assert len(connect.opened) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_checkout_reutiliza_la_conexion_devuelta():
+    pool, connect = make_pool()
+    with pool.acquire() as conn:
+        primera = conn._raw
+    with pool.acquire() as conn:
+        assert conn._raw is primera
+    stats = pool.stats()
+    assert len(connect.opened) == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0 and stats["idle"] == 1
+
+
+def test_checkout_espera_y_caduca_con_el_pool_lleno():
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    conn.close()
+    # Al devolverla, la siguiente petición la obtiene
+    pool.acquire().close()
+
+
+def test_checkout_despierta_al_devolver_una_conexion():
+    pool, _ = make_pool(max_size=1, timeout=2)
+    conn = pool.acquire()
+    threading.Timer(0.05, conn.close).start()
+    with pool.acquire():
+        pass
+    assert pool.stats()["waits"] == 1
+
+
+def test_release_deshace_la_transaccion_pendiente():
+    pool, connect = make_pool()
+    with pool.acquire():
+        pass
+    assert connect.opened[0].rollbacks == 1
+
+
+def test_release_descarta_la_conexion_si_falla_el_rollback():
+    pool, connect = make_pool()
+    with pool.acquire() as conn:
+        conn._raw.fail_rollback = True
+    stats = pool.stats()
+    assert connect.opened[0].closed
+    assert stats["discarded"] == 1 and stats["size"] == 0
+    with pool.acquire() as conn:
+        assert conn._raw is connect.opened[1]
+
+
+def test_conexion_caducada_se_recicla_al_sacarla():
+    pool, connect = make_pool(max_lifetime=60)
+    with pool.acquire() as conn:
+        # Creada hace más de max_lifetime
+        conn.created_at -= 61
+    with pool.acquire() as conn:
+        assert conn._raw is connect.opened[1]
+    assert connect.opened[0].closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_conexion_caducada_se_recicla_al_devolverla():
+    pool, connect = make_pool(max_lifetime=0.01)
+    with pool.acquire():
+        time.sleep(0.02)
+    assert connect.opened[0].closed
+    assert pool.stats()["idle"] == 0
+
+
+def test_conexion_inactiva_se_comprueba_antes_de_usarla():
+    pool, connect = make_pool(ping_after=0)
+    with pool.acquire():
+        pass
+    connect.opened[0].dead = True
+    with pool.acquire() as conn:
+        assert conn._raw is connect.opened[1]
+    assert pool.stats()["discarded"] == 1
+
+
+def test_pool_cerrado_no_entrega_conexiones():
+    pool, connect = make_pool()
+    pool.warm()
+    pool.close()
+    assert connect.opened[0].closed
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+
+def test_la_conexion_devuelve_la_plaza_del_limiter():
+    limiter = DBLimiter(1, timeout=0.05)
+    pool, _ = make_pool(max_size=2, limiter=limiter)
+    conn = pool.acquire()
+    assert limiter.stats()["in_use"] == 1
+    # El pool admite dos conexiones pero el límite de trabajo de BD es una
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    conn.close()
+    conn.close()  # cerrar dos veces no libera dos plazas
+    assert limiter.stats()["in_use"] == 0
+    pool.acquire().close()
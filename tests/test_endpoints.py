@@ -0,0 +1,187 @@
+"""Pruebas de los endpoints de api.py y main.py sobre la base sqlite de los benchmarks.
+
+Cada aplicación se arranca una vez por módulo (su pool se cierra al pararla),
+así que las pruebas que escriben usan sus propios productos o pedidos.
+"""
+import datetime
+import gzip
+import importlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_endpoints import sembrar
+from benchmarks.standin import StandInDatabase, create_schema
+from paginacion import NEXT_HEADER
+
+PRODUCTOS = 60
+
+
+@pytest.fixture(scope="module", params=["api", "main"])
+def app(request, tmp_path_factory):
+    db = StandInDatabase(str(tmp_path_factory.mktemp(request.param) / "standin.db"))
+    create_schema(db)
+    sembrar(db, PRODUCTOS, 20, 200)
+    mod = importlib.import_module(request.param)
+    mod.pool.connect = db.connect
+    mod.cache.clear()
+    with TestClient(mod.app) as client:
+        yield SimpleNamespace(nombre=request.param, mod=mod, client=client, db=db)
+
+
+def _consulta(app, sql, *params):
+    conn = app.db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, *params)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def _ejecutar(app, sql, *params):
+    conn = app.db.connect()
+    try:
+        conn.cursor().execute(sql, *params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_paginacion_por_clave_recorre_todo_el_catalogo(app):
+    ids = []
+    after = None
+    while True:
+        params = {"limit": 25, **({"after": after} if after else {})}
+        r = app.client.get("/productos", params=params)
+        assert r.status_code == 200
+        ids += [p["id_producto"] for p in r.json()]
+        after = r.headers.get(NEXT_HEADER)
+        if after is None:
+            break
+    assert ids == list(range(1, PRODUCTOS + 1))
+
+
+def test_etag_devuelve_304_y_distingue_filtros(app):
+    r = app.client.get("/productos", params={"categoria": "no-existe"})
+    etag = r.headers["etag"]
+    assert r.json() == []
+    assert app.client.get("/productos", params={"categoria": "tampoco"}).headers["etag"] != etag
+    r = app.client.get("/productos", params={"categoria": "no-existe"}, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+
+def test_etag_cambia_al_editar_el_producto(app):
+    etag = app.client.get("/productos/1").headers["etag"]
+    _ejecutar(app, "UPDATE Productos SET precio = precio + 1 WHERE id_producto = 1")
+    r = app.client.get("/productos/1", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+
+def test_resumen_del_panel_coincide_con_los_endpoints(app):
+    resumen = app.client.get("/dashboard/resumen", params={"widgets": "ventas_mensual,poco_stock"}).json()
+    assert resumen == {
+        "ventas_mensual": app.client.get("/ventas/mensual").json(),
+        "poco_stock": app.client.get("/productos/poco_stock").json(),
+    }
+    assert app.client.get("/dashboard/resumen", params={"widgets": "no_existe"}).status_code == 400
+
+
+def test_respuestas_cacheadas_se_comprimen_una_vez(app):
+    cabeceras = {"Accept-Encoding": "gzip"}
+    antes = app.mod.compressed_cache.stats()
+    primera = app.client.get("/dashboard/resumen", headers=cabeceras)
+    segunda = app.client.get("/dashboard/resumen", headers=cabeceras)
+    assert primera.headers["content-encoding"] == "gzip"
+    assert primera.headers["etag"] == segunda.headers["etag"]
+    assert primera.headers["etag"].startswith("W/")
+    assert segunda.json() == app.client.get("/dashboard/resumen", headers={"Accept-Encoding": "identity"}).json()
+    despues = app.mod.compressed_cache.stats()
+    assert despues["hits"] - antes["hits"] >= 1
+    assert despues["por_etag"] - antes["por_etag"] == 2
+
+
+def test_foto_solo_redirige_a_urls_http(app):
+    _ejecutar(app, "UPDATE Productos SET foto = ? WHERE id_producto = 2", ("https://cdn.example.com/2.png",))
+    _ejecutar(app, "UPDATE Productos SET foto = ? WHERE id_producto = 3", ("javascript:alert(1)",))
+    r = app.client.get("/productos/2/foto", follow_redirects=False)
+    assert r.status_code == 307 and r.headers["location"] == "https://cdn.example.com/2.png"
+    assert app.client.get("/productos/3/foto").status_code == 404
+    assert app.client.get("/productos/4/foto").status_code == 404
+
+
+def _cuerpo_pedido(lineas):
+    return {
+        "id_usuario": 1,
+        "fecha_pedido": datetime.date.today().isoformat(),
+        "estado": "pendiente",
+        "direccion": "Calle Mayor 1",
+        "ciudad": "Madrid",
+        "pais": "España",
+        "codigo_postal": "28001",
+        "metodo_pago": "tarjeta",
+        "cantidad_total": sum(l["cantidad"] * l["precio"] for l in lineas),
+        "lineas": lineas,
+    }
+
+
+def _ventas_del_dia(app, fecha, producto_id):
+    rows = _consulta(
+        app, "SELECT unidades FROM Ventas_diarias WHERE fecha = ? AND producto_id = ?", (fecha, producto_id)
+    )
+    return rows[0].unidades if rows else 0
+
+
+def test_editar_pedido_reescribe_lineas_y_ajusta_el_resumen(app):
+    pedido = _consulta(app, "SELECT id, DATE(fecha_pedido) AS fecha FROM Pedidos WHERE id = 7")[0]
+    lineas = _consulta(app, "SELECT id_producto, cantidad FROM Linea_pedidos WHERE id_orden = 7")
+    producto = PRODUCTOS  # se sustituyen todas las líneas por una del último producto
+    antes = _ventas_del_dia(app, pedido.fecha, producto)
+    r = app.client.put("/pedidos/7", json=_cuerpo_pedido([{"id_producto": producto, "cantidad": 3, "precio": 2.5}]))
+    assert r.status_code == 200
+    nuevas = _consulta(app, "SELECT id_producto, cantidad, precio FROM Linea_pedidos WHERE id_orden = 7")
+    assert [tuple(l) for l in nuevas] == [(producto, 3, 2.5)]
+    quitadas = sum(l.cantidad for l in lineas if l.id_producto == producto)
+    assert _ventas_del_dia(app, pedido.fecha, producto) == antes - quitadas + 3
+
+
+def test_cantidades_no_positivas_se_rechazan(app):
+    r = app.client.put("/pedidos/8", json=_cuerpo_pedido([{"id_producto": 1, "cantidad": 0, "precio": 1}]))
+    assert r.status_code == 422
+
+
+def test_crear_pedido_reserva_stock_y_registra_ventas(app):
+    if app.nombre != "api":
+        pytest.skip("main.py no crea pedidos")
+    _ejecutar(app, "UPDATE Productos SET unidades = 5 WHERE id_producto IN (10, 11)")
+    hoy = datetime.date.today()
+    antes = _ventas_del_dia(app, hoy, 10)
+    lineas = [{"id_producto": 10, "cantidad": 2, "precio": 4.0}, {"id_producto": 11, "cantidad": 5, "precio": 1.0}]
+    r = app.client.post("/pedidos", json=_cuerpo_pedido(lineas))
+    assert r.status_code == 200
+    pedido_id = r.json()["id_pedido"]
+    guardadas = _consulta(app, "SELECT id_producto, cantidad FROM Linea_pedidos WHERE id_orden = ? ORDER BY id_producto",
+                          (pedido_id,))
+    assert [tuple(l) for l in guardadas] == [(10, 2), (11, 5)]
+    stock = _consulta(app, "SELECT unidades FROM Productos WHERE id_producto IN (10, 11) ORDER BY id_producto")
+    assert [row.unidades for row in stock] == [3, 0]
+    assert _ventas_del_dia(app, hoy, 10) == antes + 2
+
+    # Sin stock: 409 con la línea que falta y sin tocar nada
+    r = app.client.post("/pedidos", json=_cuerpo_pedido([{"id_producto": 11, "cantidad": 1, "precio": 1.0}]))
+    assert r.status_code == 409
+    assert r.json()["detail"]["faltantes"][0]["disponible"] == 0
+    assert _ventas_del_dia(app, hoy, 10) == antes + 2
+
+
+def test_idempotency_key_no_repite_el_pedido(app):
+    if app.nombre != "api":
+        pytest.skip("main.py no crea pedidos")
+    cuerpo = _cuerpo_pedido([{"id_producto": 12, "cantidad": 1, "precio": 3.0}])
+    cabeceras = {"Idempotency-Key": "prueba-1"}
+    primera = app.client.post("/pedidos", json=cuerpo, headers=cabeceras)
+    segunda = app.client.post("/pedidos", json=cuerpo, headers=cabeceras)
+    assert primera.status_code == segunda.status_code == 200
+    assert primera.json() == segunda.json()
+    assert segunda.headers["idempotent-replayed"] == "true"
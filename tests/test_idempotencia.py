@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from idempotencia import REPLAYED_HEADER, IdempotencyStore
+
+
+class Pedido:
+    # Corrutina que cuenta sus ejecuciones; `error` la hace fallar con ese código
+    def __init__(self, error=None):
+        self.ejecuciones = 0
+        self.error = error
+        self.liberar = asyncio.Event()
+        self.liberar.set()
+
+    async def __call__(self):
+        self.ejecuciones += 1
+        await self.liberar.wait()
+        if self.error:
+            raise HTTPException(status_code=self.error, detail="fallo")
+        return {"pedido_id": self.ejecuciones}
+
+
+def test_la_repeticion_devuelve_la_respuesta_guardada():
+    async def escenario():
+        store = IdempotencyStore()
+        pedido = Pedido()
+        assert await store.run("k", '{"a": 1}', pedido) == {"pedido_id": 1}
+        repetida = await store.run("k", '{"a": 1}', pedido)
+        assert isinstance(repetida, JSONResponse)
+        assert repetida.body == b'{"pedido_id":1}'
+        assert repetida.headers[REPLAYED_HEADER] == "true"
+        assert pedido.ejecuciones == 1
+
+    asyncio.run(escenario())
+
+
+def test_la_misma_clave_con_otro_cuerpo_es_un_422():
+    async def escenario():
+        store = IdempotencyStore()
+        await store.run("k", '{"a": 1}', Pedido())
+        with pytest.raises(HTTPException) as error:
+            await store.run("k", '{"a": 2}', Pedido())
+        assert error.value.status_code == 422
+
+    asyncio.run(escenario())
+
+
+def test_la_repeticion_espera_a_la_original_en_curso():
+    async def escenario():
+        store = IdempotencyStore()
+        pedido = Pedido()
+        pedido.liberar.clear()
+        original = asyncio.create_task(store.run("k", "{}", pedido))
+        await asyncio.sleep(0)
+        repetida = asyncio.create_task(store.run("k", "{}", pedido))
+        await asyncio.sleep(0)
+        pedido.liberar.set()
+        assert await original == {"pedido_id": 1}
+        assert (await repetida).body == b'{"pedido_id":1}'
+        assert pedido.ejecuciones == 1
+        assert store.stats()["esperas"] == 1
+
+    asyncio.run(escenario())
+
+
+def test_los_errores_del_cliente_se_repiten_y_los_del_servidor_liberan_la_clave():
+    async def escenario():
+        store = IdempotencyStore()
+        sin_stock = Pedido(error=409)
+        with pytest.raises(HTTPException):
+            await store.run("cliente", "{}", sin_stock)
+        repetida = await store.run("cliente", "{}", sin_stock)
+        assert repetida.status_code == 409
+        assert repetida.body == b'{"detail":"fallo"}'
+        assert sin_stock.ejecuciones == 1
+
+        caido = Pedido(error=500)
+        with pytest.raises(HTTPException):
+            await store.run("servidor", "{}", caido)
+        caido.error = None
+        assert await store.run("servidor", "{}", caido) == {"pedido_id": 2}
+
+    asyncio.run(escenario())
+
+
+def test_las_claves_caducan():
+    async def escenario():
+        store = IdempotencyStore(ttl=0)
+        pedido = Pedido()
+        await store.run("k", "{}", pedido)
+        assert await store.run("k", "{}", pedido) == {"pedido_id": 2}
+
+    asyncio.run(escenario())
@@ -0,0 +1,84 @@
+import datetime
+
+import pytest
+
+from dashboard import run_batch, run_query
+from series import agrupar, consulta, mes_anterior, periodos, ultimos_meses
+from ventas_diarias import registrar_ventas
+
+D = datetime.date
+
+
+class Fila:
+    def __init__(self, fecha, total, num_ventas=1, unidades=1):
+        self.fecha = fecha
+        self.total = total
+        self.num_ventas = num_ventas
+        self.unidades = unidades
+
+
+@pytest.mark.parametrize("granularidad, esperados", [
+    ("day", [D(2024, 2, 28), D(2024, 2, 29), D(2024, 3, 1)]),
+    ("week", [D(2024, 2, 26)]),
+    ("month", [D(2024, 2, 1), D(2024, 3, 1)]),
+    ("quarter", [D(2024, 1, 1)]),
+])
+def test_periodos_cubren_el_rango(granularidad, esperados):
+    assert periodos(D(2024, 2, 28), D(2024, 3, 1), granularidad) == esperados
+
+
+def test_periodos_rechaza_rangos_enormes_y_granularidades_desconocidas():
+    with pytest.raises(ValueError):
+        periodos(D(2000, 1, 1), D(2024, 1, 1), "day")
+    with pytest.raises(ValueError):
+        periodos(D(2024, 1, 1), D(2024, 2, 1), "year")
+
+
+def test_agrupar_suma_por_periodo_rellena_y_recorta():
+    rows = [
+        Fila(D(2024, 1, 31), "10.10"),
+        Fila(datetime.datetime(2024, 1, 15, 9, 30), 0.2, num_ventas=2, unidades=3),
+        Fila("2024-03-02", 5),
+        Fila(D(2023, 12, 31), 99),  # fuera del rango
+    ]
+    assert agrupar(rows, D(2024, 1, 10), D(2024, 3, 5), "month") == [
+        {"periodo": "2024-01", "desde": D(2024, 1, 10), "hasta": D(2024, 1, 31),
+         "total": 10.3, "num_ventas": 3, "unidades": 4},
+        {"periodo": "2024-02", "desde": D(2024, 2, 1), "hasta": D(2024, 2, 29),
+         "total": 0.0, "num_ventas": 0, "unidades": 0},
+        {"periodo": "2024-03", "desde": D(2024, 3, 1), "hasta": D(2024, 3, 5),
+         "total": 5.0, "num_ventas": 1, "unidades": 1},
+    ]
+
+
+def test_etiquetas_de_semana_y_trimestre():
+    semanas = agrupar([], D(2024, 12, 30), D(2025, 1, 6), "week")
+    assert [p["periodo"] for p in semanas] == ["2025-W01", "2025-W02"]
+    trimestres = agrupar([], D(2024, 3, 31), D(2024, 4, 1), "quarter")
+    assert [p["periodo"] for p in trimestres] == ["2024-Q1", "2024-Q2"]
+
+
+def test_rangos_relativos_a_hoy():
+    assert mes_anterior(D(2024, 3, 15)) == (D(2024, 2, 1), D(2024, 2, 29))
+    assert mes_anterior(D(2024, 1, 1)) == (D(2023, 12, 1), D(2023, 12, 31))
+    assert ultimos_meses(12, D(2024, 3, 15)) == (D(2023, 4, 1), D(2024, 3, 15))
+
+
+def test_consulta_sobre_ventas_diarias(standin, pool):
+    conn = standin.connect()
+    registrar_ventas(conn.cursor(), D(2024, 3, 31), [(1, 2, 20.0)])
+    registrar_ventas(conn.cursor(), D(2024, 4, 1), [(1, 1, 10.0), (2, 1, 5.5)])
+    registrar_ventas(conn.cursor(), D(2024, 4, 2), [(2, 1, 7.0)])
+    conn.commit()
+    conn.close()
+
+    # El extremo "hasta" se incluye entero
+    dias = run_query(pool.acquire, consulta(D(2024, 4, 1), D(2024, 4, 1), "day"))
+    assert [(p["periodo"], p["total"], p["num_ventas"]) for p in dias] == [("2024-04-01", 15.5, 2)]
+
+    lote = run_batch(pool.acquire, [
+        ("meses", consulta(D(2024, 3, 1), D(2024, 4, 30), "month", lambda puntos: [p["total"] for p in puntos]), None),
+        ("trimestre", consulta(D(2024, 1, 1), D(2024, 6, 30), "quarter"), None),
+    ])
+    assert lote["meses"] == [20.0, 22.5]
+    assert [p["unidades"] for p in lote["trimestre"]] == [2, 3]
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from cache import ResponseCache
+
+
+def _esperar(cache, stat, n=1):
+    # Hasta que el contador llegue a n (el líder calculando, los demás esperándolo)
+    limite = time.monotonic() + 2
+    while cache.stats()[stat] < n:
+        assert time.monotonic() < limite, f"{stat} no llega a {n}"
+        time.sleep(0.001)
+
+
+def test_llamadas_simultaneas_comparten_un_solo_calculo():
+    cache = ResponseCache()
+    liberar = threading.Event()
+    llamadas = []
+
+    def compute():
+        llamadas.append(1)
+        liberar.wait(2)
+        return "resultado"
+
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda: resultados.append(cache.get_or_compute("k", compute, ttl=60)))
+        for _ in range(5)
+    ]
+    hilos[0].start()
+    _esperar(cache, "in_flight")
+    for hilo in hilos[1:]:
+        hilo.start()
+    _esperar(cache, "coalesced", 4)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join()
+    assert resultados == ["resultado"] * 5
+    assert len(llamadas) == 1
+
+
+def test_el_error_se_comparte_y_no_se_guarda():
+    cache = ResponseCache()
+    liberar = threading.Event()
+
+    def falla():
+        liberar.wait(2)
+        raise ValueError("sin conexión")
+
+    errores = []
+
+    def llamar():
+        try:
+            cache.get_or_compute("k", falla, ttl=60)
+        except ValueError as e:
+            errores.append(e)
+
+    lider = threading.Thread(target=llamar)
+    lider.start()
+    _esperar(cache, "in_flight")
+    seguidor = threading.Thread(target=llamar)
+    seguidor.start()
+    _esperar(cache, "coalesced")
+    liberar.set()
+    lider.join()
+    seguidor.join()
+    assert len(errores) == 2 and errores[0] is errores[1]
+    assert cache.get_or_compute("k", lambda: "bien", ttl=60) == "bien"
+
+
+def test_invalidar_durante_el_calculo_no_guarda_el_resultado():
+    cache = ResponseCache()
+    empezado = threading.Event()
+    liberar = threading.Event()
+
+    def compute():
+        empezado.set()
+        liberar.wait(2)
+        return "antiguo"
+
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(cache.get_or_compute("k", compute, 60, ("ventas",))))
+    hilo.start()
+    empezado.wait(2)
+    # Una escritura mientras se lee: el valor leído puede ser anterior a ella
+    cache.invalidate("ventas")
+    liberar.set()
+    hilo.join()
+    assert resultado == ["antiguo"]
+    assert cache.get("k") == (False, None)
+    assert cache.get_or_compute("k", lambda: "nuevo", 60, ("ventas",)) == "nuevo"
+
+
+def test_la_excepcion_del_lider_llega_al_llamante():
+    cache = ResponseCache()
+    with pytest.raises(KeyError):
+        cache.get_or_compute("k", lambda: {}["x"], ttl=60)
+    assert cache.stats()["in_flight"] == 0
@@ -0,0 +1,91 @@
+import pytest
+
+import stock
+from stock import StockInsuficiente, StockReservations
+
+
+@pytest.fixture
+def conn(standin):
+    standin.executemany(
+        "INSERT INTO Productos (id_producto, nombre, unidades) VALUES (?, ?, ?)",
+        [(i, f"Producto {i}", 10) for i in range(1, 11)],
+    )
+    conn = standin.connect()
+    yield conn
+    conn.close()
+
+
+def _unidades(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id_producto, unidades FROM Productos ORDER BY id_producto")
+    return {row.id_producto: row.unidades for row in cursor.fetchall()}
+
+
+def test_reserva_descuenta_y_devuelve_lo_que_queda(conn):
+    reservas = StockReservations()
+    quedan = reservas.reserve(conn.cursor(), [(2, 3), (1, 10), (2, 4)])
+    assert quedan == {1: 0, 2: 3}
+    assert _unidades(conn)[1] == 0 and _unidades(conn)[2] == 3
+    assert reservas.stats()["reservas"] == 1
+
+
+def test_faltantes_trae_cada_linea_que_no_se_puede_servir(conn):
+    reservas = StockReservations()
+    with pytest.raises(StockInsuficiente) as error:
+        # El producto 2 se pide en dos líneas que juntas superan su stock; el 99 no existe
+        reservas.reserve(conn.cursor(), [(1, 1), (2, 6), (99, 1), (2, 5)])
+    assert error.value.faltantes == [
+        {"linea": 1, "id_producto": 2, "cantidad": 6, "solicitado": 11, "disponible": 10},
+        {"linea": 2, "id_producto": 99, "cantidad": 1, "solicitado": 1, "disponible": None},
+        {"linea": 3, "id_producto": 2, "cantidad": 5, "solicitado": 11, "disponible": 10},
+    ]
+    # No se descuenta nada
+    assert set(_unidades(conn).values()) == {10}
+    assert reservas.stats()["rechazadas"] == 1
+
+
+def test_cantidad_no_positiva_se_rechaza(conn):
+    with pytest.raises(ValueError):
+        StockReservations().reserve(conn.cursor(), [(1, 2), (2, 0)])
+    with pytest.raises(ValueError):
+        StockReservations().reserve(conn.cursor(), [(1, -3)])
+    assert set(_unidades(conn).values()) == {10}
+
+
+def test_pedidos_grandes_se_bloquean_y_descuentan_por_tramos(conn, monkeypatch):
+    monkeypatch.setattr(stock, "BLOQUEO_LOTE", 3)
+    monkeypatch.setattr(stock, "DESCUENTO_LOTE", 4)
+    quedan = StockReservations().reserve(conn.cursor(), [(i, i) for i in range(10, 0, -1)])
+    assert quedan == {i: 10 - i for i in range(1, 11)}
+    assert _unidades(conn) == quedan
+
+
+def test_run_repite_las_victimas_de_interbloqueo():
+    reservas = StockReservations(retries=2, backoff=0)
+    intentos = []
+
+    def transaccion():
+        intentos.append(1)
+        if len(intentos) < 3:
+            raise Exception("40001", "Transaction (Process ID 52) was deadlocked (1205)")
+        return "hecho"
+
+    assert reservas.run(transaccion) == "hecho"
+    assert reservas.stats()["interbloqueos"] == 2
+
+
+def test_run_no_repite_otros_errores_ni_pasa_del_limite():
+    reservas = StockReservations(retries=1, backoff=0)
+
+    def otro_error():
+        raise RuntimeError("otro")
+
+    def interbloqueo():
+        raise Exception("40001", "deadlock")
+
+    with pytest.raises(RuntimeError):
+        reservas.run(otro_error)
+    assert reservas.stats()["interbloqueos"] == 0
+    with pytest.raises(Exception, match="deadlock"):
+        reservas.run(interbloqueo)
+    assert reservas.stats()["reintentos_agotados"] == 1
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from stock_bajo import LowStockIndex
+
+Fila = namedtuple("Fila", "id_producto nombre categoria unidades")
+
+PRODUCTOS = [
+    Fila(1, "Tornillos", "ferreteria", 3),
+    Fila(2, "Clavos", "ferreteria", 12),
+    Fila(3, "Martillo", "herramientas", 8),
+    Fila(4, "Sierra", "herramientas", 30),
+    Fila(5, "Cinta", None, None),
+]
+
+
+def _indice(**umbrales):
+    indice = LowStockIndex(10, **umbrales)
+    indice.cargar(lambda: PRODUCTOS)
+    return indice
+
+
+def _ids(indice):
+    return [p["id_producto"] for p in indice.lista()["productos"]]
+
+
+def test_lista_los_que_estan_en_su_umbral_de_menos_a_mas_unidades():
+    indice = _indice()
+    assert indice.total() == 2
+    assert indice.lista(limit=1) == {
+        "total": 2,
+        "productos": [{"id_producto": 1, "nombre": "Tornillos", "categoria": "ferreteria", "unidades": 3, "umbral": 10}],
+    }
+    assert _ids(indice) == [1, 3]
+
+
+def test_umbral_de_producto_antes_que_el_de_categoria():
+    indice = _indice(por_categoria={"ferreteria": 15}, por_producto={1: 2})
+    # 1 tiene su propio umbral (2), 2 el de su categoría (15) y 3 el general (10)
+    assert _ids(indice) == [3, 2]
+
+
+def test_configurar_recalcula_la_lista():
+    indice = _indice()
+    indice.configurar(umbral=40)
+    assert _ids(indice) == [1, 3, 2, 4]
+    indice.configurar(por_categoria={"herramientas": 0})
+    assert _ids(indice) == [1, 2]
+
+
+def test_escrituras_mueven_los_productos_dentro_y_fuera_de_la_lista():
+    indice = _indice()
+    indice.actualizar_unidades({2: 1, 1: 50, 99: 0})  # el 99 no es conocido y se ignora
+    assert _ids(indice) == [2, 3]
+    indice.actualizar(Fila(6, "Brocas", "ferreteria", 0))
+    indice.eliminar(3)
+    assert _ids(indice) == [6, 2]
+
+
+def test_cambios_durante_la_carga_se_repiten_sobre_lo_leido():
+    indice = _indice()
+
+    def leer():
+        # Una reserva de stock confirmada mientras se lee la tabla con el valor anterior
+        indice.actualizar_unidades({4: 5})
+        return PRODUCTOS
+
+    indice.cargar(leer)
+    assert _ids(indice) == [1, 4, 3]
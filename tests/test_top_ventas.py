@@ -0,0 +1,101 @@
+import datetime
+
+import pytest
+
+import top_ventas
+from top_ventas import TopSellers
+from ventas_diarias import registrar_ventas
+
+HOY = datetime.date(2024, 6, 30)
+
+
+class Reloj:
+    def __init__(self, dia):
+        self.dia = dia
+
+    def __call__(self):
+        return self.dia
+
+
+def _unidades(top, ventana):
+    return {fila["id_producto"]: fila["unidades_vendidas"] for fila in top.top(ventana, k=100)}
+
+
+def test_cada_venta_cuenta_en_las_ventanas_que_la_incluyen():
+    top = TopSellers(hoy=Reloj(HOY))
+    top.registrar(HOY, [(1, 2, 20)])
+    top.registrar(HOY - datetime.timedelta(days=10), [(2, 3, 30)])
+    top.registrar(HOY - datetime.timedelta(days=100), [(3, 4, 40)])
+    assert _unidades(top, "7d") == {1: 2}
+    assert _unidades(top, "30d") == {1: 2, 2: 3}
+    assert _unidades(top, "total") == {1: 2, 2: 3, 3: 4}
+
+
+def test_los_dias_salen_de_la_ventana_al_avanzar():
+    reloj = Reloj(HOY)
+    top = TopSellers(hoy=reloj)
+    top.registrar(HOY, [(1, 2, 20)])
+    reloj.dia = HOY + datetime.timedelta(days=6)
+    assert _unidades(top, "7d") == {1: 2}
+    reloj.dia = HOY + datetime.timedelta(days=7)
+    assert _unidades(top, "7d") == {}
+    assert _unidades(top, "30d") == {1: 2}
+    # Un salto mayor que el buffer vacía las ventanas pero no el histórico
+    reloj.dia = HOY + datetime.timedelta(days=45)
+    assert _unidades(top, "30d") == {}
+    assert _unidades(top, "total") == {1: 2}
+
+
+def test_ajustar_resta_unidades_sin_contar_ventas():
+    top = TopSellers(hoy=Reloj(HOY))
+    top.registrar(HOY, [(1, 5, 50), (2, 1, 10)])
+    top.ajustar(HOY, [(1, -5, -50), (2, 2, 20)])
+    assert top.top("7d") == [
+        {"id_producto": 2, "unidades_vendidas": 3, "ingresos_totales": 30.0, "num_ventas": 1},
+    ]
+
+
+def test_top_ordena_por_unidades_e_ingresos_y_corta_en_k():
+    top = TopSellers(hoy=Reloj(HOY))
+    top.registrar(HOY, [(1, 5, 10), (2, 5, 50), (3, 9, 1), (4, 1, 100)])
+    assert [fila["id_producto"] for fila in top.top("total", k=3)] == [3, 2, 1]
+
+
+def test_cargar_desde_el_resumen_da_los_mismos_contadores(standin, pool):
+    conn = standin.connect()
+    cursor = conn.cursor()
+    registrar_ventas(cursor, HOY, [(1, 2, 20.0), (2, 1, 5.0)])
+    registrar_ventas(cursor, HOY - datetime.timedelta(days=20), [(2, 4, 40.0)])
+    registrar_ventas(cursor, HOY - datetime.timedelta(days=200), [(3, 7, 70.0)])
+    conn.commit()
+    conn.close()
+
+    incremental = TopSellers(hoy=Reloj(HOY))
+    incremental.registrar(HOY, [(1, 2, 20.0), (2, 1, 5.0)])
+    incremental.registrar(HOY - datetime.timedelta(days=20), [(2, 4, 40.0)])
+    incremental.registrar(HOY - datetime.timedelta(days=200), [(3, 7, 70.0)])
+
+    cargado = TopSellers(hoy=Reloj(HOY))
+    assert cargado.cargar(pool.acquire) is True
+    assert cargado.listo
+    for ventana in top_ventas.VENTANAS:
+        assert cargado.top(ventana, k=10) == incremental.top(ventana, k=10)
+
+
+def test_cargar_se_descarta_si_una_escritura_no_termina(pool, monkeypatch):
+    monkeypatch.setattr(top_ventas, "ESPERA_ESCRITURAS", 0.05)
+    top = TopSellers(hoy=Reloj(HOY))
+    top.registrar(HOY, [(1, 2, 20)])
+    with top.escritura():
+        assert top.cargar(pool.acquire) is False
+    # Los contadores no se han tocado y la siguiente carga ya no espera
+    assert _unidades(top, "total") == {1: 2}
+    assert top.cargar(pool.acquire) is True
+    assert _unidades(top, "total") == {}
+
+
+@pytest.mark.parametrize("fecha", [HOY, HOY.isoformat(), f"{HOY.isoformat()} 10:30:00"])
+def test_registrar_acepta_fechas_de_pyodbc_y_texto(fecha):
+    top = TopSellers(hoy=Reloj(HOY))
+    top.registrar(fecha, [(1, 1, 1)])
+    assert _unidades(top, "7d") == {1: 1}
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+from ventas_diarias import ajustar_ventas, reconstruir, registrar_ventas
+
+DIA = datetime.date(2024, 3, 5)
+
+
+@pytest.fixture
+def conn(standin):
+    conn = standin.connect()
+    yield conn
+    conn.close()
+
+
+def _resumen(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT fecha, producto_id, total, num_ventas, unidades FROM Ventas_diarias ORDER BY fecha, producto_id"
+    )
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _vender(conn, fecha, ventas):
+    # Lo que hace crear_pedido: filas en Ventas y su suma en el resumen, en la misma transacción
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO Ventas (producto_id, fecha_venta, cantidad, total) VALUES (?, ?, ?, ?)",
+        [(producto_id, datetime.datetime.combine(fecha, datetime.time(12)), cantidad, total)
+         for producto_id, cantidad, total in ventas],
+    )
+    registrar_ventas(cursor, fecha, ventas)
+    conn.commit()
+
+
+def test_registrar_agrupa_por_producto_y_acumula(conn):
+    _vender(conn, DIA, [(1, 2, 20.0), (2, 1, 5.0), (1, 1, 10.0)])
+    _vender(conn, DIA, [(1, 3, 30.0)])
+    assert _resumen(conn) == [
+        (DIA, 1, 60.0, 3, 6),
+        (DIA, 2, 5.0, 1, 1),
+    ]
+
+
+def test_ajuste_cambia_unidades_y_total_pero_no_num_ventas(conn):
+    _vender(conn, DIA, [(1, 2, 20.0)])
+    # Pedido editado: una unidad menos del 1 y una nueva línea del 3
+    ajustar_ventas(conn.cursor(), datetime.datetime(2024, 3, 5, 18, 30), [(1, -1, -10.0), (3, 2, 8.0)])
+    conn.commit()
+    assert _resumen(conn) == [
+        (DIA, 1, 10.0, 1, 1),
+        (DIA, 3, 8.0, 0, 2),
+    ]
+
+
+def test_reconstruir_conserva_los_ajustes(conn):
+    _vender(conn, DIA, [(1, 2, 20.0), (2, 1, 5.0)])
+    _vender(conn, DIA + datetime.timedelta(days=1), [(2, 4, 20.0)])
+    ajustar_ventas(conn.cursor(), DIA.isoformat(), [(1, -1, -10.0), (3, 2, 8.0)])
+    conn.commit()
+    incremental = _resumen(conn)
+    reconstruir(conn)
+    assert _resumen(conn) == incremental
+
+
+def test_sin_ventas_ni_ajustes_no_escribe(conn):
+    registrar_ventas(conn.cursor(), DIA, [])
+    ajustar_ventas(conn.cursor(), DIA, [])
+    assert _resumen(conn) == []
@@ -0,0 +1,82 @@
+"""Cabecera Server-Timing con el reparto del tiempo de cada petición.
+
+ServerTimingMiddleware abre un acumulador por petición en una ContextVar; el
+pool suma en él la espera por conexión (connect), el cursor el tiempo de las
+sentencias (query) y serializacion el de convertir las filas y codificar el
+JSON (serialize). Los hilos de anyio y de DBExecutor heredan el contexto, así
+que el trabajo hecho fuera del bucle de eventos también cuenta.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+METRICAS = ("connect", "query", "serialize")
+
+_actual = ContextVar("server_timing", default=None)
+
+
+class _Tiempos:
+    __slots__ = ("valores", "lock")
+
+    def __init__(self):
+        self.valores = dict.fromkeys(METRICAS, 0.0)
+        self.lock = threading.Lock()
+
+
+def add(metrica, seconds):
+    tiempos = _actual.get()
+    if tiempos is not None:
+        with tiempos.lock:
+            tiempos.valores[metrica] += seconds
+
+
+class medir:
+    """Suma a `metrica` el tiempo del bloque `with`."""
+
+    __slots__ = ("metrica", "start")
+
+    def __init__(self, metrica):
+        self.metrica = metrica
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        add(self.metrica, time.perf_counter() - self.start)
+        return False
+
+
+def header_value(tiempos, total):
+    partes = [f"{m};dur={tiempos.valores[m] * 1000:.2f}" for m in METRICAS]
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes)
+
+
+class ServerTimingMiddleware:
+    # En las respuestas en streaming la cabecera sale con lo medido hasta el primer bloque
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tiempos = _Tiempos()
+        token = _actual.set(tiempos)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", header_value(tiempos, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _actual.reset(token)
@@ -0,0 +1,214 @@
+"""Productos más vendidos por ventana de tiempo, con contadores en memoria.
+
+Por cada producto se cuentan unidades, ingresos y número de ventas en las
+ventanas de 7 días, 30 días y todo el histórico, sin agregar Linea_pedidos en
+cada petición. Las ventas de los últimos 30 días se guardan en un buffer
+circular con un bucket por día, y cada ventana lleva sus totales acumulados.
+Al cambiar de día, los buckets que salen de una ventana se restan de sus
+totales, así que consultar una ventana no recorre sus días.
+
+top(ventana, k) elige los k productos con más unidades con un heap
+(heapq.nlargest, O(n log k) sobre los productos con ventas en la ventana).
+
+La API registra las mismas filas que escribe en Ventas al crear pedidos y,
+al editarlos, la diferencia de unidades en la fecha original del pedido sin
+contar una venta más; siempre después del commit. Al arrancar, los
+contadores se reconstruyen a partir de Ventas_diarias: los últimos 30 días
+por día y lo anterior ya sumado por producto.
+
+Las ventas de otros procesos solo llegan con esa carga, que se repite
+periódicamente (recarga.PeriodicReload): tardan como mucho un intervalo en
+contarse. Para que una recarga no cuente dos veces una venta propia, cada
+transacción que escribe ventas va dentro de escritura(): la carga espera a
+las que estén en curso y no deja empezar otras hasta terminar.
+"""
+import datetime
+import heapq
+import threading
+from contextlib import contextmanager
+
+VENTANAS = {"7d": 7, "30d": 30, "total": None}
+TOP_K = 5
+ESPERA_ESCRITURAS = 5  # segundos que una carga espera a las escrituras en curso
+
+# Días dentro del buffer circular, por día; lo anterior solo cuenta para el total
+QUERY_CARGA = """
+    SELECT fecha, producto_id, unidades, total, num_ventas
+    FROM Ventas_diarias
+    WHERE fecha >= ?
+    UNION ALL
+    SELECT NULL AS fecha, producto_id, SUM(unidades), SUM(total), SUM(num_ventas)
+    FROM Ventas_diarias
+    WHERE fecha < ?
+    GROUP BY producto_id
+"""
+
+
+def _dia(fecha):
+    if isinstance(fecha, str):
+        fecha = datetime.date.fromisoformat(fecha[:10])
+    return fecha.toordinal()
+
+
+def _sumar(totales, id_producto, unidades, ingresos, ventas):
+    acumulado = totales.get(id_producto)
+    if acumulado is None:
+        acumulado = totales[id_producto] = [0, 0.0, 0]
+    acumulado[0] += unidades
+    acumulado[1] += ingresos
+    acumulado[2] += ventas
+    if not acumulado[0] and not acumulado[2] and abs(acumulado[1]) < 0.005:
+        # Se ha restado todo (p. ej. el bucket ha salido de la ventana)
+        del totales[id_producto]
+
+
+class TopSellers:
+    def __init__(self, ventanas=VENTANAS, hoy=datetime.date.today):
+        self.ventanas = dict(ventanas)
+        self.dias = max(dias for dias in self.ventanas.values() if dias)
+        self._hoy = hoy
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._carga = threading.Lock()  # una sola carga a la vez
+        self._listo = False
+        self._escrituras = 0  # transacciones de ventas en curso (escritura())
+        self._cargando = False  # una carga está leyendo: no empiezan escrituras
+        self._vaciar(hoy().toordinal())
+
+    @property
+    def listo(self):
+        return self._listo
+
+    def _vaciar(self, dia):
+        self._dia = dia
+        self._buckets = [{} for _ in range(self.dias)]  # el día d va en el bucket d % dias
+        self._totales = {nombre: {} for nombre in self.ventanas}
+
+    def _avanzar(self):
+        # Lleva el buffer hasta hoy restando de cada ventana los días que salen de ella
+        hoy = self._hoy().toordinal()
+        if hoy - self._dia >= self.dias:
+            total = self._totales.get("total")
+            self._vaciar(hoy)
+            for nombre, dias in self.ventanas.items():
+                if dias is None:
+                    self._totales[nombre] = total
+            return
+        while self._dia < hoy:
+            self._dia += 1
+            for nombre, dias in self.ventanas.items():
+                if dias is None:
+                    continue
+                totales = self._totales[nombre]
+                for id_producto, (unidades, ingresos, ventas) in self._buckets[(self._dia - dias) % self.dias].items():
+                    _sumar(totales, id_producto, -unidades, -ingresos, -ventas)
+            self._buckets[self._dia % self.dias] = {}
+
+    def _aplicar(self, dia, filas):
+        # `filas` son (id_producto, unidades, ingresos, ventas); dia None = fuera del buffer
+        edad = self._dia - dia if dia is not None else None
+        for nombre, dias in self.ventanas.items():
+            if dias is None or (edad is not None and 0 <= edad < dias):
+                totales = self._totales[nombre]
+                for fila in filas:
+                    _sumar(totales, *fila)
+        if edad is not None and 0 <= edad < self.dias:
+            bucket = self._buckets[dia % self.dias]
+            for fila in filas:
+                _sumar(bucket, *fila)
+
+    def registrar(self, fecha, ventas):
+        """Suma las filas escritas en Ventas: tuplas (producto_id, cantidad, total)."""
+        self._registrar(fecha, [(producto_id, cantidad, float(total), 1) for producto_id, cantidad, total in ventas])
+
+    def ajustar(self, fecha, ajustes):
+        """Diferencias (producto_id, cantidad, total) de un pedido editado, en su fecha.
+
+        Las cantidades negativas restan; el número de ventas no cambia.
+        """
+        self._registrar(fecha, [(producto_id, cantidad, float(total), 0) for producto_id, cantidad, total in ajustes])
+
+    def _registrar(self, fecha, filas):
+        if not filas:
+            return
+        with self._lock:
+            self._avanzar()
+            self._aplicar(_dia(fecha), filas)
+
+    @contextmanager
+    def escritura(self):
+        """Envuelve la transacción que escribe unas ventas y su registrar()/ajustar().
+
+        Cada venta queda o en lo que lee una carga o en lo que se registra
+        después, nunca en los dos. Se entra con la conexión ya cogida, para
+        que la carga no se quede esperando una conexión libre.
+        """
+        with self._cond:
+            while self._cargando:
+                self._cond.wait()
+            self._escrituras += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._escrituras -= 1
+                self._cond.notify_all()
+
+    def cargar(self, get_connection):
+        """Rehace los contadores a partir de Ventas_diarias.
+
+        Devuelve False, sin tocar los contadores, si las escrituras en curso
+        no terminan en ESPERA_ESCRITURAS segundos.
+        """
+        with self._carga, get_connection() as conn:
+            cursor = conn.cursor()
+            with self._cond:
+                self._cargando = True
+                libre = self._cond.wait_for(lambda: not self._escrituras, ESPERA_ESCRITURAS)
+            try:
+                if not libre:
+                    return False
+                hoy = self._hoy()
+                desde = hoy - datetime.timedelta(days=self.dias - 1)
+                cursor.execute(QUERY_CARGA, (desde, desde))
+                rows = cursor.fetchall()
+                with self._lock:
+                    self._vaciar(hoy.toordinal())
+                    for row in rows:
+                        self._aplicar(
+                            _dia(row.fecha) if row.fecha is not None else None,
+                            [(row.producto_id, row.unidades or 0, float(row.total or 0), row.num_ventas or 0)],
+                        )
+                    self._listo = True
+                return True
+            finally:
+                with self._cond:
+                    self._cargando = False
+                    self._cond.notify_all()
+
+    def top(self, ventana="total", k=TOP_K):
+        """Los k productos con más unidades en la ventana, de más a menos."""
+        with self._lock:
+            self._avanzar()
+            mejores = heapq.nlargest(
+                k,
+                ((valores, id_producto) for id_producto, valores in self._totales[ventana].items() if valores[0] > 0),
+                key=lambda item: (item[0][0], item[0][1], -item[1]),
+            )
+            return [
+                {
+                    "id_producto": id_producto,
+                    "unidades_vendidas": unidades,
+                    "ingresos_totales": round(ingresos, 2),
+                    "num_ventas": ventas,
+                }
+                for (unidades, ingresos, ventas), id_producto in mejores
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "listo": self._listo,
+                "dia": datetime.date.fromordinal(self._dia).isoformat(),
+                "productos": {nombre: len(totales) for nombre, totales in self._totales.items()},
+            }
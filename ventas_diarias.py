@@ -0,0 +1,129 @@
+"""Resumen diario de ventas por producto (tabla Ventas_diarias).
+
+Los endpoints de /ventas leen de este resumen en lugar de agregar la tabla
+Ventas en cada petición. crear_pedido lo actualiza en la misma transacción en
+la que escribe en Ventas; update_pedido aplica la diferencia de las líneas
+directamente al resumen, en la fecha del pedido, sin escribir en Ventas, y la
+acumula en Ventas_ajustes.
+
+Las tablas las crean las migraciones 0001_ventas_diarias y 0003_ventas_ajustes
+(migraciones.py). Reconstrucción completa a partir de Ventas más los ajustes:
+    python ventas_diarias.py reconstruir [--app api|main]
+"""
+import argparse
+import datetime
+import importlib
+from collections import defaultdict
+
+UPSERT = """
+    MERGE Ventas_diarias WITH (HOLDLOCK) AS d
+    USING (SELECT ? AS fecha, ? AS producto_id, ? AS total, ? AS num_ventas, ? AS unidades) AS v
+    ON d.fecha = v.fecha AND d.producto_id = v.producto_id
+    WHEN MATCHED THEN
+        UPDATE SET total = d.total + v.total,
+                   num_ventas = d.num_ventas + v.num_ventas,
+                   unidades = d.unidades + v.unidades
+    WHEN NOT MATCHED THEN
+        INSERT (fecha, producto_id, total, num_ventas, unidades)
+        VALUES (v.fecha, v.producto_id, v.total, v.num_ventas, v.unidades);
+"""
+
+UPSERT_AJUSTE = """
+    MERGE Ventas_ajustes WITH (HOLDLOCK) AS d
+    USING (SELECT ? AS fecha, ? AS producto_id, ? AS total, ? AS unidades) AS v
+    ON d.fecha = v.fecha AND d.producto_id = v.producto_id
+    WHEN MATCHED THEN
+        UPDATE SET total = d.total + v.total,
+                   unidades = d.unidades + v.unidades
+    WHEN NOT MATCHED THEN
+        INSERT (fecha, producto_id, total, unidades)
+        VALUES (v.fecha, v.producto_id, v.total, v.unidades);
+"""
+
+# Los ajustes no cuentan como ventas: solo suman unidades y total
+REBUILD = """
+    INSERT INTO Ventas_diarias (fecha, producto_id, total, num_ventas, unidades)
+    SELECT fecha, producto_id, SUM(total), SUM(num_ventas), SUM(unidades)
+    FROM (
+        SELECT CAST(fecha_venta AS DATE) AS fecha, producto_id, SUM(total) AS total,
+               COUNT(*) AS num_ventas, SUM(cantidad) AS unidades
+        FROM Ventas
+        GROUP BY CAST(fecha_venta AS DATE), producto_id
+        UNION ALL
+        SELECT fecha, producto_id, total, 0, unidades
+        FROM Ventas_ajustes
+    ) v
+    GROUP BY fecha, producto_id
+"""
+
+
+def registrar_ventas(cursor, fecha, ventas):
+    """Suma al resumen las filas insertadas en Ventas.
+
+    `ventas` son tuplas (producto_id, cantidad, total), una por fila de Ventas.
+    No hace commit: debe llamarse dentro de la transacción que escribe en Ventas.
+    """
+    resumen = defaultdict(lambda: [0.0, 0, 0])
+    for producto_id, cantidad, total in ventas:
+        fila = resumen[producto_id]
+        fila[0] += total
+        fila[1] += 1
+        fila[2] += cantidad
+    if not resumen:
+        return
+    cursor.fast_executemany = True
+    cursor.executemany(UPSERT, [
+        (fecha, producto_id, total, num_ventas, unidades)
+        for producto_id, (total, num_ventas, unidades) in sorted(resumen.items())
+    ])
+
+
+def ajustar_ventas(cursor, fecha, ajustes):
+    """Aplica al resumen del día `fecha` (la del pedido) los cambios de un pedido editado.
+
+    `ajustes` son tuplas (producto_id, cantidad, total) con la diferencia entre
+    las líneas nuevas y las antiguas. num_ventas no cambia: el pedido es el
+    mismo. Los mismos ajustes se suman a Ventas_ajustes para que reconstruir()
+    los conserve. No hace commit.
+    """
+    if not ajustes:
+        return
+    if isinstance(fecha, str):
+        fecha = datetime.datetime.fromisoformat(fecha)
+    if isinstance(fecha, datetime.datetime):
+        fecha = fecha.date()
+    ajustes = sorted(ajustes)
+    cursor.fast_executemany = True
+    cursor.executemany(UPSERT, [
+        (fecha, producto_id, total, 0, cantidad)
+        for producto_id, cantidad, total in ajustes
+    ])
+    cursor.executemany(UPSERT_AJUSTE, [
+        (fecha, producto_id, total, cantidad)
+        for producto_id, cantidad, total in ajustes
+    ])
+
+
+def reconstruir(conn):
+    # Rehace el resumen completo en una sola transacción
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Ventas_diarias")
+    cursor.execute(REBUILD)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento del resumen diario de ventas")
+    parser.add_argument("accion", choices=["reconstruir"])
+    parser.add_argument("--app", default="api", choices=["api", "main"],
+                        help="módulo cuya configuración de conexión se usa")
+    args = parser.parse_args()
+
+    app_module = importlib.import_module(args.app)
+    with app_module.get_connection() as conn:
+        reconstruir(conn)
+    print("Ventas_diarias reconstruida")
+
+
+if __name__ == "__main__":
+    main()